@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+'''Script for decoding every record of one or more fasta files in parallel.
+Arguments:
+    -f: fasta files and/or directories of fasta files (multi-record is fine);
+        packed .2bit files from twobit.py are read as well
+    -mu: the probability of switching states
+    -out: directory to write one interval file per record to
+    -p: (optional) number of worker processes, defaults to every core
+    -mem: (optional) memory budget in MB for one record; decodes every record
+        with checkpoints (fastviterbi.viterbi_checkpointed) instead of the
+        full backpointer table
+
+Outputs:
+    One file <record>.txt per record in the output directory, with one GC-rich
+    interval a_i,b_i per line as in the single-file scripts.
+
+All records are encoded once and packed into a single shared-memory block, so
+workers read their sequence in place instead of receiving pickled strings.
+Records are handed out longest first, which keeps the pool busy until the end
+when a genome mixes a few large chromosomes with many small scaffolds.
+
+Example Usage:
+    python batch.py -f genome.fa Data -mu 0.01 -out intervals
+'''
+
+import argparse
+import os
+import re
+from multiprocessing import Pool, shared_memory
+
+import numpy as np
+
+from fasta import FASTA_EXTENSIONS, iter_encoded
+from fastviterbi import viterbi_encoded, viterbi_checkpointed
+from hmm import gc_content_model
+from inputs import collect_inputs
+from intervals import path_intervals, write_intervals
+
+
+def _output_name(name, index):
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", name) or "record%d" % index
+    return name + ".txt"
+
+
+# state shared by the worker processes, set once by _init_worker
+_worker = {}
+
+
+def _init_worker(shm_name, model, memory_budget):
+    _worker["shm"] = shared_memory.SharedMemory(name=shm_name)
+    _worker["model"] = model
+    _worker["memory_budget"] = memory_budget
+
+
+def _decode_record(task):
+    index, name, offset, length, out_path = task
+    model = _worker["model"]
+    codes = np.ndarray((length,), dtype=np.uint8, buffer=_worker["shm"].buf, offset=offset)
+
+    if _worker["memory_budget"] is None:
+        path, p = viterbi_encoded(codes, model)
+    else:
+        path, p = viterbi_checkpointed(codes, model, memory_budget=_worker["memory_budget"])
+    del codes  # release the view before the pool closes the block
+
+    starts, ends = path_intervals(path, model.states.index('h'))
+    write_intervals(out_path, starts, ends)
+    return index, (name, length, p, out_path)
+
+
+''' Decodes every record of the given fasta files on a process pool.
+Arguments:
+	paths: fasta (or .2bit) files and/or directories
+	model: compiled HMMModel (its GC-rich state must be named 'h')
+	out_dir: directory for the per-record interval files
+	workers: number of processes (default: every core)
+	fold_case: upper-case soft-masked bases before encoding
+	memory_budget: if given, per-record byte budget for checkpointed decoding
+Returns:
+	results: list of (name, length, log-probability, output file) tuples in
+        the order the records were read
+'''
+
+
+def decode_batch(paths, model, out_dir, workers=None, fold_case=True, memory_budget=None):
+    os.makedirs(out_dir, exist_ok=True)
+
+    records = []
+    seen = set()
+    for filename in collect_inputs(paths, FASTA_EXTENSIONS):
+        for name, codes in iter_encoded(filename, model, upper=fold_case):
+            if not len(codes):
+                continue
+            out_path = os.path.join(out_dir, _output_name(name, len(records)))
+            if out_path in seen:
+                raise ValueError("record %r appears more than once" % name)
+            seen.add(out_path)
+            records.append((name, codes, out_path))
+    if not records:
+        return []
+
+    total = sum(len(codes) for _, codes, _ in records)
+    shm = shared_memory.SharedMemory(create=True, size=max(total, 1))
+    try:
+        packed = np.ndarray((total,), dtype=np.uint8, buffer=shm.buf)
+        tasks = []
+        offset = 0
+        for name, codes, out_path in records:
+            packed[offset:offset + len(codes)] = codes
+            tasks.append((len(tasks), name, offset, len(codes), out_path))
+            offset += len(codes)
+        del packed, records
+
+        # longest records first so the stragglers at the end are short ones
+        tasks.sort(key=lambda task: -task[3])
+        results = [None] * len(tasks)
+        with Pool(processes=workers or os.cpu_count(), initializer=_init_worker,
+                  initargs=(shm.name, model, memory_budget)) as pool:
+            for index, result in pool.imap_unordered(_decode_record, tasks):
+                results[index] = result
+        return results
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Parse every record of fasta files into GC-rich and GC-poor regions in parallel.')
+    parser.add_argument('-f', action="store", dest="f", nargs='+',
+                        type=str, required=True)
+    parser.add_argument('-mu', action="store", dest="mu",
+                        type=float, required=True)
+    parser.add_argument('-out', action="store", dest="out",
+                        type=str, required=True)
+    parser.add_argument('-p', action="store", dest="p",
+                        type=int, required=False)
+    parser.add_argument('-mem', action="store", dest="mem",
+                        type=float, required=False)
+
+    args = parser.parse_args()
+    mu = args.mu
+    memory_budget = None if args.mem is None else int(args.mem * 1024 * 1024)
+
+    model = gc_content_model(mu)
+
+    for name, length, p, out_path in decode_batch(args.f, model, args.out, workers=args.p,
+                                                  memory_budget=memory_budget):
+        print("{}: {} bases, Viterbi probability in log scale: {:.2f} -> {}".format(
+            name, length, p, out_path))
+
+
+if __name__ == "__main__":
+    main()
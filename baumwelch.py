@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+
+'''Baum-Welch training of the model parameters on one or more sequences.
+Arguments:
+    -f: fasta files and/or directories of fasta files (multi-record is fine)
+    -mu: (optional) switching probability of the GC-content starting model
+    -model: (optional) model file to warm-start from instead of -mu
+    -out: model file to write (HMMModel.save format, loadable by decoders.py)
+    -iter: (optional) maximum number of iterations, default 20
+    -tol: (optional) stop once the log-likelihood gains less than this many
+        nats per base in one iteration, default 1e-6
+    -p: (optional) number of worker processes, defaults to every core
+
+Outputs:
+    The trained model, rewritten after every iteration so an interrupted run
+    can be resumed with -model.
+
+The E-step is a scaled forward-backward pass: the forward and backward
+vectors are renormalized to sum to one at every position, so nothing
+underflows however long the sequence, and the expected counts are then
+formed for the whole chunk at once with array operations.
+
+Records are cut into chunks that run on a process pool, reading the encoded
+bases from one shared-memory block as in batch.py. Cutting a record does not
+approximate anything: as in parallelviterbi.py, each chunk first reduces to
+a K x K matrix (here in the sum-product semiring), and a prefix and a suffix
+scan over those matrices give the exact forward vector entering and the
+exact backward vector leaving every chunk. A record that fits into one chunk
+skips the matrices.
+
+Example Usage:
+    python baumwelch.py -f genome.fa -mu 0.01 -out trained.npz
+    python decoders.py -f genome.fa -model trained.npz -out intervals.txt
+'''
+
+import argparse
+import math
+import os
+import time
+from multiprocessing import Pool, shared_memory
+
+import numpy as np
+
+from fasta import FASTA_EXTENSIONS, iter_records
+from hmm import HMMModel, gc_content_model
+from inputs import collect_inputs
+
+
+''' Runs the scaled forward recursion over positions start..stop-1.
+Arguments:
+	codes: uint8 array of encoded observations
+	start, stop: range of positions to fill
+	alpha: length K forward vector at position start-1
+	model: compiled HMMModel
+	out: float64 array with at least stop-start rows; row t-start receives
+        the forward vector of position t, normalized to sum to one
+Returns:
+	alpha: normalized forward vector at position stop-1
+	log_scale: log of the probability mass the recursion added, so that
+        log P(obs[start:stop] | alpha) = log_scale for a normalized alpha
+'''
+
+
+def forward_scaled(codes, start, stop, alpha, model, out):
+    if model.K == 2:
+        return _forward_two_states(codes, start, stop, alpha, model, out)
+
+    trans = np.exp(model.log_trans)
+    emiss_rows = np.exp(model.log_emiss_rows)
+    log_scale = 0.0
+    for t in range(start, stop):
+        alpha = (alpha @ trans) * emiss_rows[codes[t]]
+        s = alpha.sum()
+        if not s > 0:
+            raise ValueError("observation at position %d is impossible under the model" % t)
+        alpha /= s
+        out[t - start] = alpha
+        log_scale += math.log(s)
+    return alpha, log_scale
+
+
+''' Runs the scaled backward recursion down from position stop-1.
+Arguments:
+	codes: uint8 array of encoded observations
+	start, stop: the chunk's range of positions
+	beta: length K backward vector at position stop-1
+	model: compiled HMMModel
+	out: float64 array with stop-start+1 rows; row t-start+1 receives the
+        backward vector of position t (start-1 <= t < stop), normalized to
+        sum to one
+'''
+
+
+def backward_scaled(codes, start, stop, beta, model, out):
+    out[stop - start] = beta
+    if model.K == 2:
+        return _backward_two_states(codes, start, stop, beta, model, out)
+
+    trans = np.exp(model.log_trans)
+    emiss_rows = np.exp(model.log_emiss_rows)
+    for t in range(stop - 2, start - 2, -1):
+        beta = trans @ (emiss_rows[codes[t + 1]] * beta)
+        beta /= beta.sum()
+        out[t - start + 1] = beta
+
+
+def _forward_two_states(codes, start, stop, alpha, model, out):
+    (t00, t01), (t10, t11) = np.exp(model.log_trans).tolist()
+    emiss_rows = np.exp(model.log_emiss_rows).tolist()
+    a0, a1 = alpha.tolist()
+
+    flat = memoryview(out[:stop - start].reshape(-1))
+    k = 0
+    # the scales are multiplied up and only turned into a logarithm when
+    # the product gets close to underflowing
+    log_scale = 0.0
+    product = 1.0
+    try:
+        for c in codes[start:stop].tobytes():
+            e0, e1 = emiss_rows[c]
+            n0 = (a0 * t00 + a1 * t10) * e0
+            n1 = (a0 * t01 + a1 * t11) * e1
+            s = n0 + n1
+            a0 = n0 / s
+            a1 = n1 / s
+            flat[k] = a0
+            flat[k + 1] = a1
+            product *= s
+            if product < 1e-250:
+                log_scale += math.log(product)
+                product = 1.0
+            k += 2
+    except ZeroDivisionError:
+        raise ValueError("observation at position %d is impossible under the model"
+                         % (start + k // 2)) from None
+    log_scale += math.log(product)
+    return np.array([a0, a1]), log_scale
+
+
+def _backward_two_states(codes, start, stop, beta, model, out):
+    (t00, t01), (t10, t11) = np.exp(model.log_trans).tolist()
+    emiss_rows = np.exp(model.log_emiss_rows).tolist()
+    b0, b1 = beta.tolist()
+
+    flat = memoryview(out[:stop - start + 1].reshape(-1))
+    k = 2 * (stop - start)
+    # position t is computed from the observation at t + 1
+    for c in codes[start:stop].tobytes()[::-1]:
+        e0, e1 = emiss_rows[c]
+        w0 = e0 * b0
+        w1 = e1 * b1
+        n0 = t00 * w0 + t01 * w1
+        n1 = t10 * w0 + t11 * w1
+        s = n0 + n1
+        b0 = n0 / s
+        b1 = n1 / s
+        k -= 2
+        flat[k] = b0
+        flat[k + 1] = b1
+
+
+''' Expected counts of one chunk.
+Arguments:
+	codes: uint8 array of encoded observations of the whole record
+	start, stop: the chunk's range of positions (start >= 1)
+	alpha: exact forward vector entering the chunk (position start-1),
+        normalized
+	beta: exact backward vector leaving the chunk (position stop-1)
+	model: compiled HMMModel
+Returns:
+	counts: (log_scale, init, trans, emiss) with the log-likelihood
+        contribution of the chunk and the expected initial-state,
+        transition and emission counts (the initial state, and the emission
+        at position 0, are only counted by the chunk with start == 1)
+'''
+
+
+def expected_counts(codes, start, stop, alpha, beta, model):
+    K = model.K
+    length = stop - start
+    alphas = np.empty((length + 1, K))
+    alphas[0] = alpha
+    _, log_scale = forward_scaled(codes, start, stop, alpha, model, alphas[1:])
+    betas = np.empty((length + 1, K))
+    backward_scaled(codes, start, stop, beta, model, betas)
+
+    obs = codes[start:stop]
+    trans = np.exp(model.log_trans)
+    # xi[t, i, j] ~ alpha[t-1, i] trans[i, j] emiss[j, obs[t]] beta[t, j],
+    # normalized per position and summed over t without forming it
+    weighted = np.exp(model.log_emiss_rows)[obs] * betas[1:]
+    norms = np.einsum("ti,ti->t", alphas[:-1] @ trans, weighted)
+    trans_counts = trans * (alphas[:-1].T @ (weighted / norms[:, None]))
+
+    gamma = alphas[1:] * betas[1:]
+    gamma /= gamma.sum(axis=1, keepdims=True)
+    emiss_counts = np.stack([np.bincount(obs, weights=gamma[:, k], minlength=model.M)
+                             for k in range(K)])
+
+    init_counts = np.zeros(K)
+    if start == 1:
+        init_counts = alphas[0] * betas[0]
+        init_counts /= init_counts.sum()
+        emiss_counts[:, codes[0]] += init_counts
+    return log_scale, init_counts, trans_counts, emiss_counts
+
+
+# state shared by the worker processes, set once by _init_worker
+_worker = {}
+
+
+def _init_worker(shm_name, size):
+    _worker["shm"] = shared_memory.SharedMemory(name=shm_name)
+    _worker["codes"] = np.ndarray((size,), dtype=np.uint8, buffer=_worker["shm"].buf)
+
+
+def _record(offset, length):
+    return _worker["codes"][offset:offset + length]
+
+
+''' Reduces positions a..b-1 of a record to its sum-product matrix, row i
+being the forward vector after starting in state i at a-1. Rows are
+normalized; scales[i] holds the log of the mass row i was divided by. A
+state from which the chunk is impossible (with structural zeros, e.g. an
+absorbing state) gets a zero row and a scale of -inf; whether the record
+itself is impossible is only known once the rows are combined. '''
+
+
+def _chunk_matrix(task):
+    offset, length, a, b, model = task
+    codes = _record(offset, length)
+    K = model.K
+    scratch = np.empty((b - a, K))
+    rows = np.zeros((K, K))
+    scales = np.full(K, -np.inf)
+    for i in range(K):
+        start = np.zeros(K)
+        start[i] = 1.0
+        try:
+            rows[i], scales[i] = forward_scaled(codes, a, b, start, model, scratch)
+        except ValueError:
+            pass
+    return rows, scales
+
+
+def _chunk_counts(task):
+    offset, length, a, b, alpha, beta, model = task
+    return expected_counts(_record(offset, length), a, b, alpha, beta, model)
+
+
+''' Splits positions 1..length-1 of a record into spans of about chunk_size. '''
+
+
+def _spans(length, chunk_size):
+    n_chunks = max(1, math.ceil((length - 1) / chunk_size))
+    bounds = np.linspace(1, length, n_chunks + 1).astype(np.int64)
+    return [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+
+''' Runs one E-step over every record.
+Returns:
+	log_likelihood: total log-likelihood of the records under model
+	counts: summed (init, trans, emiss) expected counts
+'''
+
+
+def _expectation(pool_map, records, model, chunk_size):
+    K = model.K
+    init_probs = np.exp(model.log_init)
+    emiss_probs = np.exp(model.log_emiss_rows)
+
+    # forward vector of position 0 of every record
+    starts = []
+    log_likelihood = 0.0
+    for offset, codes in records:
+        alpha = init_probs * emiss_probs[codes[0]]
+        log_likelihood += math.log(alpha.sum())
+        starts.append(alpha / alpha.sum())
+
+    plans = [_spans(len(codes), chunk_size) for _, codes in records]
+    matrix_tasks = [(offset, len(codes), a, b, model)
+                    for (offset, codes), spans in zip(records, plans)
+                    if len(spans) > 1 for a, b in spans]
+    matrices = iter(pool_map(_chunk_matrix, matrix_tasks))
+
+    init_counts = np.zeros(K)
+    trans_counts = np.zeros((K, K))
+    emiss_counts = np.zeros((K, model.M))
+    count_tasks = []
+    for (offset, codes), spans, alpha in zip(records, plans, starts):
+        if not spans:
+            # a single base: only the initial state and its emission count
+            init_counts += alpha
+            emiss_counts[:, codes[0]] += alpha
+            continue
+        if len(spans) == 1:
+            alphas = [alpha]
+            betas = [np.full(K, 1.0 / K)]
+        else:
+            reduced = [next(matrices) for _ in spans]
+            # prefix scan: alpha <- alpha @ (diag(exp(scales)) rows)
+            alphas = [alpha]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                for (a, b), (rows, scales) in zip(spans, reduced[:-1]):
+                    weights = np.log(alphas[-1]) + scales
+                    alpha = np.exp(weights - weights.max()) @ rows
+                    if not alpha.sum() > 0:
+                        raise ValueError("observations at positions %d..%d are impossible "
+                                         "under the model" % (a, b - 1))
+                    alphas.append(alpha / alpha.sum())
+            # suffix scan: beta <- diag(exp(scales)) rows @ beta
+            betas = [np.full(K, 1.0 / K)]
+            with np.errstate(invalid="ignore"):
+                for (a, b), (rows, scales) in zip(spans[:0:-1], reduced[:0:-1]):
+                    beta = np.exp(scales - scales.max()) * (rows @ betas[-1])
+                    if not beta.sum() > 0:
+                        raise ValueError("observations at positions %d..%d are impossible "
+                                         "under the model" % (a, b - 1))
+                    betas.append(beta / beta.sum())
+            betas.reverse()
+        count_tasks.extend((offset, len(codes), a, b, alpha, beta, model)
+                           for (a, b), alpha, beta in zip(spans, alphas, betas))
+
+    for log_scale, init, trans, emiss in pool_map(_chunk_counts, count_tasks):
+        log_likelihood += log_scale
+        init_counts += init
+        trans_counts += trans
+        emiss_counts += emiss
+    return log_likelihood, (init_counts, trans_counts, emiss_counts)
+
+
+''' Re-estimates the model from expected counts; a state whose row received
+no counts keeps its previous parameters. '''
+
+
+def _maximize(model, counts, pseudocount):
+    def normalize(counts, log_previous):
+        counts = counts + pseudocount
+        totals = counts.sum(axis=-1, keepdims=True)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(totals > 0, counts / totals, np.exp(log_previous))
+
+    init_counts, trans_counts, emiss_counts = counts
+    return HMMModel.from_probabilities(model.states, model.alphabet,
+                                       normalize(trans_counts, model.log_trans),
+                                       normalize(emiss_counts, model.log_emiss),
+                                       normalize(init_counts, model.log_init))
+
+
+''' Fits transition, emission and initial probabilities with Baum-Welch.
+Arguments:
+	sequences: list of observed sequences (anything HMMModel.encode
+        accepts, or uint8 arrays already encoded)
+	model: compiled HMMModel to start from
+	iterations: maximum number of EM iterations
+	tolerance: stop once an iteration gains less than this many nats of
+        log-likelihood per base
+	workers: number of processes (default: every core; 1 runs in-process)
+	chunk_size: largest number of bases per E-step task (records are also
+        split so that every worker gets a share)
+	pseudocount: added to every expected count before normalizing
+	callback: optional function called as callback(iteration, model,
+        log_likelihood) after every iteration, with the re-estimated model
+Returns:
+	model: trained HMMModel
+	history: log-likelihood of the sequences before each re-estimation
+'''
+
+
+def baum_welch(sequences, model, iterations=20, tolerance=1e-6, workers=None,
+               chunk_size=1 << 22, pseudocount=0.0, callback=None):
+    encoded = [obs if isinstance(obs, np.ndarray) and obs.dtype == np.uint8
+               else model.encode(obs) for obs in sequences]
+    encoded = [codes for codes in encoded if len(codes)]
+    if not encoded:
+        raise ValueError("no observations to train on")
+    total = sum(len(codes) for codes in encoded)
+    workers = workers or os.cpu_count()
+    chunk_size = max(1, min(chunk_size, math.ceil(total / workers)))
+
+    shm = shared_memory.SharedMemory(create=True, size=total)
+    pool = None
+    try:
+        packed = np.ndarray((total,), dtype=np.uint8, buffer=shm.buf)
+        records = []
+        offset = 0
+        for codes in encoded:
+            packed[offset:offset + len(codes)] = codes
+            records.append((offset, packed[offset:offset + len(codes)]))
+            offset += len(codes)
+
+        if workers > 1:
+            pool = Pool(processes=workers, initializer=_init_worker,
+                        initargs=(shm.name, total))
+            pool_map = pool.map
+        else:
+            _init_worker(shm.name, total)
+            pool_map = lambda function, tasks: list(map(function, tasks))
+
+        history = []
+        for iteration in range(iterations):
+            log_likelihood, counts = _expectation(pool_map, records, model, chunk_size)
+            model = _maximize(model, counts, pseudocount)
+            history.append(log_likelihood)
+            if callback is not None:
+                callback(iteration, model, log_likelihood)
+            if len(history) > 1 and history[-1] - history[-2] < tolerance * total:
+                break
+        return model, history
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        records = packed = None
+        if pool is None and "shm" in _worker:
+            handle = _worker["shm"]
+            _worker.clear()  # drop the codes view before closing its block
+            handle.close()
+        shm.close()
+        shm.unlink()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Train the hidden Markov model on fasta files with Baum-Welch.')
+    parser.add_argument('-f', action="store", dest="f", nargs='+',
+                        type=str, required=True)
+    parser.add_argument('-mu', action="store", dest="mu",
+                        type=float, required=False)
+    parser.add_argument('-model', action="store", dest="model",
+                        type=str, required=False)
+    parser.add_argument('-out', action="store", dest="out",
+                        type=str, required=True)
+    parser.add_argument('-iter', action="store", dest="iter",
+                        type=int, default=20)
+    parser.add_argument('-tol', action="store", dest="tol",
+                        type=float, default=1e-6)
+    parser.add_argument('-p', action="store", dest="p",
+                        type=int, required=False)
+
+    args = parser.parse_args()
+    if args.model is None and args.mu is None:
+        parser.error("one of -mu or -model is required")
+    model = HMMModel.load(args.model) if args.model else gc_content_model(args.mu)
+
+    sequences = [model.encode(sequence)
+                 for filename in collect_inputs(args.f, FASTA_EXTENSIONS)
+                 for _, sequence in iter_records(filename, upper=True) if sequence]
+    start = time.perf_counter()
+
+    def report(iteration, trained, log_likelihood):
+        trained.save(args.out)
+        print("iteration {}: log-likelihood {:.2f} ({:.1f} s)".format(
+            iteration + 1, log_likelihood, time.perf_counter() - start))
+
+    model, _ = baum_welch(sequences, model, iterations=args.iter, tolerance=args.tol,
+                          workers=args.p, callback=report)
+    with np.printoptions(precision=6, suppress=True):
+        print("transition probabilities:\n{}".format(np.exp(model.log_trans)))
+        print("emission probabilities ({}):\n{}".format(
+            "".join(model.alphabet), np.exp(model.log_emiss)))
+        print("initial probabilities:\n{}".format(np.exp(model.log_init)))
+
+
+if __name__ == "__main__":
+    main()
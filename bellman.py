@@ -17,21 +17,188 @@ Example Usage:
 import argparse
 import numpy as np
 
+from fasta import read_fasta
+from hmm import HMMModel, gc_content_model
+from intervals import path_intervals, write_intervals
 
-'''Reads the fasta file and outputs the sequence to analyze.
+
+class NegativeCycleError(ValueError):
+    ''' Raised when a negative-weight cycle is reachable from a source; the
+    nodes of one such cycle are in the cycle attribute (None if the
+    predecessors did not lead back to one). '''
+
+    def __init__(self, cycle):
+        if cycle is None:
+            super().__init__("negative-weight cycle reachable from a source")
+        else:
+            super().__init__("negative-weight cycle through nodes %s" % (cycle,))
+        self.cycle = cycle
+
+
+''' Groups the nodes of a graph into waves: the first wave is the nodes
+without incoming edges, and every later wave the nodes whose incoming edges
+all come from earlier waves.
+Arguments:
+	n_nodes: number of nodes
+	src, dst: int64 arrays of edge endpoints
+Returns:
+	waves: list of (nodes, edges) pairs of int64 arrays, edges being the
+        indices of the edges out of those nodes, or None if the graph has a
+        cycle
+'''
+
+
+def topological_waves(n_nodes, src, dst):
+    by_src = np.argsort(src, kind="stable")
+    indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n_nodes), out=indptr[1:])
+    indegree = np.bincount(dst, minlength=n_nodes)
+
+    waves = []
+    reached = 0
+    nodes = np.flatnonzero(indegree == 0)
+    while len(nodes):
+        reached += len(nodes)
+        # the runs indptr[u]..indptr[u + 1] of by_src, one after another
+        counts = indptr[nodes + 1] - indptr[nodes]
+        offsets = np.repeat(indptr[nodes] - np.cumsum(counts) + counts, counts)
+        edges = by_src[offsets + np.arange(len(offsets))]
+        waves.append((nodes, edges))
+        targets = dst[edges]
+        np.subtract.at(indegree, targets, 1)
+        targets = np.unique(targets)
+        nodes = targets[indegree[targets] == 0]
+    if reached < n_nodes:
+        return None
+    return waves
+
+
+''' Single-source shortest paths over edge arrays (negative weights allowed).
+If the graph is a DAG, the edges out of every topological wave are relaxed
+together, once, in wave order. Otherwise whole passes over the edge arrays
+are vectorized, stopping as soon as a pass changes nothing; a change in pass
+n_nodes means a reachable negative cycle.
 Arguments:
-	filename: name of the fasta file
+	n_nodes: number of nodes
+	src, dst: int64 arrays of edge endpoints
+	weight: float array of edge weights
+	dist: float array with the starting cost of every source node and inf
+        elsewhere
+	stats: optional dict, filled with the mode used and the number of passes
 Returns:
-	s: string with relevant sequence
+	dist: shortest distance to every node (inf if unreachable)
+	pred: predecessor of every node on its shortest path (-1 for none)
 '''
 
 
-def read_fasta(filename):
-    with open(filename, "r") as f:
-        s = ""
-        for l in f.readlines()[1:]:
-            s += l.strip()
-    return s
+def bellman_ford_arrays(n_nodes, src, dst, weight, dist, stats=None):
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    weight = np.asarray(weight, dtype=np.float64)
+    dist = np.array(dist, dtype=np.float64)
+    pred = np.full(n_nodes, -1, dtype=np.int64)
+
+    waves = topological_waves(n_nodes, src, dst)
+    if waves is not None:
+        # DAG: the edges out of a wave are final once the earlier waves are
+        for _, edges in waves:
+            _relax(src[edges], dst[edges], weight[edges], dist, pred)
+        if stats is not None:
+            stats['mode'] = 'dag'
+            stats['passes'] = 1
+        return dist, pred
+
+    # General graph: relax every edge at once, at most n_nodes - 1 times
+    passes = 0
+    while True:
+        improved = _relax(src, dst, weight, dist, pred)
+        if not len(improved):
+            break
+        passes += 1
+        if passes == n_nodes:
+            raise NegativeCycleError(_find_cycle(pred, improved, n_nodes))
+
+    if stats is not None:
+        stats['mode'] = 'general'
+        stats['passes'] = passes
+    return dist, pred
+
+
+def _relax(src, dst, weight, dist, pred):
+    # relaxes the edges at once, keeping the best improving edge into every
+    # node (the first of equals); returns the nodes that improved
+    candidate = dist[src] + weight
+    improved = np.flatnonzero(candidate < dist[dst])
+    improved = improved[np.lexsort((candidate[improved], dst[improved]))]
+    first = np.ones(len(improved), dtype=bool)
+    first[1:] = dst[improved[1:]] != dst[improved[:-1]]
+    improved = improved[first]
+    dist[dst[improved]] = candidate[improved]
+    pred[dst[improved]] = src[improved]
+    return dst[improved]
+
+
+def _find_cycle(pred, improved, n_nodes):
+    # n_nodes predecessor steps from a node that still improves end on a
+    # cycle, unless the chain runs out (pred -1) first; then try the next
+    for node in improved.tolist():
+        for _ in range(n_nodes):
+            node = int(pred[node])
+            if node == -1:
+                break
+        else:
+            cycle = [node]
+            current = int(pred[node])
+            while current != node:
+                cycle.append(current)
+                current = int(pred[current])
+            cycle.reverse()
+            return cycle
+    return None
+
+
+''' Single-source shortest paths over a layered DAG of K nodes per layer,
+every node of a layer having an edge from every node of the layer before.
+The layers are relaxed one at a time, each a K x K sum and a min over the K
+predecessors, so the edges are never listed.
+Arguments:
+	dist: float array with the starting cost of the K nodes of layer 0 (inf
+        for a node that is no source)
+	weights: float array (C, K, K) of edge weight matrices, weights[c][i, j]
+        weighing the edge from node i of a layer to node j of the next
+	layers: int array of the matrix of every later layer: the edges into
+        layer t come from weights[layers[t - 1]]
+	stats: optional dict, filled with the mode used and the number of passes
+Returns:
+	dist: float array (len(layers) + 1, K) of shortest distances
+	pred: int64 array of the same shape with the node of the layer before on
+        the shortest path (the first of equals; 0 if no node of the layer
+        before is reachable, -1 in layer 0)
+'''
+
+
+def bellman_ford_layers(dist, weights, layers, stats=None):
+    K = len(dist)
+    distances = np.empty((len(layers) + 1, K))
+    pred = np.empty((len(layers) + 1, K), dtype=np.int64)
+    distances[0] = dist
+    pred[0] = -1
+
+    # incoming[c][j, i]: the edge from node i into node j, so that a row of
+    # scores holds the K candidates of one node
+    incoming = list(np.ascontiguousarray(np.swapaxes(weights, 1, 2)))
+    scores = np.empty((K, K))
+    previous = distances[0]
+    for t, c in enumerate(np.asarray(layers).tolist(), 1):
+        np.add(previous, incoming[c], out=scores)
+        scores.argmin(axis=1, out=pred[t])
+        previous = distances[t]
+        scores.min(axis=1, out=previous)
+
+    if stats is not None:
+        stats['mode'] = 'layers'
+        stats['passes'] = 1
+    return distances, pred
 
 
 ''' Outputs the  decoding of a given observation.
@@ -47,79 +214,48 @@ Returns:
 '''
 
 
-def bellman_ford(obs, trans_probs, emiss_probs, init_probs):
-    N = len(obs)  # Number of observations
-    states = ['h', 'l']  # Hidden states
-
-    # Step 1: Represent the graph as a list of edges
-    edges = []
-    for t in range(1, N):
-        for prev_state in states:
-            for current_state in states:
-                # Each edge connects (prev_state, t-1) -> (current_state, t)
-                weight = -trans_probs[prev_state][current_state] - emiss_probs[current_state][obs[t]]
-                edges.append(((prev_state, t - 1), (current_state, t), weight))
-
-    # Step 2: Initialize distances and backtracking
-    dist = {}  # Store the shortest path cost to each node
-    backtrack = {}  # Store backtracking pointers
-    for state in states:
-        dist[(state, 0)] = -init_probs[state] - emiss_probs[state][obs[0]]
-    for t in range(1, N):
-        for state in states:
-            dist[(state, t)] = float('inf')  # Initialize to infinity
-
-    # Step 3: Relax edges |V| - 1 times
-    for _ in range(N - 1):
-        for (u, v, weight) in edges:
-            if dist[u] + weight < dist[v]:
-                dist[v] = dist[u] + weight
-                backtrack[v] = u
-
-    # Step 4: Find the best final state
-    final_state = min(states, key=lambda state: dist[(state, N - 1)])
-    best_prob = -dist[(final_state, N - 1)]  # Convert back to positive log-probability
-
-    # Step 5: Reconstruct the path
-    path = [final_state]
-    current_node = (final_state, N - 1)
-    while current_node in backtrack:
-        current_node = backtrack[current_node]
-        path.append(current_node[0])
-    path.reverse()
+def bellman_ford(obs, trans_probs, emiss_probs, init_probs, stats=None):
+    model = HMMModel.from_dicts(trans_probs, emiss_probs, init_probs)
+    path, p = bellman_ford_encoded(model.encode(obs), model, stats)
+    return model.state_names(path), p
 
-    return path, best_prob
 
-''' Returns a list of non-overlapping intervals describing the GC rich regions.
+''' Outputs the Bellman-Ford decoding of an encoded observation.
+The trellis is layered by construction (the edges into position t come only
+from position t - 1), so it is not detected as a DAG from an edge list but
+handed straight to bellman_ford_layers, which never builds one; the general
+graph code, with its negative cycle detection, is bellman_ford_arrays.
 Arguments:
-	sequence: list of hidden states
+	codes: uint8 array of encoded observations
+	model: compiled HMMModel
+	stats: optional dict, see bellman_ford_layers
 Returns:
-	intervals: list of tuples (i, j), 1 <= i <= j <= len(sequence), that
-                describe GC rich regions in the input list of hidden states.
+	path: uint8 array of most likely state indices at each position
+	p: log-probability of the returned hidden state sequence
 '''
 
 
-def find_intervals(sequence):
-    intervals = []
-    in_gc_rich_region = False
-    beginning = None
-    N = len(sequence)
+def bellman_ford_encoded(codes, model, stats=None):
+    N = len(codes)  # Number of observations
+    if N == 0:
+        raise ValueError("cannot decode an empty sequence")
 
-    for i, state in enumerate(sequence):
-        if state == 'h':  # rich state
-            if not in_gc_rich_region:
-                beginning = i + 1  # start of the region (1-based index)
-                in_gc_rich_region = True
-        else:  # poor state
-            if in_gc_rich_region:
-                intervals.append((beginning, i))  # end  current region
-                in_gc_rich_region = False
+    # Step 1: Relax the trellis layer by layer; the edges into layer t weigh
+    # step_cost[codes[t]]
+    dist, pred = bellman_ford_layers(model.init_cost[codes[0]], model.step_cost,
+                                     codes[1:], stats)
 
-    # if the sequence ends while in a G+C-rich region
-    if in_gc_rich_region:
-        intervals.append((beginning, N))
+    # Step 2: Find the best final state
+    final_state = int(np.argmin(dist[N - 1]))
+    best_prob = -float(dist[N - 1, final_state])  # Convert back to positive log-probability
 
-    return intervals
+    # Step 3: Reconstruct the path
+    path = [final_state]
+    for row in pred[:0:-1].tolist():  # layers N - 1 down to 1
+        path.append(row[path[-1]])
+    path.reverse()
+
+    return np.array(path, dtype=np.uint8), best_prob
 
 
 def main():
@@ -138,23 +274,11 @@ def main():
     intervals_file = args.out
 
     obs_sequence = read_fasta(fasta_file)
-    transition_probabilities = {
-        'h': {'h': np.log(1 - mu), 'l': np.log(mu)},
-        'l': {'h': np.log(mu), 'l': np.log(1 - mu)}
-    }
-    emission_probabilities = {
-        'h': {'A': np.log(0.13), 'C': np.log(0.37), 'G': np.log(0.37), 'T': np.log(0.13)},
-        'l': {'A': np.log(0.32), 'C': np.log(0.18), 'G': np.log(0.18), 'T': np.log(0.32)}
-    }
-    initial_probabilities = {'h': np.log(0.5), 'l': np.log(0.5)}
-
-    sequence, p = bellman_ford(obs_sequence, transition_probabilities,
-                               emission_probabilities, initial_probabilities)
-    intervals = find_intervals(sequence)
-    with open(intervals_file, "w") as f:
-        f.write("\n".join([("%d,%d" % (start, end))
-                for (start, end) in intervals]))
-        f.write("\n")
+    model = gc_content_model(mu)
+
+    path, p = bellman_ford_encoded(model.encode(obs_sequence), model)
+    starts, ends = path_intervals(path, model.states.index('h'))
+    write_intervals(intervals_file, starts, ends)
     print("Bellman-Ford probability in log scale: {:.2f}".format(p))
 
 
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+
+'''Benchmark suite for the decoding engines.
+Arguments:
+    -f: (optional) fasta files to benchmark on (first record of each, with
+        soft-masked bases folded to upper case); defaults to the simulated
+        sequences in Data plus chimpanzee.txt and human_chrome.txt
+    -sizes: (optional) prefix lengths to cut from every input, for a sweep
+        of input sizes; defaults to the whole records
+    -engines: (optional) engine names from decoders.ENGINES, default all
+    -mu: (optional) the probability of switching states, default 0.05
+    -warmup: (optional) untimed runs before timing, default 1
+    -repeats: (optional) timed runs, default 5
+    -memory: (optional) also measure peak memory, in separate processes
+    -out: (optional) JSON file for the results, default
+        benchmark-<git revision>.json
+    -compare: (optional) two result files, BASE and NEW; instead of running
+        anything, report the cases where NEW is slower or bigger
+    -threshold: (optional) relative slowdown that counts as a regression,
+        default 0.1
+
+Outputs:
+    A JSON file with the git revision, the machine and, for every engine,
+    input and size, the timed runs with their median and interquartile
+    range in milliseconds (and the peak memory in MB with -memory). With
+    -compare, a table of regressions; the exit status is 1 if there are any.
+
+Every run is timed with time.perf_counter_ns around the engine call alone,
+on observations that are already encoded and with the garbage collector
+paused, as timeit does. Peak memory is measured in separate, freshly spawned
+processes so that it never slows the timed runs: one records the growth of
+the peak resident set size (VmHWM on Linux, where it is reset just before
+the run; elsewhere ru_maxrss, which cannot be reset, so runs that stay under
+the peak of start-up read as 0) and one the peak of tracemalloc, which also
+sees NumPy's buffers.
+
+Example Usage:
+    python benchmark.py -f human_chrome.txt -sizes 1000 10000 59188 -engines fast dijkstra -memory
+    python benchmark.py -compare benchmark-1a2b3c4.json benchmark-5d6e7f8.json
+'''
+
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from decoders import ENGINES, decode
+from fasta import read_encoded, read_fasta
+from hmm import gc_content_model
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_INPUTS = [os.path.join(HERE, "Data", "simulatedsequence%d.fasta" % i) for i in range(1, 6)] \
+    + [os.path.join(HERE, "chimpanzee.txt"), os.path.join(HERE, "human_chrome.txt")]
+
+
+''' Short git revision of the working tree, with "+dirty" if it has
+uncommitted changes ("unknown" outside a git checkout). '''
+
+
+def git_revision():
+    def git(*arguments):
+        return subprocess.run(("git",) + arguments, cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+
+    try:
+        revision = git("rev-parse", "--short", "HEAD")
+        if git("status", "--porcelain", "--untracked-files=no"):
+            revision += "+dirty"
+        return revision
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+''' Reads the inputs of a benchmark.
+Arguments:
+	files: fasta files
+	sizes: prefix lengths to cut from every record (None for the whole
+        record; sizes longer than a record are skipped)
+Returns:
+	cases: list of (input name, filename, size) tuples
+'''
+
+
+def load_cases(files, sizes=None):
+    cases = []
+    for filename in files:
+        name = os.path.splitext(os.path.basename(filename))[0]
+        N = len(read_fasta(filename, upper=True))
+        for size in (sizes or [N]):
+            if 0 < size <= N:
+                cases.append((name, filename, size))
+    return cases
+
+
+def _encoded(filename, size, mu):
+    model = gc_content_model(mu)
+    return read_encoded(filename, model)[:size], model
+
+
+''' Times one engine on one input.
+Arguments:
+	engine: name in decoders.ENGINES
+	codes: encoded observations
+	model: compiled HMMModel
+	warmup: untimed runs first
+	repeats: timed runs
+Returns:
+	stats: dict with the runs, median and interquartile range in ms
+'''
+
+
+def time_engine(engine, codes, model, warmup=1, repeats=5):
+    for _ in range(warmup):
+        decode(codes, model, engine=engine)
+    runs = []
+    for _ in range(repeats):
+        gc.collect()
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            start = time.perf_counter_ns()
+            decode(codes, model, engine=engine)
+            elapsed = time.perf_counter_ns() - start
+        finally:
+            if enabled:
+                gc.enable()
+        runs.append(elapsed / 1e6)
+    q1, median, q3 = np.percentile(runs, [25, 50, 75])
+    return {"runs_ms": runs, "median_ms": float(median), "iqr_ms": float(q3 - q1)}
+
+
+def _peak_rss_mb():
+    # VmHWM is the peak resident set size of this process image; ru_maxrss
+    # also carries the peak of the parent that spawned it, on Linux at least
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / (1024 * 1024)
+
+
+def _reset_peak_rss():
+    # lowers VmHWM to the current resident set size (Linux 4.0+)
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _memory_probe(connection, engine, filename, size, mu, traced):
+    try:
+        codes, model = _encoded(filename, size, mu)
+        gc.collect()
+        if traced:
+            tracemalloc.start()
+            decode(codes, model, engine=engine)
+            peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            tracemalloc.stop()
+        else:
+            _reset_peak_rss()
+            before = _peak_rss_mb()
+            decode(codes, model, engine=engine)
+            peak = _peak_rss_mb() - before
+        connection.send((True, peak))
+    except Exception as error:
+        connection.send((False, repr(error)))
+    finally:
+        connection.close()
+
+
+''' Measures the peak memory of one engine run in fresh processes.
+Returns:
+	stats: dict with peak_rss_mb (growth of the peak resident set size
+        during the run, None where it cannot be read) and traced_peak_mb
+        (peak of the Python and NumPy allocations seen by tracemalloc);
+        both count the probe process only, not the workers of the parallel
+        engine
+'''
+
+
+def measure_memory(engine, filename, size, mu):
+    # a plain Process rather than a Pool: pool workers are daemonic and
+    # cannot start the workers of the parallel engine
+    context = multiprocessing.get_context("spawn")
+    stats = {}
+    for key, traced in (("peak_rss_mb", False), ("traced_peak_mb", True)):
+        if not traced and _peak_rss_mb() is None:
+            stats[key] = None
+            continue
+        receiver, sender = context.Pipe(duplex=False)
+        probe = context.Process(target=_memory_probe,
+                                args=(sender, engine, filename, size, mu, traced))
+        probe.start()
+        sender.close()
+        try:
+            ok, value = receiver.recv()
+        except EOFError:
+            ok, value = False, "exited with code %s" % probe.exitcode
+        probe.join()
+        if not ok:
+            raise RuntimeError("memory probe of %s on %s failed: %s" % (engine, filename, value))
+        stats[key] = value
+    return stats
+
+
+''' Runs the benchmark over every engine and input.
+Arguments:
+	cases: list of (input name, filename, size) tuples from load_cases
+	engines: engine names
+	mu: the probability of switching states
+	warmup, repeats: see time_engine
+	memory: also run measure_memory for every case
+	log: optional function called with a progress line after every case
+Returns:
+	report: dict with the revision, the machine and
+        results[engine][input][size] statistics, ready for json.dump
+'''
+
+
+def run_benchmark(cases, engines, mu=0.05, warmup=1, repeats=5, memory=False, log=None):
+    results = {}
+    for name, filename, size in cases:
+        codes, model = _encoded(filename, size, mu)
+        for engine in engines:
+            stats = time_engine(engine, codes, model, warmup, repeats)
+            if memory:
+                stats.update(measure_memory(engine, filename, size, mu))
+            results.setdefault(engine, {}).setdefault(name, {})[str(size)] = stats
+            if log is not None:
+                log("{:>13} {:>22} {:>9}: {:10.2f} ms (IQR {:.2f})".format(
+                    engine, name, size, stats["median_ms"], stats["iqr_ms"]))
+    return {
+        "revision": git_revision(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "mu": mu,
+        "warmup": warmup,
+        "repeats": repeats,
+        "results": results,
+    }
+
+
+''' Compares two benchmark reports.
+Arguments:
+	base, new: reports from run_benchmark
+	threshold: relative slowdown (or memory growth) that counts
+Returns:
+	regressions: list of (engine, input, size, metric, base value, new
+        value) tuples; a time only counts when the medians differ by more
+        than the larger interquartile range as well, so noise is not flagged
+'''
+
+
+def compare(base, new, threshold=0.1):
+    regressions = []
+    for engine, inputs in new["results"].items():
+        for name, sizes in inputs.items():
+            for size, stats in sizes.items():
+                old = base["results"].get(engine, {}).get(name, {}).get(size)
+                if old is None:
+                    continue
+                slower = stats["median_ms"] - old["median_ms"]
+                if stats["median_ms"] > old["median_ms"] * (1 + threshold) \
+                        and slower > max(old["iqr_ms"], stats["iqr_ms"]):
+                    regressions.append((engine, name, size, "median_ms",
+                                        old["median_ms"], stats["median_ms"]))
+                for metric in ("peak_rss_mb", "traced_peak_mb"):
+                    a = old.get(metric)
+                    b = stats.get(metric)
+                    # growth below 1 MB is allocator noise
+                    if a is not None and b is not None and b > a * (1 + threshold) and b - a > 1:
+                        regressions.append((engine, name, size, metric, a, b))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the decoding engines, or compare two benchmark results.')
+    parser.add_argument('-f', action="store", dest="f", nargs='+',
+                        type=str, default=DEFAULT_INPUTS)
+    parser.add_argument('-sizes', action="store", dest="sizes", nargs='+',
+                        type=int, required=False)
+    parser.add_argument('-engines', action="store", dest="engines", nargs='+',
+                        choices=sorted(ENGINES), default=list(ENGINES))
+    parser.add_argument('-mu', action="store", dest="mu",
+                        type=float, default=0.05)
+    parser.add_argument('-warmup', action="store", dest="warmup",
+                        type=int, default=1)
+    parser.add_argument('-repeats', action="store", dest="repeats",
+                        type=int, default=5)
+    parser.add_argument('-memory', action="store_true", dest="memory")
+    parser.add_argument('-out', action="store", dest="out",
+                        type=str, required=False)
+    parser.add_argument('-compare', action="store", dest="compare", nargs=2,
+                        type=str, required=False)
+    parser.add_argument('-threshold', action="store", dest="threshold",
+                        type=float, default=0.1)
+
+    args = parser.parse_args()
+    if args.compare:
+        reports = []
+        for filename in args.compare:
+            with open(filename) as f:
+                reports.append(json.load(f))
+        base, new = reports
+        regressions = compare(base, new, args.threshold)
+        print("{} -> {}: {} regression(s)".format(base["revision"], new["revision"],
+                                                  len(regressions)))
+        for engine, name, size, metric, a, b in regressions:
+            # a memory figure of 0 (the run stayed under the start-up peak)
+            # has no relative change
+            change = "{:+.0%}".format(b / a - 1) if a else "new"
+            print("{:>13} {:>22} {:>9} {:>15}: {:10.2f} -> {:10.2f} ({})".format(
+                engine, name, size, metric, a, b, change))
+        sys.exit(1 if regressions else 0)
+
+    report = run_benchmark(load_cases(args.f, args.sizes), args.engines, args.mu,
+                           args.warmup, args.repeats, args.memory, log=print)
+    out = args.out or "benchmark-{}.json".format(report["revision"])
+    with open(out, "w") as f:
+        json.dump(report, f, indent=1)
+    print("Results written to {}".format(out))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,69 +1,198 @@
 import heapq
-from collections import defaultdict
 import math
+import os
+
+import numpy as np
+
+
+class CSRGraph:
+    ''' Directed graph in compressed sparse row form. The out-edges of node u
+    are indices[indptr[u]:indptr[u + 1]] with the matching weights; the same
+    edges are also kept grouped by target (rev_*) for backward searches.
+    All six arrays can be memory-mapped from disk (see save/load).
+    '''
+
+    def __init__(self, indptr, indices, weights, rev_indptr, rev_indices, rev_weights):
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.rev_indptr = rev_indptr
+        self.rev_indices = rev_indices
+        self.rev_weights = rev_weights
+        self.n_nodes = len(indptr) - 1
+        self.n_edges = len(indices)
+
+    ''' Builds a graph from parallel edge arrays.
+    Arguments:
+        sources, targets: integer arrays of edge endpoints (0-based)
+        weights: non-negative edge weights
+        n_nodes: number of nodes (default: largest endpoint + 1)
+    Returns:
+        graph: CSRGraph
+    '''
+
+    @classmethod
+    def from_edges(cls, sources, targets, weights, n_nodes=None):
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        weights = np.asarray(weights, dtype=np.float64)
+        if len(weights) and weights.min() < 0:
+            raise ValueError("Dijkstra does not support negative edge weights")
+        if n_nodes is None:
+            n_nodes = int(max(sources.max(initial=-1), targets.max(initial=-1))) + 1
+
+        def compress(rows, columns):
+            order = np.argsort(rows, kind="stable")
+            indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+            np.cumsum(np.bincount(rows, minlength=n_nodes), out=indptr[1:])
+            return indptr, columns[order], weights[order]
+
+        return cls(*compress(sources, targets), *compress(targets, sources))
+
+    ''' Builds a graph from a dict of adjacency lists {u: [(v, w), ...]}. '''
+
+    @classmethod
+    def from_adjacency(cls, graph):
+        edges = [(u, v, w) for u, neighbors in graph.items() for v, w in neighbors]
+        sources, targets, weights = (np.array(column) for column in zip(*edges)) if edges \
+            else (np.zeros(0), np.zeros(0), np.zeros(0))
+        n_nodes = max(list(graph) + [int(v) for _, v, _ in edges], default=-1) + 1
+        return cls.from_edges(sources, targets, weights, n_nodes)
+
+    ''' Loads a whitespace separated "source target weight" edge list in bulk
+    (lines starting with # are skipped). '''
+
+    @classmethod
+    def from_edge_list(cls, filename, n_nodes=None):
+        edges = np.loadtxt(filename, comments="#", ndmin=2)
+        return cls.from_edges(edges[:, 0].astype(np.int64), edges[:, 1].astype(np.int64),
+                              edges[:, 2], n_nodes)
+
+    _ARRAYS = ("indptr", "indices", "weights", "rev_indptr", "rev_indices", "rev_weights")
+
+    ''' Writes the arrays as .npy files into a directory. '''
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name in self._ARRAYS:
+            np.save(os.path.join(directory, name + ".npy"), getattr(self, name))
+
+    ''' Opens a graph written by save; with mmap the arrays (weights
+    included) are memory-mapped instead of read. '''
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        mode = "r" if mmap else None
+        # plain ndarray views of the maps: slicing an np.memmap is much slower
+        return cls(*(np.load(os.path.join(directory, name + ".npy"), mmap_mode=mode).view(np.ndarray)
+                     for name in cls._ARRAYS))
+
 
 class BiDirectionalDijkstra:
+    ''' Bidirectional Dijkstra over a CSRGraph (a dict of adjacency lists is
+    converted). The per-node distance, parent and settled arrays are
+    allocated once; every query bumps a generation counter and an entry only
+    counts if its stamp equals the current generation, so nothing is cleared
+    or reallocated between queries.
+    '''
+
     def __init__(self, graph):
+        if not isinstance(graph, CSRGraph):
+            graph = CSRGraph.from_adjacency(graph)
         self.graph = graph
+        n = graph.n_nodes
+        self._generation = 0
+        # index 0: forward search from the source, 1: backward from the target
+        self._dist = [np.zeros(n), np.zeros(n)]
+        self._parent = [np.zeros(n, dtype=np.int64), np.zeros(n, dtype=np.int64)]
+        self._reached = [np.zeros(n, dtype=np.int64), np.zeros(n, dtype=np.int64)]
+        self._settled = [np.zeros(n, dtype=np.int64), np.zeros(n, dtype=np.int64)]
+        self._heaps = [[], []]
+
+    ''' Runs one query.
+    Returns:
+        best_distance: length of the shortest path (inf if there is none)
+        meeting_node: node on that path where the two searches met (None if
+            there is no path)
+    '''
 
     def dijkstra(self, source, target):
-        forward_dist = defaultdict(lambda: math.inf)
-        backward_dist = defaultdict(lambda: math.inf)
-        forward_dist[source] = 0
-        backward_dist[target] = 0
-
-        forward_pq = [(0, source)] 
-        backward_pq = [(0, target)]  
-
-        forward_visited = set()
-        backward_visited = set()
-
-        meeting_node = None
-        best_distance = math.inf
-
-        while forward_pq or backward_pq:
-            if forward_pq:
-                forward_cost, forward_node = heapq.heappop(forward_pq)
-                if forward_node in forward_visited:
-                    continue
-                forward_visited.add(forward_node)
-
-                # If the node is visited in both directions
-                if forward_node in backward_visited:
-                    total_distance = forward_dist[forward_node] + backward_dist[forward_node]
-                    if total_distance < best_distance:
-                        best_distance = total_distance
-                        meeting_node = forward_node
-
-                for neighbor, weight in self.graph[forward_node]:
-                    if neighbor not in forward_visited:
-                        new_dist = forward_cost + weight
-                        if new_dist < forward_dist[neighbor]:
-                            forward_dist[neighbor] = new_dist
-                            heapq.heappush(forward_pq, (new_dist, neighbor))
-
-            if backward_pq:
-                backward_cost, backward_node = heapq.heappop(backward_pq)
-                if backward_node in backward_visited:
-                    continue
-                backward_visited.add(backward_node)
-
-                # If the node is visited in both directions
-                if backward_node in forward_visited:
-                    total_distance = forward_dist[backward_node] + backward_dist[backward_node]
-                    if total_distance < best_distance:
-                        best_distance = total_distance
-                        meeting_node = backward_node
-
-                for neighbor, weight in self.graph[backward_node]:
-                    if neighbor not in backward_visited:
-                        new_dist = backward_cost + weight
-                        if new_dist < backward_dist[neighbor]:
-                            backward_dist[neighbor] = new_dist
-                            heapq.heappush(backward_pq, (new_dist, neighbor))
+        self._generation += 1
+        generation = self._generation
+        graph = self.graph
+        adjacency = [(graph.indptr, graph.indices, graph.weights),
+                     (graph.rev_indptr, graph.rev_indices, graph.rev_weights)]
+        dist = self._dist
+        parent = self._parent
+        reached = self._reached
+        settled = self._settled
+        heaps = self._heaps
+        for side, node in ((0, source), (1, target)):
+            heaps[side].clear()
+            heaps[side].append((0.0, node))
+            dist[side][node] = 0.0
+            parent[side][node] = -1
+            reached[side][node] = generation
+
+        best_distance = 0.0 if source == target else math.inf
+        meeting_node = source if source == target else None
+
+        while heaps[0] and heaps[1]:
+            # stop once no path through unsettled nodes can be shorter
+            if heaps[0][0][0] + heaps[1][0][0] >= best_distance:
+                break
+
+            # grow the side with the smaller frontier
+            side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            other = 1 - side
+            cost, node = heapq.heappop(heaps[side])
+            if settled[side][node] == generation:
+                continue
+            settled[side][node] = generation
+
+            indptr, indices, weights = adjacency[side]
+            lo, hi = indptr[node:node + 2].tolist()
+            for neighbor, weight in zip(indices[lo:hi].tolist(), weights[lo:hi].tolist()):
+                new_dist = cost + weight
+                if reached[side][neighbor] != generation or new_dist < dist[side][neighbor]:
+                    reached[side][neighbor] = generation
+                    dist[side][neighbor] = new_dist
+                    parent[side][neighbor] = node
+                    heapq.heappush(heaps[side], (new_dist, neighbor))
+
+                    # Check for meeting point
+                    if reached[other][neighbor] == generation:
+                        total_distance = new_dist + dist[other][neighbor]
+                        if total_distance < best_distance:
+                            best_distance = total_distance
+                            meeting_node = neighbor
 
         return best_distance, meeting_node
 
+    ''' Runs one query and returns the path.
+    Returns:
+        best_distance: length of the shortest path (inf if there is none)
+        path: list of nodes from source to target (empty if there is none)
+    '''
+
+    def shortest_path(self, source, target):
+        best_distance, meeting_node = self.dijkstra(source, target)
+        if meeting_node is None:
+            return best_distance, []
+
+        path = []
+        node = meeting_node
+        while node != -1:
+            path.append(node)
+            node = int(self._parent[0][node])
+        path.reverse()
+
+        node = int(self._parent[1][meeting_node]) if meeting_node != target else -1
+        while node != -1:
+            path.append(node)
+            node = int(self._parent[1][node])
+        return best_distance, path
+
 
 # TESTING 
 graph1 = {
@@ -180,10 +309,11 @@ test_cases = [
     (graph10, source10, target10),
 ]
 
-for i, (graph, source, target) in enumerate(test_cases, 1):
-    bidirectional_dijkstra = BiDirectionalDijkstra(graph)
-    try:
-        distance, meeting_node = bidirectional_dijkstra.dijkstra(source, target)
-        print(f"Test Case {i}: Shortest distance from {source} to {target} is {distance}, Meeting Node: {meeting_node}")
-    except Exception as e:
-        print(f"Test Case {i}: Failed with error {e}")
+if __name__ == "__main__":
+    for i, (graph, source, target) in enumerate(test_cases, 1):
+        try:
+            bidirectional_dijkstra = BiDirectionalDijkstra(graph)
+            distance, path = bidirectional_dijkstra.shortest_path(source, target)
+            print(f"Test Case {i}: Shortest distance from {source} to {target} is {distance}, Path: {path}")
+        except Exception as e:
+            print(f"Test Case {i}: Failed with error {e}")
@@ -1,141 +1,179 @@
+'''Bidirectional Dijkstra decoding over the trellis of a hidden Markov model.
+Arguments:
+    -f: file containing the sequence (fasta file)
+    -mu: the probability of switching states
+    -out: file to output intervals to (1 interval per line)
+    -queue: (optional) priority queue from pqueue.QUEUES, default heap
+
+Outputs:
+    File with list of intervals (a_i, b_i) such that bases a_i to b_i are
+    classified as GC-rich.
+
+A forward search from a virtual source and a backward search from a virtual
+sink alternate, and stop once top_f + top_b >= best. The stopping rule is
+exact, but it prunes little on a decoding trellis: every column of a
+two-state trellis holds a node close to the optimum, so each side still
+settles both states of its half of the sequence. On human_chrome.txt the
+search settles 118370 nodes, against 118372 for dijkstra.dijkstra_encoded;
+it is kept as a correct reference engine, not as a faster one.
+
+Example Usage:
+    python bidirecdijkstra.py -f hmm-sequence.fasta -mu 0.01 -out intervals.txt -queue bucket
+'''
+
 import argparse
-import heapq
 import numpy as np
 
-def read_fasta(filename):
-    with open(filename, "r") as f:
-        s = ""
-        for l in f.readlines()[1:]:
-            s += l.strip()
-    return s
+from fasta import read_fasta
+from fastviterbi import path_log_prob
+from hmm import HMMModel, gc_content_model
+from intervals import path_intervals, write_intervals
+from pqueue import QUEUES, make_queue
+
+def bidirectional_dijkstra(obs, trans_probs, emiss_probs, init_probs, queue='heap', stats=None):
+    model = HMMModel.from_dicts(trans_probs, emiss_probs, init_probs)
+    path, p = bidirectional_encoded(model.encode(obs), model, queue, stats)
+    return model.state_names(path), p
 
-def bidirectional_dijkstra(obs, trans_probs, emiss_probs, init_probs):
+def bidirectional_encoded(codes, model, queue='heap', stats=None):
+    obs = codes.tolist()
     N = len(obs)
-    states = ['h', 'l']
+    if N == 0:
+        raise ValueError("cannot decode an empty sequence")
+    states = range(model.K)
+    init_cost = model.init_cost.tolist()  # init_cost[symbol][state]
+    step_cost = model.step_cost.tolist()  # step_cost[symbol][prev][next]
+
+    # The trellis runs from a virtual source, through the nodes (state, t),
+    # to a virtual sink. Entering (state, t) costs the transition plus the
+    # emission of obs[t]; leaving the last layer for the sink is free.
 
     # Priority queues for forward and backward searches
-    forward_pq = []  
-    backward_pq = []  
+    forward_pq = make_queue(queue)
+    backward_pq = make_queue(queue)
 
-    # Distances and backtracking pointers
+    # Distances (from the source / to the sink) and backtracking pointers
     forward_dist = {}
     backward_dist = {}
-    forward_backtrack = {}
-    backward_backtrack = {}
+    forward_backtrack = {}  # node -> predecessor
+    backward_backtrack = {}  # node -> successor
 
     # Visited nodes
     forward_visited = set()
     backward_visited = set()
 
-    # Initialize priority queues with initial probabilities
-    for state in states:
-        forward_cost = -init_probs[state] - emiss_probs[state][obs[0]]
-        backward_cost = -init_probs[state] - emiss_probs[state][obs[-1]]
-
-        heapq.heappush(forward_pq, (forward_cost, (state, 0)))
-        heapq.heappush(backward_pq, (backward_cost, (state, N - 1)))
-
-        forward_dist[(state, 0)] = forward_cost
-        backward_dist[(state, N - 1)] = backward_cost
-
+    # Best source-sink path seen so far and the node where the sides met
     best_distance = float('inf')
     meeting_node = None
 
-    # Bidirectional search
-    while forward_pq or backward_pq:
+    # Relax the edges out of the source and into the sink
+    for state in states:
+        forward_cost = init_cost[obs[0]][state]
+        forward_dist[(state, 0)] = forward_cost
+        forward_pq.push(forward_cost, (state, 0))
+
+        backward_dist[(state, N - 1)] = 0.0
+        backward_pq.push(0.0, (state, N - 1))
+
+        if N == 1 and forward_cost < best_distance:
+            best_distance = forward_cost
+            meeting_node = (state, 0)
+
+    def top(pq, visited):
+        # smallest key in the queue that is not a stale copy of a settled node
+        while pq:
+            key, node = pq.peek()
+            if node not in visited:
+                return key
+            pq.pop()
+        return float('inf')
+
+    # Bidirectional search: grow the side with the smaller frontier until no
+    # path through unsettled nodes can beat the best one found
+    while True:
+        top_forward = top(forward_pq, forward_visited)
+        top_backward = top(backward_pq, backward_visited)
+        if top_forward + top_backward >= best_distance:
+            break
+
         # Forward step
-        if forward_pq:
-            current_cost, (current_state, t) = heapq.heappop(forward_pq)
+        if top_forward <= top_backward:
+            current_cost, (current_state, t) = forward_pq.pop()
+            forward_visited.add((current_state, t))
 
-            if (current_state, t) in forward_visited:
+            # the only edge out of the last layer goes to the sink, which
+            # was counted when the node was reached
+            if t == N - 1:
                 continue
-            forward_visited.add((current_state, t))
 
-            # Check for meeting point
-            if (current_state, t) in backward_dist:
-                total_cost = current_cost + backward_dist[(current_state, t)]
-                if total_cost < best_distance:
-                    best_distance = total_cost
-                    meeting_node = (current_state, t)
+            weights = step_cost[obs[t + 1]][current_state]
+            for next_state in states:
+                node = (next_state, t + 1)
+                next_cost = current_cost + weights[next_state]
 
-            if t < N - 1:
-                next_obs = obs[t + 1]
-                for next_state in states:
-                    weight = -trans_probs[current_state][next_state] - emiss_probs[next_state][next_obs]
-                    next_cost = current_cost + weight
+                if node not in forward_dist or next_cost < forward_dist[node]:
+                    forward_dist[node] = next_cost
+                    forward_backtrack[node] = (current_state, t)
+                    forward_pq.push(next_cost, node)
 
-                    if (next_state, t + 1) not in forward_dist or next_cost < forward_dist[(next_state, t + 1)]:
-                        forward_dist[(next_state, t + 1)] = next_cost
-                        forward_backtrack[(next_state, t + 1)] = (current_state, t)
-                        heapq.heappush(forward_pq, (next_cost, (next_state, t + 1)))
+                    # Check for meeting point
+                    if node in backward_dist and next_cost + backward_dist[node] < best_distance:
+                        best_distance = next_cost + backward_dist[node]
+                        meeting_node = node
 
         # Backward step
-        if backward_pq:
-            current_cost, (current_state, t) = heapq.heappop(backward_pq)
+        else:
+            current_cost, (current_state, t) = backward_pq.pop()
+            backward_visited.add((current_state, t))
 
-            if (current_state, t) in backward_visited:
+            # likewise the only edge into the first layer is the source's
+            if t == 0:
                 continue
-            backward_visited.add((current_state, t))
 
-            # Check for meeting point
-            if (current_state, t) in forward_dist:
-                total_cost = current_cost + forward_dist[(current_state, t)]
-                if total_cost < best_distance:
-                    best_distance = total_cost
-                    meeting_node = (current_state, t)
-
-            if t > 0:
-                prev_obs = obs[t - 1]
-                for prev_state in states:
-                    weight = -trans_probs[prev_state][current_state] - emiss_probs[prev_state][prev_obs]
-                    next_cost = current_cost + weight
-
-                    if (prev_state, t - 1) not in backward_dist or next_cost < backward_dist[(prev_state, t - 1)]:
-                        backward_dist[(prev_state, t - 1)] = next_cost
-                        backward_backtrack[(prev_state, t - 1)] = (current_state, t)
-                        heapq.heappush(backward_pq, (next_cost, (prev_state, t - 1)))
-
-    # Reconstruct the path
-    if meeting_node:
-        forward_path = []
-        current = meeting_node
-        while current in forward_backtrack:
-            forward_path.append(current[0])
-            current = forward_backtrack[current]
-        forward_path.reverse()
-
-        backward_path = []
-        current = meeting_node
-        while current in backward_backtrack:
-            current = backward_backtrack[current]
-            backward_path.append(current[0])
-
-        path = forward_path + [meeting_node[0]] + backward_path
-    else:
-        path = []
-
-    return path, -best_distance
-
-def find_intervals(sequence):
-    intervals = []
-    in_gc_rich_region = False
-    beginning = None
-    N = len(sequence)
-
-    for i, state in enumerate(sequence):
-        if state == 'h':  # GC-rich state
-            if not in_gc_rich_region:
-                beginning = i + 1  # Start of the region (1-based index)
-                in_gc_rich_region = True
-        else:  # GC-poor state
-            if in_gc_rich_region:
-                intervals.append((beginning, i))  # End the current region
-                in_gc_rich_region = False
-
-    if in_gc_rich_region:
-        intervals.append((beginning, N))
-
-    return intervals
+            weights = step_cost[obs[t]]
+            for prev_state in states:
+                node = (prev_state, t - 1)
+                next_cost = current_cost + weights[prev_state][current_state]
+
+                if node not in backward_dist or next_cost < backward_dist[node]:
+                    backward_dist[node] = next_cost
+                    backward_backtrack[node] = (current_state, t)
+                    backward_pq.push(next_cost, node)
+
+                    # Check for meeting point
+                    if node in forward_dist and next_cost + forward_dist[node] < best_distance:
+                        best_distance = next_cost + forward_dist[node]
+                        meeting_node = node
+
+    if stats is not None:
+        stats['settled'] = len(forward_visited) + len(backward_visited)
+        stats['pops'] = forward_pq.pops + backward_pq.pops
+        stats['pushes'] = forward_pq.pushes + backward_pq.pushes
+
+    # The sides only meet on a path of finite cost; without one every path
+    # scores -inf, as in the other engines, so any of them will do
+    if meeting_node is None:
+        path = np.zeros(N, dtype=np.uint8)
+        return path, path_log_prob(codes, path, model)
+
+    # Reconstruct the path: source side up to the meeting node, then the
+    # sink side after it
+    path = [meeting_node[0]]
+    current = meeting_node
+    while current in forward_backtrack:
+        current = forward_backtrack[current]
+        path.append(current[0])
+    path.reverse()
+
+    current = meeting_node
+    while current in backward_backtrack:
+        current = backward_backtrack[current]
+        path.append(current[0])
+
+    # Re-add the scores along the path in the order Viterbi uses, so the
+    # log-probability matches it exactly
+    path = np.array(path, dtype=np.uint8)
+    return path, path_log_prob(codes, path, model)
 
 def main():
     parser = argparse.ArgumentParser(
@@ -144,6 +182,7 @@ def main():
     parser.add_argument('-f', action="store", dest="f", type=str, required=True)
     parser.add_argument('-mu', action="store", dest="mu", type=float, required=True)
     parser.add_argument('-out', action="store", dest="out", type=str, required=True)
+    parser.add_argument('-queue', action="store", dest="queue", choices=sorted(QUEUES), default='heap')
 
     args = parser.parse_args()
     fasta_file = args.f
@@ -151,22 +190,11 @@ def main():
     intervals_file = args.out
 
     obs_sequence = read_fasta(fasta_file)
-    transition_probabilities = {
-        'h': {'h': np.log(1 - mu), 'l': np.log(mu)},
-        'l': {'h': np.log(mu), 'l': np.log(1 - mu)}
-    }
-    emission_probabilities = {
-        'h': {'A': np.log(0.13), 'C': np.log(0.37), 'G': np.log(0.37), 'T': np.log(0.13)},
-        'l': {'A': np.log(0.32), 'C': np.log(0.18), 'G': np.log(0.18), 'T': np.log(0.32)}
-    }
-    initial_probabilities = {'h': np.log(0.5), 'l': np.log(0.5)}
-
-    sequence, p = bidirectional_dijkstra(obs_sequence, transition_probabilities, emission_probabilities, initial_probabilities)
-    intervals = find_intervals(sequence)
-
-    with open(intervals_file, "w") as f:
-        f.write("\n".join(["%d,%d" % (start, end) for (start, end) in intervals]))
-        f.write("\n")
+    model = gc_content_model(mu)
+
+    path, p = bidirectional_encoded(model.encode(obs_sequence), model, queue=args.queue)
+    starts, ends = path_intervals(path, model.states.index('h'))
+    write_intervals(intervals_file, starts, ends)
 
     print("Bidirectional Dijkstra probability in log scale: {:.2f}".format(p))
 
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+
+'''Viterbi decoding k bases per step with precomputed k-mer block tables.
+Arguments:
+    -f: file containing the sequence (fasta file)
+    -mu: the probability of switching states
+    -out: file to output intervals to (1 interval per line)
+    -k: (optional) bases per block, default 8
+
+Outputs:
+    File with list of intervals (a_i, b_i) such that bases a_i to b_i are
+    classified as GC-rich.
+
+For a fixed model the effect of any k-base word w on the DP vector is a fixed
+K x K max-plus matrix B_w: B_w[i, j] is the best score of consuming w when
+starting from state i just before the word and ending in state j on its last
+base. The tables hold B_w for all M^k words together with the states of the
+best internal path for every (w, i, j), so the forward pass takes one table
+lookup per k bases and the traceback expands every block with a single
+gather.
+
+Building the k = 8 tables takes far longer than decoding a chromosome with
+them, so block_viterbi keeps the tables of the last few models it saw
+(block_tables) and only builds them again for new parameters.
+
+The block scores are sums taken in a different order than the serial
+recursion, so a path can only differ from fastviterbi.viterbi_encoded where
+two segmentations tie to within floating point rounding. The reported
+log-probability is re-accumulated along the path in the serial order.
+
+Example Usage:
+    python blockviterbi.py -f hmm-sequence.fasta -mu 0.01 -out viterbi-intervals.txt -k 8
+'''
+
+import argparse
+from collections import OrderedDict
+
+import numpy as np
+
+from fasta import read_fasta
+from fastviterbi import advance, path_log_prob
+from hmm import gc_content_model
+from intervals import path_intervals, write_intervals
+
+
+class BlockTables:
+    ''' Max-plus block matrices of every k-mer of a model.
+    Arguments:
+        model: compiled HMMModel
+        k: bases per block
+    Attributes:
+        scores: (M^k, K, K) array of block matrices B_w
+        states: (M^k, K, K, k) uint8 array, the best internal path of every
+            block matrix entry (its last state is always j)
+    '''
+
+    def __init__(self, model, k=8):
+        self.model = model
+        self.k = k
+        K = model.K
+        M = model.M
+        W = M ** k
+        words = np.arange(W)
+        # digit p of every word, most significant first
+        digits = [(words // M ** (k - 1 - p)) % M for p in range(k)]
+
+        emiss = model.log_emiss_rows  # emiss[c][j]
+        # scores[w, i, j] after the first base of the word
+        scores = model.log_trans[None, :, :] + emiss[digits[0]][:, None, :]
+        choices = []
+        for p in range(1, k):
+            candidates = scores[:, :, :, None] + model.log_trans[None, None, :, :]
+            best = candidates.argmax(axis=2)
+            choices.append(best.astype(np.uint8))
+            scores = np.take_along_axis(candidates, best[:, :, None, :], axis=2)[:, :, 0, :] \
+                + emiss[digits[p]][:, None, :]
+        self.scores = scores
+
+        states = np.empty((W, K, K, k), dtype=np.uint8)
+        state = np.broadcast_to(np.arange(K, dtype=np.uint8), (W, K, K)).copy()
+        states[..., k - 1] = state
+        w_index = words[:, None, None]
+        i_index = np.arange(K)[None, :, None]
+        for p in range(k - 1, 0, -1):
+            state = choices[p - 1][w_index, i_index, state]
+            states[..., p - 1] = state
+        self.states = states
+
+        # flat [w][4] lists for the unrolled two-state forward pass
+        self._flat = scores.reshape(W, -1).tolist() if K == 2 else None
+
+    ''' Word index of every full k-base block of codes. '''
+
+    def words(self, codes):
+        M = self.model.M
+        blocks = np.asarray(codes, dtype=np.int64).reshape(-1, self.k)
+        return blocks @ (M ** np.arange(self.k - 1, -1, -1, dtype=np.int64))
+
+
+''' Runs the block forward pass.
+Returns:
+	backpointer: (n_blocks, K) int8 array, the best state before each block
+	dp: length K array of scores after the last block
+'''
+
+
+def _forward_blocks(words, dp, tables):
+    K = tables.model.K
+    backpointer = np.zeros((len(words), K), dtype=np.int8)
+    if K == 2:
+        d0, d1 = dp.tolist()
+        flat = tables._flat
+        out = memoryview(backpointer.reshape(-1).view(np.uint8))
+        k = 0
+        for w in words.tolist():
+            b00, b01, b10, b11 = flat[w]
+            a = d0 + b00
+            b = d1 + b10
+            if b > a:
+                out[k] = 1
+                n0 = b
+            else:
+                n0 = a
+            a = d0 + b01
+            b = d1 + b11
+            if b > a:
+                out[k + 1] = 1
+                n1 = b
+            else:
+                n1 = a
+            d0 = n0
+            d1 = n1
+            k += 2
+        return backpointer, np.array([d0, d1])
+
+    columns = np.arange(K)
+    for n, w in enumerate(words):
+        scores = dp[:, None] + tables.scores[w]
+        best = scores.argmax(axis=0)
+        backpointer[n] = best
+        dp = scores[best, columns]
+    return backpointer, dp
+
+
+# tables of the models decoded last, keyed on their parameters, so that
+# repeated decodes with the same model build them once
+_TABLES = OrderedDict()
+_TABLES_KEPT = 4
+
+
+''' Returns the BlockTables of a model, building them only if no model with the
+same parameters and k was among the last few seen.
+Arguments:
+	model: compiled HMMModel
+	k: bases per block
+Returns:
+	tables: BlockTables (possibly built for an equal model)
+'''
+
+
+def block_tables(model, k=8):
+    key = (tuple(model.states), tuple(model.alphabet), model.log_trans.tobytes(),
+           model.log_emiss.tobytes(), model.log_init.tobytes(), k)
+    tables = _TABLES.get(key)
+    if tables is None:
+        tables = _TABLES[key] = BlockTables(model, k)
+        if len(_TABLES) > _TABLES_KEPT:
+            _TABLES.popitem(last=False)
+    else:
+        _TABLES.move_to_end(key)
+    return tables
+
+
+''' Outputs the Viterbi decoding of an encoded observation, k bases at a time.
+Arguments:
+	codes: uint8 array of encoded observations
+	model: compiled HMMModel
+	tables: BlockTables of the model (default: block_tables(model), k = 8)
+Returns:
+	path: uint8 array of most likely state indices at each position
+	p: log-probability of the returned hidden state sequence
+'''
+
+
+def block_viterbi(codes, model, tables=None):
+    if tables is None:
+        tables = block_tables(model)
+    N = len(codes)
+    K = model.K
+    k = tables.k
+    if N == 0:
+        raise ValueError("cannot decode an empty sequence")
+
+    # position 0 seeds the DP, then full blocks, then a short serial tail
+    n_blocks = (N - 1) // k
+    tail = 1 + n_blocks * k
+    words = tables.words(codes[1:tail])
+
+    dp = model.log_init + model.log_emiss_rows[codes[0]]
+    block_backpointer, dp = _forward_blocks(words, dp, tables)
+    tail_backpointer = np.zeros((N - tail, K), dtype=np.int8)
+    dp = advance(codes, tail, N, dp, model, tail_backpointer)
+
+    path = np.empty(N, dtype=np.uint8)
+    state = int(np.argmax(dp))
+    for t in range(N - 1, tail - 1, -1):
+        path[t] = state
+        state = int(tail_backpointer[t - tail, state])
+
+    # end state of every block, then expand all blocks with one gather
+    ends = np.empty(n_blocks + 1, dtype=np.int64)
+    flat = memoryview(block_backpointer.reshape(-1).view(np.uint8))
+    for b in range(n_blocks - 1, -1, -1):
+        ends[b + 1] = state
+        state = flat[b * K + state]
+    ends[0] = state
+    path[0] = state
+    if n_blocks:
+        path[1:tail] = tables.states[words, ends[:-1], ends[1:]].reshape(-1)
+
+    return path, path_log_prob(codes, path, model)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Parse a sequence into GC-rich and GC-poor regions using k-mer block Viterbi.')
+    parser.add_argument('-f', action="store", dest="f",
+                        type=str, required=True)
+    parser.add_argument('-mu', action="store", dest="mu",
+                        type=float, required=True)
+    parser.add_argument('-out', action="store", dest="out",
+                        type=str, required=True)
+    parser.add_argument('-k', action="store", dest="k",
+                        type=int, default=8)
+
+    args = parser.parse_args()
+    fasta_file = args.f
+    mu = args.mu
+    intervals_file = args.out
+
+    obs_sequence = read_fasta(fasta_file)
+    model = gc_content_model(mu)
+
+    path, p = block_viterbi(model.encode(obs_sequence), model, block_tables(model, args.k))
+    starts, ends = path_intervals(path, model.states.index('h'))
+    write_intervals(intervals_file, starts, ends)
+    print("Viterbi probability in log scale: {:.2f}".format(p))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+
+'''Contraction hierarchy for repeated shortest-path queries on one graph.
+Arguments:
+    -f: edge list file ("source target weight" per line)
+    -out: directory to save the hierarchy to
+    -q: (optional) number of random queries to time against
+        bidijkstra.BiDirectionalDijkstra
+
+Preprocessing contracts the nodes one at a time, cheapest first (fewest
+shortcuts added minus edges removed, plus the number of already contracted
+neighbours so the order stays spread out). Contracting v removes it from the
+remaining graph; for every pair of neighbours u -> v -> x a shortcut u -> x
+is added unless a local witness search finds a path u ~> x avoiding v that is
+no longer. Each shortcut remembers v, so a shortcut path can be unpacked back
+into original edges.
+
+Every edge then leads either up (to a node contracted later) or down. A query
+runs Dijkstra upward from the source and upward on the reversed down edges
+from the target; the shortest path is the best sum over nodes reached by
+both, and each side stops once its smallest key is no better than the best
+sum. These searches only touch the few high-ranked nodes above source and
+target, which is what makes repeated queries fast.
+
+Example Usage:
+    python contraction.py -f edges.txt -out edges.ch -q 1000
+'''
+
+import argparse
+import heapq
+import math
+import os
+import time
+
+import numpy as np
+
+from bidijkstra import BiDirectionalDijkstra, CSRGraph
+
+
+''' Bounded Dijkstra from u in the remaining graph, skipping node v.
+Returns:
+	dist: dict of the distances found no further than limit
+'''
+
+
+def _witness_search(out, u, v, limit, settle_limit):
+    dist = {u: 0.0}
+    pq = [(0.0, u)]
+    settled = 0
+    while pq:
+        cost, node = heapq.heappop(pq)
+        if cost > dist[node]:
+            continue
+        if cost > limit or settled >= settle_limit:
+            break
+        settled += 1
+        for neighbor, weight in out[node].items():
+            if neighbor == v:
+                continue
+            new_dist = cost + weight
+            if new_dist < dist.get(neighbor, math.inf):
+                dist[neighbor] = new_dist
+                heapq.heappush(pq, (new_dist, neighbor))
+    return dist
+
+
+''' Shortcuts needed to contract v, as (u, x, weight) tuples. '''
+
+
+def _shortcuts(out, inc, v, settle_limit):
+    shortcuts = []
+    for u, weight_in in inc[v].items():
+        targets = {x: weight_in + weight_out for x, weight_out in out[v].items() if x != u}
+        if not targets:
+            continue
+        dist = _witness_search(out, u, v, max(targets.values()), settle_limit)
+        for x, via in targets.items():
+            if dist.get(x, math.inf) > via:
+                shortcuts.append((u, x, via))
+    return shortcuts
+
+
+def _compress(rows, columns, weights, middles, n_nodes):
+    rows = np.asarray(rows, dtype=np.int64)
+    order = np.argsort(rows, kind="stable")
+    indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_nodes), out=indptr[1:])
+    return (indptr, np.asarray(columns, dtype=np.int64)[order],
+            np.asarray(weights, dtype=np.float64)[order],
+            np.asarray(middles, dtype=np.int64)[order])
+
+
+class ContractionHierarchy:
+    ''' Node ranks plus the upward and (reversed) downward edges of a
+    contracted graph.
+    Attributes:
+        rank: contraction order of every node
+        up: (indptr, indices, weights, middle) of the edges u -> x with
+            rank[x] > rank[u], grouped by u
+        down: the same for the edges u -> x with rank[u] > rank[x], grouped
+            by x and pointing back at u
+        middle is the contracted node a shortcut skips (-1 for an original
+        edge)
+    '''
+
+    _ARRAYS = ("rank", "up_indptr", "up_indices", "up_weights", "up_middle",
+               "down_indptr", "down_indices", "down_weights", "down_middle")
+
+    def __init__(self, rank, up, down):
+        self.rank = rank
+        self.up = up
+        self.down = down
+        self.n_nodes = len(rank)
+        n = self.n_nodes
+        self._generation = 0
+        # index 0: upward search from the source, 1: from the target
+        # (plain lists: queries touch few nodes, and list indexing is much
+        # cheaper than NumPy scalar access)
+        self._dist = [[0.0] * n, [0.0] * n]
+        self._parent = [[-1] * n, [-1] * n]
+        self._reached = [[0] * n, [0] * n]
+        self._heaps = [[], []]
+
+    ''' Contracts a graph.
+    Arguments:
+        graph: CSRGraph (or dict of adjacency lists)
+        settle_limit: nodes a witness search may settle before giving up
+            (a lower limit preprocesses faster but adds more shortcuts)
+    Returns:
+        hierarchy: ContractionHierarchy
+    '''
+
+    @classmethod
+    def build(cls, graph, settle_limit=64):
+        if not isinstance(graph, CSRGraph):
+            graph = CSRGraph.from_adjacency(graph)
+        n = graph.n_nodes
+
+        # remaining graph as dicts, keeping the lightest of parallel edges
+        out = [dict() for _ in range(n)]
+        inc = [dict() for _ in range(n)]
+        sources = np.repeat(np.arange(n), np.diff(graph.indptr))
+        for u, x, weight in zip(sources.tolist(), graph.indices.tolist(),
+                                graph.weights.tolist()):
+            if u != x and weight < out[u].get(x, math.inf):
+                out[u][x] = weight
+                inc[x][u] = weight
+        middle = {}  # (u, x) -> v for the shortcuts in the remaining graph
+
+        deleted = [0] * n  # contracted neighbours of every node
+        pending = {}  # shortcuts found the last time a priority was computed
+
+        def priority(v):
+            pending[v] = _shortcuts(out, inc, v, settle_limit)
+            return len(pending[v]) - len(inc[v]) - len(out[v]) + deleted[v]
+
+        pq = [(priority(v), v) for v in range(n)]
+        heapq.heapify(pq)
+
+        rank = np.zeros(n, dtype=np.int64)
+        up = ([], [], [], [])  # rows, columns, weights, middles
+        down = ([], [], [], [])
+        level = 0
+        while pq:
+            _, v = heapq.heappop(pq)
+            # lazy update: recompute and put back if no longer the cheapest
+            updated = priority(v)
+            if pq and updated > pq[0][0]:
+                heapq.heappush(pq, (updated, v))
+                continue
+
+            rank[v] = level
+            level += 1
+            for x, weight in out[v].items():
+                for array, value in zip(up, (v, x, weight, middle.pop((v, x), -1))):
+                    array.append(value)
+                del inc[x][v]
+                deleted[x] += 1
+            for u, weight in inc[v].items():
+                for array, value in zip(down, (v, u, weight, middle.pop((u, v), -1))):
+                    array.append(value)
+                del out[u][v]
+                deleted[u] += 1
+
+            for u, x, weight in pending.pop(v):
+                if weight < out[u].get(x, math.inf):
+                    out[u][x] = weight
+                    inc[x][u] = weight
+                    middle[(u, x)] = v
+            out[v] = {}
+            inc[v] = {}
+
+        return cls(rank, _compress(*up, n), _compress(*down, n))
+
+    ''' Writes the hierarchy as .npy files into a directory. '''
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        arrays = (self.rank,) + tuple(self.up) + tuple(self.down)
+        for name, array in zip(self._ARRAYS, arrays):
+            np.save(os.path.join(directory, name + ".npy"), array)
+
+    ''' Opens a hierarchy written by save, memory-mapped by default. '''
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        mode = "r" if mmap else None
+        # plain ndarray views of the maps: slicing an np.memmap is much slower
+        arrays = [np.load(os.path.join(directory, name + ".npy"), mmap_mode=mode).view(np.ndarray)
+                  for name in cls._ARRAYS]
+        return cls(arrays[0], tuple(arrays[1:5]), tuple(arrays[5:9]))
+
+    ''' Runs one upward-only bidirectional query.
+    Returns:
+        best_distance: length of the shortest path (inf if there is none)
+        meeting_node: highest-ranked node of that path (None if there is no
+            path)
+    '''
+
+    def query(self, source, target):
+        self._generation += 1
+        generation = self._generation
+        adjacency = [self.up, self.down]
+        dist = self._dist
+        parent = self._parent
+        reached = self._reached
+        heaps = self._heaps
+        for side, node in ((0, source), (1, target)):
+            heaps[side].clear()
+            heaps[side].append((0.0, node))
+            dist[side][node] = 0.0
+            parent[side][node] = -1
+            reached[side][node] = generation
+
+        best_distance = 0.0 if source == target else math.inf
+        meeting_node = source if source == target else None
+
+        while True:
+            # each side stops once its frontier cannot improve the best sum
+            for side in (0, 1):
+                if heaps[side] and heaps[side][0][0] >= best_distance:
+                    heaps[side].clear()
+            if not heaps[0] and not heaps[1]:
+                break
+            if not heaps[1] or (heaps[0] and heaps[0][0][0] <= heaps[1][0][0]):
+                side = 0
+            else:
+                side = 1
+            other = 1 - side
+
+            cost, node = heapq.heappop(heaps[side])
+            if cost > dist[side][node]:
+                continue
+            if reached[other][node] == generation:
+                total_distance = cost + dist[other][node]
+                if total_distance < best_distance:
+                    best_distance = total_distance
+                    meeting_node = node
+
+            indptr, indices, weights, _ = adjacency[side]
+            lo, hi = indptr[node:node + 2].tolist()
+            for neighbor, weight in zip(indices[lo:hi].tolist(), weights[lo:hi].tolist()):
+                new_dist = cost + weight
+                if reached[side][neighbor] != generation or new_dist < dist[side][neighbor]:
+                    reached[side][neighbor] = generation
+                    dist[side][neighbor] = new_dist
+                    parent[side][neighbor] = node
+                    heapq.heappush(heaps[side], (new_dist, neighbor))
+
+        return best_distance, meeting_node
+
+    ''' Middle node of the hierarchy edge a -> b (-1 for an original edge). '''
+
+    def _middle(self, a, b):
+        if self.rank[a] < self.rank[b]:
+            indptr, indices, _, middle = self.up
+            row, column = a, b
+        else:
+            indptr, indices, _, middle = self.down
+            row, column = b, a
+        lo, hi = indptr[row:row + 2].tolist()
+        j = lo + indices[lo:hi].tolist().index(column)
+        return int(middle[j])
+
+    ''' Replaces every shortcut of a hierarchy path by the original edges. '''
+
+    def unpack(self, path):
+        result = [path[0]]
+        stack = [(a, b) for a, b in zip(path[-2::-1], path[:0:-1])]
+        while stack:
+            a, b = stack.pop()
+            v = self._middle(a, b)
+            if v == -1:
+                result.append(b)
+            else:
+                stack.append((v, b))
+                stack.append((a, v))
+        return result
+
+    ''' Runs one query and returns the unpacked path.
+    Returns:
+        best_distance: length of the shortest path (inf if there is none)
+        path: list of original nodes from source to target (empty if there
+            is no path)
+    '''
+
+    def shortest_path(self, source, target):
+        best_distance, meeting_node = self.query(source, target)
+        if meeting_node is None:
+            return best_distance, []
+
+        path = []
+        node = meeting_node
+        while node != -1:
+            path.append(node)
+            node = int(self._parent[0][node])
+        path.reverse()
+
+        node = int(self._parent[1][meeting_node]) if meeting_node != target else -1
+        while node != -1:
+            path.append(node)
+            node = int(self._parent[1][node])
+        return best_distance, self.unpack(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Build a contraction hierarchy for fast repeated shortest-path queries.')
+    parser.add_argument('-f', action="store", dest="f",
+                        type=str, required=True)
+    parser.add_argument('-out', action="store", dest="out",
+                        type=str, required=True)
+    parser.add_argument('-q', action="store", dest="q",
+                        type=int, default=0)
+
+    args = parser.parse_args()
+    graph = CSRGraph.from_edge_list(args.f)
+
+    start = time.perf_counter()
+    hierarchy = ContractionHierarchy.build(graph)
+    hierarchy.save(args.out)
+    print("Contracted {} nodes in {:.2f} s ({} upward and {} downward edges)".format(
+        graph.n_nodes, time.perf_counter() - start,
+        len(hierarchy.up[1]), len(hierarchy.down[1])))
+
+    if args.q:
+        hierarchy = ContractionHierarchy.load(args.out)
+        baseline = BiDirectionalDijkstra(graph)
+        queries = np.random.default_rng(0).integers(0, graph.n_nodes, (args.q, 2)).tolist()
+        for name, search in (("bidirectional Dijkstra", baseline.dijkstra),
+                             ("contraction hierarchy", hierarchy.query)):
+            start = time.perf_counter()
+            for source, target in queries:
+                search(source, target)
+            print("{}: {:.3f} ms per query".format(
+                name, 1000 * (time.perf_counter() - start) / args.q))
+
+
+if __name__ == "__main__":
+    main()
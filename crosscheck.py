@@ -0,0 +1,659 @@
+#!/usr/bin/env python3
+
+'''Differential check of every decoding engine against the others and against
+simulated ground truth.
+Arguments:
+    -trials: (optional) number of random cases, default 100
+    -seed: (optional) seed of the cases; the same seed gives the same cases
+    -n: (optional) longest sequence to decode, default 2000
+    -engines: (optional) engine names from decoders.ENGINES, default all
+    -rtol: (optional) relative tolerance of the log-probabilities, default 1e-9
+    -brute: (optional) largest number of paths to enumerate to find the exact
+        optimum of short sequences, default 100000
+
+Outputs:
+    A table with, for every engine and option set, the number of cases, how
+    many returned a different path of equal score (ties), how many failed, and
+    the fraction of bases whose decoded state matches the simulated one; then
+    one line per failure. The exit status is 1 if anything failed.
+
+Every case is a random model and a sequence simulated from it
+(simulatedsequence.simulate), so the true hidden states are known. Models
+are of three kinds: the GC model of the command line tools with a random mu;
+random models of 2 to 4 states with sticky transitions and, sometimes,
+impossible transitions and emissions (log-probability -inf); and models with
+one state duplicated, so that many paths tie exactly. In one case out of ten
+the model then loses a symbol of the sequence (its emission becomes -inf in
+every state), so that the observations are impossible; accuracy only counts
+the possible cases.
+
+Every engine registered in decoders.ENGINES is run as registered and, for
+those listed in VARIANTS, with options that exercise its other code paths
+(small checkpoint intervals, blocks and chunks, the other priority queues).
+An engine fails a case if it raises, if its path is not a uint8 array of
+valid states of the right length, if the log-probability it reports is not
+that of its path (fastviterbi.path_log_prob), or if its path scores less
+than the best path of any engine (or of brute force enumeration, for short
+sequences). This is the contract stated in decoders: on impossible
+observations the path is still valid and p is -inf, and the empty prefix of
+every case must raise ValueError. Paths are compared by score, not state by
+state: an engine that returns another path of the optimal score is counted
+as a tie, never as a failure, since which of the tied paths comes back
+depends on the order of the comparisons. The true path must not score better than the optimum
+either; if it does, every engine missed the same better path.
+
+The decoding functions outside decoders.ENGINES are checked on every case
+too (EXTRAS): listviterbi.list_viterbi (k=3) must return distinct paths,
+best first, the first at the optimum, and none on impossible observations;
+fastviterbi.viterbi_batch must give every sequence of a batch the path and
+score of fastviterbi.viterbi_encoded; and posterior.forward_backward must
+match the log-likelihood of a log-space forward recursion, with or without
+checkpoints, and raise ValueError on impossible observations. Their
+accuracy is that of the first list_viterbi path, the batch path and the
+posterior decoding (the most probable state of every position). All three
+must raise ValueError on an empty sequence.
+
+When bellman is checked, every trial also runs bellman.bellman_ford_arrays,
+which the decoder does not use, on a random weighted graph (a DAG or a
+general graph with negative weights, often with a negative cycle) against
+the textbook one-edge-at-a-time algorithm; its row in the table is
+bellman_ford_arrays(graphs).
+
+Example Usage:
+    python crosscheck.py -trials 500 -seed 1
+    python crosscheck.py -engines fast dijkstra -n 20000
+'''
+
+import argparse
+import itertools
+import math
+import sys
+
+import numpy as np
+
+from bellman import NegativeCycleError, bellman_ford_arrays
+from blockviterbi import BlockTables
+from decoders import ENGINES
+from fastviterbi import path_log_prob, viterbi_batch, viterbi_encoded
+from hmm import HMMModel, gc_content_model
+from listviterbi import list_viterbi
+from posterior import forward_backward
+from pqueue import QUEUES
+from simulatedsequence import simulate
+
+
+# extra option sets per engine: (label, function of the model returning the
+# keyword arguments)
+VARIANTS = {
+    'checkpointed': [('checkpoint_every=7', lambda model: {'checkpoint_every': 7})],
+    'block': [('k=3', lambda model: {'tables': BlockTables(model, k=3)})],
+    'parallel': [('workers=2,chunks=5', lambda model: {'workers': 2, 'chunks': 5})],
+    'online': [('block_size=7', lambda model: {'block_size': 7})],
+    'dijkstra': [('queue=' + q, lambda model, q=q: {'queue': q}) for q in QUEUES if q != 'heap'],
+    'astar': [('block=5', lambda model: {'block': 5})],
+    'bidirectional': [('queue=' + q, lambda model, q=q: {'queue': q})
+                      for q in QUEUES if q != 'heap'],
+}
+
+# summary row of the general-graph check of bellman.bellman_ford_arrays
+GRAPH_LABEL = 'bellman_ford_arrays(graphs)'
+
+
+''' Lists the runs of a check.
+Arguments:
+	engines: engine names from decoders.ENGINES
+	variants: extra option sets per engine (see VARIANTS)
+Returns:
+	runs: list of (label, engine, options) tuples; options is a function
+        of the model returning the keyword arguments of the engine
+'''
+
+
+def engine_runs(engines, variants=VARIANTS):
+    runs = []
+    for engine in engines:
+        runs.append((engine, engine, lambda model: {}))
+        for text, make_options in variants.get(engine, []):
+            runs.append(("%s(%s)" % (engine, text), engine, make_options))
+    return runs
+
+
+def _sticky_rows(rng, K, size):
+    rows = rng.dirichlet(np.ones(size), K)
+    if size == K:
+        # mostly stay, as in the GC model
+        stay = rng.uniform(0.5, 0.999, K)
+        rows = rows * (1 - stay)[:, None]
+        rows[np.arange(K), np.arange(K)] += stay
+    return rows
+
+
+def _drop_entries(rng, rows, keep):
+    # zero some entries, never the ones in keep, so every row stays usable
+    drop = rng.random(rows.shape) < 0.25
+    drop[np.arange(len(rows)), keep] = False
+    rows = np.where(drop, 0.0, rows)
+    return rows / rows.sum(axis=1, keepdims=True)
+
+
+''' Makes a random case.
+Arguments:
+	rng: np.random.Generator
+	max_length: longest sequence
+Returns:
+	case: dict with the kind of model, the model, labels (the state each
+        state counts as for accuracy: a duplicated state counts as its
+        original), the simulated states and codes, and whether the codes
+        were made impossible under the model
+'''
+
+
+def random_case(rng, max_length):
+    kind = ("gc", "random", "tied")[rng.integers(3)]
+    if kind == "gc":
+        model = gc_content_model(float(np.exp(rng.uniform(np.log(1e-3), np.log(0.5)))))
+        labels = np.arange(2)
+    else:
+        K = int(rng.integers(2, 5)) if kind == "random" else int(rng.integers(2, 4))
+        trans = _sticky_rows(rng, K, K)
+        emiss = rng.dirichlet(np.full(4, 0.7), K)
+        init = rng.dirichlet(np.ones(K))
+        if kind == "random" and rng.random() < 0.5:
+            trans = _drop_entries(rng, trans, np.arange(K))
+            emiss = _drop_entries(rng, emiss, emiss.argmax(axis=1))
+        labels = np.arange(K)
+        if kind == "tied":
+            # state K is a copy of state 0: every path through either ties
+            # with the same path through the other
+            trans = np.column_stack((trans, trans[:, 0] / 2))
+            trans[:, 0] = trans[:, K]
+            trans = np.vstack((trans, trans[0]))
+            emiss = np.vstack((emiss, emiss[0]))
+            init = np.append(init, init[0] / 2)
+            init[0] = init[K]
+            labels = np.append(labels, 0)
+        names = [chr(ord('a') + k) for k in range(len(labels))]
+        model = HMMModel.from_probabilities(names, "ACGT", trans, emiss, init)
+
+    N = max(1, int(round(max_length ** rng.random())))
+    states, codes = simulate(model, N, np.random.SeedSequence(rng.integers(1 << 63)))
+    impossible = bool(rng.random() < 0.1)
+    if impossible:
+        # no state can emit this symbol of the sequence any more
+        log_emiss = model.log_emiss.copy()
+        log_emiss[:, codes[rng.integers(N)]] = -np.inf
+        model = HMMModel(model.states, model.alphabet, model.log_trans, log_emiss,
+                         model.log_init)
+    return {"kind": kind, "model": model, "labels": labels, "states": states, "codes": codes,
+            "impossible": impossible}
+
+
+''' Log-probability of the best path, by enumerating every path.
+Returns:
+	best: the optimum, or None if there are more than limit paths
+'''
+
+
+def brute_force(codes, model, limit=100000):
+    N = len(codes)
+    K = model.K
+    if K ** N > limit:
+        return None
+    paths = np.array(list(itertools.product(range(K), repeat=N)), dtype=np.int64)
+    scores = model.log_init[paths[:, 0]] + model.log_emiss[paths[:, 0], codes[0]]
+    for t in range(1, N):
+        scores = scores + model.log_trans[paths[:, t - 1], paths[:, t]] \
+            + model.log_emiss[paths[:, t], codes[t]]
+    return float(scores.max())
+
+
+def _close(a, b, rtol):
+    if a == b:  # also -inf == -inf
+        return True
+    return abs(a - b) <= rtol * max(1.0, abs(a), abs(b))
+
+
+def _empty_problem(run):
+    # None if run() raises ValueError, as an empty sequence must, else the
+    # message
+    try:
+        run()
+    except ValueError:
+        return None
+    except Exception as error:
+        return "raised %r on an empty sequence, not ValueError" % error
+    return "decoded an empty sequence instead of raising ValueError"
+
+
+def _log_likelihood(codes, model):
+    # log P(obs) by the plain forward recursion in log space
+    alpha = model.log_init + model.log_emiss_rows[codes[0]]
+    for c in codes[1:].tolist():
+        alpha = np.logaddexp.reduce(alpha[:, None] + model.log_trans, axis=0) \
+            + model.log_emiss_rows[c]
+    return float(np.logaddexp.reduce(alpha))
+
+
+''' Runs every engine on one case and checks the results.
+Arguments:
+	case: dict from random_case
+	runs: list from engine_runs
+	rtol: relative tolerance of the log-probabilities
+	brute_limit: largest number of paths to enumerate
+Returns:
+	results: dict label -> dict with problems (list of messages), tie
+        (whether the path differs from the first run's at the same score),
+        correct (number of bases decoded as their true state) and bases (N,
+        or 0 if the engine returned no path or the case is impossible); the
+        checks of EXTRAS follow the runs
+'''
+
+
+def check_case(case, runs, rtol=1e-9, brute_limit=100000):
+    model = case["model"]
+    codes = case["codes"]
+    labels = case["labels"]
+    N = len(codes)
+
+    results = {}
+    paths = {}
+    scores = {}
+    for label, engine, make_options in runs:
+        problems = []
+        results[label] = {"problems": problems, "tie": False, "correct": 0, "bases": 0}
+        problem = _empty_problem(lambda: ENGINES[engine](codes[:0], model, **make_options(model)))
+        if problem is not None:
+            problems.append(problem)
+        try:
+            path, p = ENGINES[engine](codes, model, **make_options(model))
+        except Exception as error:
+            problems.append("raised %r" % error)
+            continue
+        path = np.asarray(path)
+        if path.shape != (N,) or path.dtype != np.uint8:
+            problems.append("returned a %s path of shape %s" % (path.dtype, path.shape))
+            continue
+        if N and path.max() >= model.K:
+            problems.append("returned state %d of a %d-state model" % (path.max(), model.K))
+            continue
+        score = path_log_prob(codes, path, model)
+        if not _close(float(p), score, rtol):
+            problems.append("reported log-probability %r but its path scores %r" % (p, score))
+        elif case["impossible"] and p != -math.inf:
+            problems.append("reported log-probability %r for impossible observations" % p)
+        paths[label] = path
+        scores[label] = score
+        if not case["impossible"]:
+            results[label]["correct"] = int(np.count_nonzero(labels[path] == labels[case["states"]]))
+            results[label]["bases"] = N
+
+    best = max(scores.values(), default=-math.inf)
+    exact = brute_force(codes, model, brute_limit)
+    if exact is not None:
+        best = max(best, exact)
+    truth = path_log_prob(codes, case["states"], model)
+    reference = next(iter(paths), None)
+    for label, score in scores.items():
+        if not _close(score, best, rtol):
+            results[label]["problems"].append(
+                "path scores %r, %.3g below the optimum %r" % (score, best - score, best))
+        elif truth > best and not _close(truth, best, rtol):
+            results[label]["problems"].append(
+                "the true path scores %r, better than every decoded path" % truth)
+        elif not np.array_equal(paths[label], paths[reference]):
+            results[label]["tie"] = True
+
+    reference = paths.get(reference)
+    for label, check in EXTRAS:
+        results[label] = check(case, best, reference, rtol)
+    return results
+
+
+def _extra_result(case, path=None, reference=None):
+    # a result as in check_case, scoring path (if any) for accuracy and ties
+    result = {"problems": [], "tie": False, "correct": 0, "bases": 0}
+    if path is not None:
+        result["tie"] = reference is not None and not np.array_equal(path, reference)
+        if not case["impossible"]:
+            labels = case["labels"]
+            result["correct"] = int(np.count_nonzero(labels[path] == labels[case["states"]]))
+            result["bases"] = len(path)
+    return result
+
+
+''' Checks listviterbi.list_viterbi with k=3: distinct valid paths, best
+first, each reported with its own score, the first at the optimum, and no
+path at all if the observations are impossible.
+Arguments:
+	case: dict from random_case
+	best: optimum found by check_case (-inf for impossible observations)
+	reference: path of the first engine run, or None
+	rtol: relative tolerance of the log-probabilities
+Returns:
+	result: dict as in check_case
+'''
+
+
+def check_list_viterbi(case, best, reference, rtol=1e-9):
+    model = case["model"]
+    codes = case["codes"]
+    N = len(codes)
+    empty = _empty_problem(lambda: list_viterbi(codes[:0], model, 3))
+    try:
+        paths, log_probs = list_viterbi(codes, model, 3)
+    except Exception as error:
+        result = _extra_result(case)
+        result["problems"].append("raised %r" % error)
+        paths = None
+    if paths is None:
+        pass
+    elif best == -math.inf:
+        result = _extra_result(case)
+        if len(paths):
+            result["problems"].append("returned %d paths for impossible observations" % len(paths))
+    elif paths.dtype != np.uint8 or paths.shape[1:] != (N,) or not 1 <= len(paths) <= 3 \
+            or len(log_probs) != len(paths) or paths.max() >= model.K:
+        result = _extra_result(case)
+        result["problems"].append("returned %s paths of shape %s (largest state %d) and %d scores"
+                                  % (paths.dtype, paths.shape, paths.max(initial=0),
+                                     len(log_probs)))
+    else:
+        result = _extra_result(case, paths[0], reference)
+        problems = result["problems"]
+        if len(np.unique(paths, axis=0)) != len(paths):
+            problems.append("returned the same path twice")
+        scores = [path_log_prob(codes, path, model) for path in paths]
+        for r, (p, score) in enumerate(zip(log_probs.tolist(), scores)):
+            if not _close(p, score, rtol):
+                problems.append("reported log-probability %r for path %d, which scores %r"
+                                % (p, r, score))
+            elif r and score > scores[r - 1] and not _close(score, scores[r - 1], rtol):
+                problems.append("path %d scores %r, better than path %d" % (r, score, r - 1))
+        if not _close(scores[0], best, rtol):
+            problems.append("first path scores %r, %.3g below the optimum %r"
+                            % (scores[0], best - scores[0], best))
+    if empty is not None:
+        result["problems"].append(empty)
+    return result
+
+
+''' Checks fastviterbi.viterbi_batch on the case and two pieces of it: every
+sequence must get the path and score of fastviterbi.viterbi_encoded, and a
+batch holding an empty sequence must raise ValueError.
+Arguments:
+	case, best, reference, rtol: see check_list_viterbi
+Returns:
+	result: dict as in check_case
+'''
+
+
+def check_viterbi_batch(case, best, reference, rtol=1e-9):
+    model = case["model"]
+    codes = case["codes"]
+    N = len(codes)
+    sequences = [codes, codes[:max(1, N // 3)], codes[N // 2:]]
+    empty = _empty_problem(lambda: viterbi_batch(sequences + [codes[:0]], model))
+    try:
+        paths, log_probs = viterbi_batch(sequences, model)
+    except Exception as error:
+        result = _extra_result(case)
+        result["problems"].append("raised %r" % error)
+    else:
+        result = _extra_result(case, paths[0], reference)
+        for i, (sequence, path, p) in enumerate(zip(sequences, paths, log_probs.tolist())):
+            expected, expected_p = viterbi_encoded(sequence, model)
+            if not np.array_equal(path, expected) or p != expected_p:
+                result["problems"].append(
+                    "sequence %d of %d bases: path or score %r differs from viterbi_encoded (%r)"
+                    % (i, len(sequence), p, expected_p))
+        score = path_log_prob(codes, paths[0], model)
+        if not _close(score, best, rtol):
+            result["problems"].append("path scores %r, %.3g below the optimum %r"
+                                      % (score, best - score, best))
+    if empty is not None:
+        result["problems"].append(empty)
+    return result
+
+
+''' Checks posterior.forward_backward: the log-likelihood of the log-space
+forward recursion, posteriors that sum to one at every position, the same
+result with checkpoint_every=7, and ValueError on impossible observations.
+Its path is the posterior decoding (the most probable state of every
+position), which is only scored for accuracy.
+Arguments:
+	case, best, reference, rtol: see check_list_viterbi
+Returns:
+	result: dict as in check_case
+'''
+
+
+def check_posterior(case, best, reference, rtol=1e-9):
+    model = case["model"]
+    codes = case["codes"]
+    empty = _empty_problem(lambda: forward_backward(codes[:0], model))
+    result = _extra_result(case)
+    try:
+        posteriors, log_likelihood = forward_backward(codes, model, dtype=np.float64)
+        checkpointed, checkpointed_log_likelihood = forward_backward(
+            codes, model, dtype=np.float64, checkpoint_every=7)
+    except ValueError as error:
+        if best != -math.inf:
+            result["problems"].append("raised %r on possible observations" % error)
+    except Exception as error:
+        result["problems"].append("raised %r" % error)
+    else:
+        if best == -math.inf:
+            result["problems"].append("returned log-likelihood %r for impossible observations"
+                                      % log_likelihood)
+        else:
+            result = _extra_result(case, posteriors.argmax(axis=1).astype(np.uint8))
+            problems = result["problems"]
+            expected = _log_likelihood(codes, model)
+            if not _close(log_likelihood, expected, rtol):
+                problems.append("log-likelihood %r, the forward recursion gives %r"
+                                % (log_likelihood, expected))
+            if not np.allclose(posteriors.sum(axis=1), 1.0):
+                problems.append("posteriors do not sum to one at every position")
+            if not _close(checkpointed_log_likelihood, log_likelihood, rtol) \
+                    or not np.allclose(checkpointed, posteriors):
+                problems.append("checkpoint_every=7 changes the result")
+    if empty is not None:
+        result["problems"].append(empty)
+    return result
+
+
+# checks of the decoding functions that are not engines: (label, function
+# of case, best, reference and rtol returning a result as in check_case)
+EXTRAS = [
+    ('list_viterbi(k=3)', check_list_viterbi),
+    ('viterbi_batch', check_viterbi_batch),
+    ('forward_backward', check_posterior),
+]
+
+
+''' Makes a random weighted directed graph for bellman.bellman_ford_arrays:
+half of them DAGs (relaxed in topological waves), the others general graphs,
+with negative weights and, often, a reachable negative cycle.
+Arguments:
+	rng: np.random.Generator
+	max_nodes: largest number of nodes
+Returns:
+	graph: dict with n_nodes, src, dst, weight and dist (the starting costs,
+        inf except at one or two sources)
+'''
+
+
+def random_graph(rng, max_nodes=30):
+    n_nodes = int(rng.integers(1, max_nodes + 1))
+    n_edges = int(rng.integers(0, 4 * n_nodes + 1))
+    src = rng.integers(0, n_nodes, n_edges)
+    dst = rng.integers(0, n_nodes, n_edges)
+    if rng.random() < 0.5:
+        # edges point forward in a random order of the nodes
+        forward = src != dst
+        order = rng.permutation(n_nodes)
+        src, dst = (order[np.minimum(src, dst)[forward]],
+                    order[np.maximum(src, dst)[forward]])
+    weight = rng.normal(rng.choice([0.2, 1.0]), 1.0, len(src))
+    dist = np.full(n_nodes, np.inf)
+    dist[rng.integers(0, n_nodes, int(rng.integers(1, 3)))] = 0.0
+    return {"n_nodes": n_nodes, "src": src, "dst": dst, "weight": weight, "dist": dist}
+
+
+def _reference_distances(graph):
+    # textbook Bellman-Ford, one edge at a time; None if pass n_nodes still
+    # improves, i.e. a negative cycle is reachable
+    dist = graph["dist"].tolist()
+    edges = list(zip(graph["src"].tolist(), graph["dst"].tolist(), graph["weight"].tolist()))
+    for _ in range(graph["n_nodes"]):
+        changed = False
+        for u, v, w in edges:
+            if dist[u] + w < dist[v]:
+                dist[v] = dist[u] + w
+                changed = True
+        if not changed:
+            return dist
+    return None
+
+
+''' Runs bellman.bellman_ford_arrays on one graph and checks it against the
+textbook algorithm: equal distances, predecessors on shortest paths, and a
+NegativeCycleError (with a cycle that is one) exactly when a negative cycle
+is reachable.
+Returns:
+	problems: list of messages
+'''
+
+
+def check_graph(graph, rtol=1e-9):
+    src, dst, weight = graph["src"], graph["dst"], graph["weight"]
+    expected = _reference_distances(graph)
+    try:
+        dist, pred = bellman_ford_arrays(graph["n_nodes"], src, dst, weight, graph["dist"])
+    except NegativeCycleError as error:
+        if expected is not None:
+            return ["reported a negative cycle %s where there is none" % (error.cycle,)]
+        if error.cycle is None:
+            return []
+        # cycle[i] -> cycle[i + 1], and back to the start; the cheapest edge
+        # of every step is at most the one the predecessors took
+        total = 0.0
+        for a, b in zip(error.cycle, error.cycle[1:] + error.cycle[:1]):
+            steps = weight[(src == a) & (dst == b)]
+            if not len(steps):
+                return ["reported cycle %s has no edge %d -> %d" % (error.cycle, a, b)]
+            total += steps.min()
+        if not total < 0:
+            return ["reported cycle %s weighs %r, not negative" % (error.cycle, total)]
+        return []
+    except Exception as error:
+        return ["raised %r" % error]
+
+    if expected is None:
+        return ["missed a reachable negative cycle"]
+    problems = []
+    for v in range(graph["n_nodes"]):
+        if not _close(float(dist[v]), expected[v], rtol):
+            problems.append("distance %r to node %d, expected %r" % (dist[v], v, expected[v]))
+        elif pred[v] >= 0:
+            into = (src == pred[v]) & (dst == v)
+            if not any(_close(float(dist[pred[v]] + w), float(dist[v]), rtol) for w in weight[into]):
+                problems.append("predecessor %d of node %d is not on a shortest path" % (pred[v], v))
+    return problems
+
+
+''' Checks the engines on random cases.
+Arguments:
+	trials: number of cases
+	seed: seed of the cases
+	max_length: longest sequence
+	engines: engine names (default: all of decoders.ENGINES); with bellman
+        among them, every trial also checks bellman_ford_arrays on a random
+        general graph (check_graph)
+	rtol, brute_limit: see check_case
+	log: optional function called with every failure message
+Returns:
+	summary: dict label -> dict with cases, ties, failures, correct and
+        bases counts
+	failures: list of (trial, label, message) tuples
+'''
+
+
+def crosscheck(trials, seed=None, max_length=2000, engines=None, rtol=1e-9,
+               brute_limit=100000, log=None):
+    engines = list(ENGINES) if engines is None else engines
+    runs = engine_runs(engines)
+    labels = [label for label, _, _ in runs] + [label for label, _ in EXTRAS]
+    summary = {label: {"cases": 0, "ties": 0, "failures": 0, "correct": 0, "bases": 0}
+               for label in labels}
+    graphs = 'bellman' in engines
+    if graphs:
+        summary[GRAPH_LABEL] = {"cases": 0, "ties": 0, "failures": 0, "correct": 0, "bases": 0}
+    failures = []
+    for trial, trial_seed in enumerate(np.random.SeedSequence(seed).spawn(trials)):
+        rng = np.random.default_rng(trial_seed)
+        case = random_case(rng, max_length)
+        if graphs:
+            graph = random_graph(rng)
+            problems = check_graph(graph, rtol)
+            summary[GRAPH_LABEL]["cases"] += 1
+            summary[GRAPH_LABEL]["failures"] += bool(problems)
+            for problem in problems:
+                message = "graph of {} nodes, {} edges: {}".format(
+                    graph["n_nodes"], len(graph["src"]), problem)
+                failures.append((trial, GRAPH_LABEL, message))
+                if log is not None:
+                    log("trial {} {}: {}".format(trial, GRAPH_LABEL, message))
+        for label, result in check_case(case, runs, rtol, brute_limit).items():
+            counts = summary[label]
+            counts["cases"] += 1
+            counts["ties"] += result["tie"]
+            counts["correct"] += result["correct"]
+            counts["bases"] += result["bases"]
+            if result["problems"]:
+                counts["failures"] += 1
+            for problem in result["problems"]:
+                message = "{}{} model, K={}, N={}: {}".format(
+                    case["kind"], " (impossible)" if case["impossible"] else "",
+                    case["model"].K, len(case["codes"]), problem)
+                failures.append((trial, label, message))
+                if log is not None:
+                    log("trial {} {}: {}".format(trial, label, message))
+    return summary, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Check that every decoding engine finds an optimal path on random models.')
+    parser.add_argument('-trials', action="store", dest="trials",
+                        type=int, default=100)
+    parser.add_argument('-seed', action="store", dest="seed",
+                        type=int, required=False)
+    parser.add_argument('-n', action="store", dest="n",
+                        type=int, default=2000)
+    parser.add_argument('-engines', action="store", dest="engines", nargs='+',
+                        choices=sorted(ENGINES), required=False)
+    parser.add_argument('-rtol', action="store", dest="rtol",
+                        type=float, default=1e-9)
+    parser.add_argument('-brute', action="store", dest="brute",
+                        type=int, default=100000)
+
+    args = parser.parse_args()
+    seed = args.seed if args.seed is not None else int(np.random.SeedSequence().entropy % (1 << 32))
+    summary, failures = crosscheck(args.trials, seed, args.n, args.engines, args.rtol,
+                                   args.brute)
+
+    print("{:<32} {:>6} {:>6} {:>8} {:>9}".format("engine", "cases", "ties", "failures",
+                                                  "accuracy"))
+    for label, counts in summary.items():
+        accuracy = counts["correct"] / counts["bases"] if counts["bases"] else float("nan")
+        print("{:<32} {:>6} {:>6} {:>8} {:>9.4f}".format(label, counts["cases"], counts["ties"],
+                                                        counts["failures"], accuracy))
+    for trial, label, message in failures:
+        print("trial {} {}: {}".format(trial, label, message))
+    print("{} failure(s) in {} trials with -seed {}".format(len(failures), args.trials, seed))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+'''Single entry point for every decoding engine.
+Arguments:
+    -f: file containing the sequence (fasta file, or .2bit file from twobit.py)
+    -mu: the probability of switching states (ignored with -model)
+    -model: (optional) compiled model file written by HMMModel.save
+    -engine: (optional) engine name, default fast
+    -out: file to output intervals to (1 interval per line)
+
+Outputs:
+    File with list of intervals (a_i, b_i) such that bases a_i to b_i are
+    classified as GC-rich.
+
+All engines take the same compiled HMMModel and encoded observations and
+return (path, p), path being a uint8 array of state indices. Observations
+that are impossible under the model are no error: p is -inf and path is some
+path of that score. An empty sequence has no path at all, and every engine
+raises ValueError for it.
+
+    viterbi        viterbi.viterbi_encoded, the plain Python recursion
+    fast           fastviterbi.viterbi_encoded
+    checkpointed   fastviterbi.viterbi_checkpointed (checkpoint_every,
+                   memory_budget)
+    block          blockviterbi.block_viterbi (tables)
+    parallel       parallelviterbi.parallel_viterbi (workers, chunks, stats);
+                   the path is exact for the model rounded to a fixed-point
+                   grid, see its stats
+    online         onlineviterbi.OnlineViterbi over the whole input
+                   (block_size)
+    dijkstra       dijkstra.dijkstra_encoded (queue, stats)
+    astar          dijkstra.astar_encoded (block, stats)
+    bidirectional  bidirecdijkstra.bidirectional_encoded (queue, stats)
+    bellman        bellman.bellman_ford_encoded (stats)
+
+Example Usage:
+    python decoders.py -f hmm-sequence.fasta -mu 0.01 -engine dijkstra -out intervals.txt
+'''
+
+import argparse
+import numpy as np
+
+from bellman import bellman_ford_encoded
+from bidirecdijkstra import bidirectional_encoded
+from blockviterbi import block_viterbi
+from dijkstra import astar_encoded, dijkstra_encoded
+from fasta import read_encoded
+from fastviterbi import viterbi_checkpointed, viterbi_encoded
+from hmm import HMMModel, gc_content_model
+from intervals import path_intervals, write_intervals
+from onlineviterbi import OnlineViterbi
+from parallelviterbi import parallel_viterbi
+import viterbi
+
+
+def _online(codes, model, block_size=1 << 16):
+    # an empty stream is fine for OnlineViterbi, but not for an engine
+    if len(codes) == 0:
+        raise ValueError("cannot decode an empty sequence")
+    # the decoder takes symbols, so hand it the ASCII codes back
+    symbols = np.frombuffer("".join(model.alphabet).encode("ascii"), dtype=np.uint8)
+    decoder = OnlineViterbi(model, block_size=block_size)
+    states = [decoder.push(symbols[codes[a:a + block_size]])
+              for a in range(0, len(codes), block_size)]
+    states.append(decoder.finish())
+    return np.concatenate(states), decoder.log_prob
+
+
+ENGINES = {
+    'viterbi': viterbi.viterbi_encoded,
+    'fast': viterbi_encoded,
+    'checkpointed': viterbi_checkpointed,
+    'block': block_viterbi,
+    'parallel': parallel_viterbi,
+    'online': _online,
+    'dijkstra': dijkstra_encoded,
+    'astar': astar_encoded,
+    'bidirectional': bidirectional_encoded,
+    'bellman': bellman_ford_encoded,
+}
+
+
+''' Decodes an observation with any engine.
+Arguments:
+	obs: observed sequence (anything HMMModel.encode accepts; a uint8 array
+        is taken as already encoded)
+	model: compiled HMMModel
+	engine: one of the names in ENGINES
+	**options: engine specific keyword arguments
+Returns:
+	path: uint8 array of most likely state indices at each position
+	p: log-probability of the returned hidden state sequence
+'''
+
+
+def decode(obs, model, engine='fast', **options):
+    try:
+        run = ENGINES[engine]
+    except KeyError:
+        raise ValueError("unknown engine %r (expected one of %s)"
+                         % (engine, ", ".join(sorted(ENGINES))))
+    if isinstance(obs, np.ndarray) and obs.dtype == np.uint8:
+        codes = obs
+    else:
+        codes = model.encode(obs)
+    return run(codes, model, **options)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Parse a sequence into GC-rich and GC-poor regions with any decoding engine.')
+    parser.add_argument('-f', action="store", dest="f",
+                        type=str, required=True)
+    parser.add_argument('-mu', action="store", dest="mu",
+                        type=float, required=False)
+    parser.add_argument('-model', action="store", dest="model",
+                        type=str, required=False)
+    parser.add_argument('-engine', action="store", dest="engine",
+                        choices=sorted(ENGINES), default='fast')
+    parser.add_argument('-out', action="store", dest="out",
+                        type=str, required=True)
+
+    args = parser.parse_args()
+    if args.model is None and args.mu is None:
+        parser.error("one of -mu or -model is required")
+    model = HMMModel.load(args.model) if args.model else gc_content_model(args.mu)
+
+    path, p = decode(read_encoded(args.f, model), model, engine=args.engine)
+    starts, ends = path_intervals(path, model.states.index('h'))
+    write_intervals(args.out, starts, ends)
+    print("{} probability in log scale: {:.2f}".format(args.engine, p))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+'''Shared fasta reader used by every decoder.
+
+The file is memory-mapped and each record is cut out of the map with a single
+slice; line breaks are removed and the case is folded with one bytes.translate
+call per record instead of per-line string concatenation. Soft-masked bases
+are folded to upper case unless upper=False is passed (twobit.py keeps them
+to record the mask). Records come back as bytes, which HMMModel.encode takes
+directly and np.frombuffer(seq, np.uint8) views without a copy.
+
+Packed files written by twobit.py (extension .2bit) are read as well: the
+readers restore their records as text, and iter_encoded unpacks them straight
+into model codes.
+
+For inputs too large to hold as one record, iter_chunks streams the sequence in
+buffered pieces of roughly chunk_size bases.
+'''
+
+import mmap
+
+import numpy as np
+
+
+# extensions of the files read from a directory of sequences
+FASTA_EXTENSIONS = (".fa", ".fasta", ".fna", ".txt", ".2bit")
+
+
+_STRIP = b"\r\n\t "
+_UPPER = bytes.maketrans(b"abcdefghijklmnopqrstuvwxyz", b"ABCDEFGHIJKLMNOPQRSTUVWXYZ")
+
+
+def _clean(raw, upper):
+    if upper:
+        return raw.translate(_UPPER, _STRIP)
+    return raw.translate(None, _STRIP)
+
+
+def _is_twobit(filename):
+    return filename.lower().endswith(".2bit")
+
+
+def _record_name(header):
+    words = header.decode("ascii", "replace").split()
+    return words[0] if words else ""
+
+
+''' Iterates over the records of a (possibly multi-record) fasta file.
+Arguments:
+	filename: name of the fasta file
+	upper: fold soft-masked (lower-case) bases to upper case (default; the
+        decoders' alphabets are upper case)
+Returns:
+	generator of (name, sequence) tuples; name is the first word of the
+        header line and sequence is a bytes object without line breaks
+'''
+
+
+def iter_records(filename, upper=True):
+    if _is_twobit(filename):
+        # imported here, as twobit builds on this module
+        from twobit import TwoBitFile
+        store = TwoBitFile(filename)
+        for name in store:
+            yield name, store[name].sequence(mask=not upper)
+        return
+
+    with open(filename, "rb") as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            return
+        with data:
+            N = len(data)
+            pos = 0
+            while pos < N:
+                if data[pos:pos + 1] == b">":
+                    eol = data.find(b"\n", pos)
+                    eol = N if eol == -1 else eol
+                    name = _record_name(data[pos + 1:eol])
+                    start = eol + 1
+                else:
+                    # sequence before the first header: an unnamed record
+                    name = ""
+                    start = pos
+                end = data.find(b"\n>", start - 1 if start > pos else start)
+                end = N if end == -1 else end
+                sequence = _clean(data[start:end], upper)
+                if name or sequence:
+                    yield name, sequence
+                pos = end + 1
+
+
+''' Reads every record of a fasta file.
+Arguments:
+	filename: name of the fasta file
+	upper: fold soft-masked (lower-case) bases to upper case (default; the
+        decoders' alphabets are upper case)
+Returns:
+	records: list of (name, sequence bytes) tuples
+'''
+
+
+def read_records(filename, upper=True):
+    return list(iter_records(filename, upper))
+
+
+'''Reads the fasta file and outputs the sequence to analyze.
+Arguments:
+	filename: name of the fasta file
+	upper: fold soft-masked (lower-case) bases to upper case (default; the
+        decoders' alphabets are upper case)
+Returns:
+	s: string with the sequence of the first record
+'''
+
+
+def read_fasta(filename, upper=True):
+    for _, sequence in iter_records(filename, upper):
+        return sequence.decode("ascii")
+    return ""
+
+
+''' Iterates over the records of a fasta or packed (.2bit) file, encoded for
+a model. Packed records are unpacked straight into codes, without the text.
+Arguments:
+	filename: name of the fasta or packed file
+	model: compiled HMMModel
+	upper: fold soft-masked (lower-case) bases to upper case (default)
+Returns:
+	generator of (name, codes) tuples, codes as from model.encode (which
+        raises ValueError on symbols outside the alphabet, such as N runs)
+'''
+
+
+def iter_encoded(filename, model, upper=True):
+    if _is_twobit(filename) and upper:
+        from twobit import TwoBitFile
+        store = TwoBitFile(filename)
+        for name in store:
+            yield name, store[name].encode(model)
+        return
+    for name, sequence in iter_records(filename, upper):
+        yield name, model.encode(sequence)
+
+
+''' Reads the first record of a fasta or packed file, encoded for a model
+(see iter_encoded); an empty array if the file has no records. '''
+
+
+def read_encoded(filename, model, upper=True):
+    for _, codes in iter_encoded(filename, model, upper):
+        return codes
+    return np.zeros(0, dtype=np.uint8)
+
+
+''' Streams the sequences of a fasta (or packed) file in buffered pieces.
+Arguments:
+	filename: name of the fasta or packed file
+	chunk_size: approximate number of bases per yielded piece
+	upper: fold soft-masked (lower-case) bases to upper case (default; the
+        decoders' alphabets are upper case)
+Returns:
+	generator of (name, chunk) tuples; consecutive chunks with the same
+        record name belong to the same record
+'''
+
+
+def iter_chunks(filename, chunk_size=1 << 20, upper=True):
+    if _is_twobit(filename):
+        from twobit import TwoBitFile
+        store = TwoBitFile(filename)
+        for name in store:
+            record = store[name]
+            for a in range(0, len(record), chunk_size):
+                yield name, record.sequence(a, a + chunk_size, mask=not upper)
+        return
+
+    with open(filename, "rb", buffering=1 << 20) as f:
+        name = ""
+        lines = []
+        size = 0
+        for line in f:
+            if line.startswith(b">"):
+                if lines:
+                    yield name, _clean(b"".join(lines), upper)
+                name = _record_name(line[1:])
+                lines = []
+                size = 0
+                continue
+            lines.append(line)
+            size += len(line)
+            if size >= chunk_size:
+                yield name, _clean(b"".join(lines), upper)
+                lines = []
+                size = 0
+        if lines:
+            yield name, _clean(b"".join(lines), upper)
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+
+'''Vectorized Viterbi decoding over integer-encoded observations.
+Arguments:
+    -f: file containing the sequence (fasta file)
+    -mu: the probability of switching states
+    -out: file to output intervals to (1 interval per line)
+    -mem: (optional) memory budget in MB; decodes with checkpointing instead
+        of keeping the full backpointer table
+    -path: (optional) .npy file to write the decoded uint8 state path to
+        (memory-mapped, one byte per base)
+
+Outputs:
+    File with list of intervals (a_i, b_i) such that bases a_i to b_i are
+    classified as GC-rich.
+
+The sequence is encoded once into a uint8 array and the model is turned into
+dense log-probability matrices, so the DP only touches NumPy arrays and keeps
+a single int8 backpointer table (K bytes per base) instead of dicts of lists.
+Returns the same path and log-probability as viterbi.viterbi.
+
+Example Usage:
+    python fastviterbi.py -f hmm-sequence.fasta -mu 0.01 -out viterbi-intervals.txt
+'''
+
+import argparse
+import math
+import numpy as np
+
+from fasta import read_fasta
+from hmm import HMMModel, gc_content_model
+from intervals import open_path, path_intervals, write_intervals
+
+
+''' Runs the forward pass of the Viterbi recursion.
+Arguments:
+	codes: uint8 array of encoded observations
+	model: compiled HMMModel
+Returns:
+	backpointer: N x K int8 array, backpointer[t, j] is the best predecessor
+        of state j at position t (row 0 is unused)
+	last: length K array of log-probabilities at the final position
+'''
+
+
+def forward(codes, model):
+    N = len(codes)
+    if N == 0:
+        raise ValueError("cannot decode an empty sequence")
+    backpointer = np.zeros((N, model.K), dtype=np.int8)
+    dp = model.log_init + model.log_emiss_rows[codes[0]]
+    dp = advance(codes, 1, N, dp, model, backpointer[1:])
+    return backpointer, dp
+
+
+''' Advances the Viterbi recursion over positions start..stop-1.
+Arguments:
+	codes: uint8 array of encoded observations
+	start, stop: range of positions to fill
+	dp: length K array of log-probabilities at position start-1
+	model: compiled HMMModel
+	backpointer: int8 array with at least stop-start rows; row t-start
+        receives the best predecessors of position t
+Returns:
+	dp: length K array of log-probabilities at position stop-1
+'''
+
+
+def advance(codes, start, stop, dp, model, backpointer):
+    if model.K == 2:
+        # With only two states the NumPy call overhead costs more than the
+        # arithmetic, so the two columns are unrolled on plain floats.
+        return _advance_two_states(codes, start, stop, dp, model, backpointer)
+
+    log_trans = model.log_trans
+    emiss_rows = model.log_emiss_rows
+    columns = np.arange(model.K)
+    scores = np.empty((model.K, model.K))
+    for t in range(start, stop):
+        np.add(dp[:, None], log_trans, out=scores)
+        best = scores.argmax(axis=0)
+        backpointer[t - start] = best
+        dp = scores[best, columns] + emiss_rows[codes[t]]
+    return dp
+
+
+def _advance_two_states(codes, start, stop, dp, model, backpointer):
+    (t00, t01), (t10, t11) = model.log_trans.tolist()
+    emiss_rows = model.log_emiss_rows.tolist()
+    d0, d1 = dp.tolist()
+
+    # write the decisions straight into the backpointer rows as raw bytes
+    rows = backpointer[:stop - start]
+    rows.fill(0)
+    flat = memoryview(rows.reshape(-1).view(np.uint8))
+    k = 0
+    for c in codes[start:stop].tobytes():
+        e0, e1 = emiss_rows[c]
+        a = d0 + t00
+        b = d1 + t10
+        if b > a:
+            flat[k] = 1
+            n0 = b + e0
+        else:
+            n0 = a + e0
+        a = d0 + t01
+        b = d1 + t11
+        if b > a:
+            flat[k + 1] = 1
+            n1 = b + e1
+        else:
+            n1 = a + e1
+        d0 = n0
+        d1 = n1
+        k += 2
+    return np.array([d0, d1])
+
+
+''' Follows the backpointers from the best final state.
+Arguments:
+	backpointer: N x K int8 array from forward
+	last: length K array of final log-probabilities
+	out: optional uint8 array of length N to write the path into
+Returns:
+	path: uint8 array of state indices (out if given)
+'''
+
+
+def traceback(backpointer, last, out=None):
+    N, K = backpointer.shape
+    path = np.empty(N, dtype=np.uint8) if out is None else out
+    state = int(np.argmax(last))
+    flat = memoryview(backpointer.reshape(-1).view(np.uint8))
+    for t in range(N - 1, 0, -1):
+        path[t] = state
+        state = flat[t * K + state]
+    path[0] = state
+    return path
+
+
+''' Log-probability of a state path, accumulated in the same order as the
+serial recursion: ((init + e_0) + t_1) + e_1 + ...
+Arguments:
+	codes: uint8 array of encoded observations
+	path: uint8 array of state indices
+	model: compiled HMMModel
+Returns:
+	p: log-probability of the path
+'''
+
+
+def path_log_prob(codes, path, model, block=1 << 20):
+    p = model.log_init[path[0]] + model.log_emiss[path[0], codes[0]]
+    for a in range(1, len(codes), block):
+        b = min(a + block, len(codes))
+        steps = np.empty(2 * (b - a) + 1)
+        steps[0] = p
+        steps[1::2] = model.log_trans[path[a - 1:b - 1], path[a:b]]
+        steps[2::2] = model.log_emiss[path[a:b], codes[a:b]]
+        p = np.add.accumulate(steps)[-1]
+    return float(p)
+
+
+''' Outputs the Viterbi decoding of an encoded observation.
+Arguments:
+	codes: uint8 array of encoded observations
+	model: compiled HMMModel
+	out: optional uint8 array of length N (e.g. from intervals.open_path)
+        to write the path into
+Returns:
+	path: uint8 array of most likely state indices at each position
+	p: log-probability of the returned hidden state sequence
+'''
+
+
+def viterbi_encoded(codes, model, out=None):
+    backpointer, last = forward(codes, model)
+    return traceback(backpointer, last, out), float(last.max())
+
+
+''' Outputs the Viterbi decoding of an encoded observation in bounded memory.
+The forward pass only keeps the DP vector every checkpoint_every positions;
+the traceback walks the segments from the end, recomputing each one from its
+checkpoint into a single reusable backpointer block. This costs one extra
+forward pass and returns exactly the same path as viterbi_encoded.
+Arguments:
+	codes: uint8 array of encoded observations
+	model: compiled HMMModel
+	checkpoint_every: positions between checkpoints (default sqrt(N))
+	memory_budget: if given instead, bytes available for the checkpoints and
+        the backpointer block; the encoded input and the returned path (one
+        byte per base each) are not counted
+	out: optional uint8 array of length N to write the path into
+Returns:
+	path: uint8 array of most likely state indices at each position
+	p: log-probability of the returned hidden state sequence
+'''
+
+
+def viterbi_checkpointed(codes, model, checkpoint_every=None, memory_budget=None, out=None):
+    N = len(codes)
+    K = model.K
+    if N == 0:
+        raise ValueError("cannot decode an empty sequence")
+    if checkpoint_every is None:
+        checkpoint_every = checkpoint_interval(N, K, memory_budget)
+    C = max(1, min(int(checkpoint_every), N))
+
+    # checkpoint k holds the DP vector at position k * C
+    n_checkpoints = (N - 1) // C + 1
+    checkpoints = np.empty((n_checkpoints, K))
+    block = np.empty((C, K), dtype=np.int8)
+
+    dp = model.log_init + model.log_emiss_rows[codes[0]]
+    checkpoints[0] = dp
+    for k in range(1, n_checkpoints):
+        dp = advance(codes, (k - 1) * C + 1, k * C + 1, dp, model, block)
+        checkpoints[k] = dp
+
+    # the last segment is left in the block by the final forward step
+    last_start = (n_checkpoints - 1) * C
+    last = advance(codes, last_start + 1, N, dp, model, block)
+
+    path = np.empty(N, dtype=np.uint8) if out is None else out
+    state = int(np.argmax(last))
+    flat = memoryview(block.reshape(-1).view(np.uint8))
+    for k in range(n_checkpoints - 1, -1, -1):
+        a = k * C
+        b = min(a + C, N - 1)
+        if k != n_checkpoints - 1:
+            advance(codes, a + 1, b + 1, checkpoints[k], model, block)
+        for t in range(b, a, -1):
+            path[t] = state
+            state = flat[(t - a - 1) * K + state]
+    path[0] = state
+    return path, float(last.max())
+
+
+''' Picks the checkpoint spacing for viterbi_checkpointed.
+Arguments:
+	N: length of the sequence
+	K: number of hidden states
+	memory_budget: bytes for the checkpoints (8K bytes each) and one
+        segment (K backpointer bytes plus one code byte per position),
+        or None for sqrt(N)
+	segment_bytes: bytes per position of a segment, if not K + 1 (other
+        checkpointed passes keep more per position)
+Returns:
+	C: number of positions between checkpoints
+'''
+
+
+def checkpoint_interval(N, K, memory_budget=None, segment_bytes=None):
+    if memory_budget is None:
+        return max(1, math.isqrt(N))
+    S = K + 1 if segment_bytes is None else segment_bytes
+
+    def cost(C):
+        return ((N - 1) // C + 1) * 8 * K + C * S
+
+    # cost(C) ~ 8KN / C + SC is smallest near sqrt(8KN / S); prefer the
+    # largest spacing that fits, since it means fewer segments
+    smallest = max(1, min(N, math.isqrt(8 * K * N // S)))
+    if cost(smallest) > memory_budget:
+        raise ValueError("memory budget of %d bytes is too small for %d bases; "
+                         "at least %d bytes are needed"
+                         % (memory_budget, N, cost(smallest)))
+    disc = memory_budget * memory_budget - 32 * K * S * N
+    C = min(N, int((memory_budget + math.sqrt(max(disc, 0))) / (2 * S)))
+    while C > smallest and cost(C) > memory_budget:
+        C -= 1
+    return max(C, smallest)
+
+
+''' Outputs the Viterbi decoding of many sequences in one vectorized pass.
+The sequences are packed, longest first, into a padded B x L array; at step t
+only the first n_t rows (the sequences longer than t) are updated, which is
+the length mask without any wasted work on padding. Each sequence gets the
+same path and log-probability as a separate call to viterbi_encoded.
+Arguments:
+	sequences: list of observed sequences (strings or encoded uint8 arrays)
+	model: compiled HMMModel
+Returns:
+	paths: list of uint8 arrays of state indices, in input order
+	log_probs: float array of the log-probability of each path
+'''
+
+
+def viterbi_batch(sequences, model):
+    encoded = [np.asarray(seq, dtype=np.uint8) if isinstance(seq, np.ndarray)
+               else model.encode(seq) for seq in sequences]
+    B = len(encoded)
+    K = model.K
+    if B == 0:
+        return [], np.zeros(0)
+    lengths = np.array([len(codes) for codes in encoded], dtype=np.int64)
+    if lengths.min() == 0:
+        raise ValueError("cannot decode an empty sequence")
+
+    order = np.argsort(-lengths, kind="stable")
+    lengths = lengths[order]
+    L = int(lengths[0])
+    packed = np.zeros((B, L), dtype=np.uint8)
+    for row, index in enumerate(order):
+        packed[row, :lengths[row]] = encoded[index]
+
+    # active[t]: number of sequences that still have a base at position t
+    active = np.searchsorted(-lengths, -np.arange(L), side="left")
+
+    backpointer = np.zeros((L, B, K), dtype=np.int8)
+    dp = model.log_init + model.log_emiss_rows[packed[:, 0]]
+    rows = np.arange(B)[:, None]
+    columns = np.arange(K)[None, :]
+    for t in range(1, L):
+        n = active[t]
+        scores = dp[:n, :, None] + model.log_trans
+        best = scores.argmax(axis=1)
+        backpointer[t, :n] = best
+        dp[:n] = scores[rows[:n], best, columns] + model.log_emiss_rows[packed[:n, t]]
+
+    # dp rows stop changing once their sequence has ended
+    state = dp.argmax(axis=1)
+    log_probs = dp.max(axis=1)
+    path = np.zeros((B, L), dtype=np.uint8)
+    for t in range(L - 1, 0, -1):
+        n = active[t]
+        path[:n, t] = state[:n]
+        state[:n] = backpointer[t, np.arange(n), state[:n]]
+    path[:, 0] = state
+
+    paths = [None] * B
+    result = np.empty(B)
+    for row, index in enumerate(order):
+        paths[index] = path[row, :lengths[row]].copy()
+        result[index] = log_probs[row]
+    return paths, result
+
+
+''' Outputs the Viterbi decoding of a given observation.
+Arguments:
+	obs: observed sequence of emitted states (list of emissions)
+	trans_probs: transition log-probabilities (dictionary of dictionaries)
+	emiss_probs: emission log-probabilities (dictionary of dictionaries)
+	init_probs: initial log-probabilities for each hidden state (dictionary)
+Returns:
+	l: list of most likely hidden states at each position
+        (list of hidden states)
+	p: log-probability of the returned hidden state sequence
+'''
+
+
+def viterbi(obs, trans_probs, emiss_probs, init_probs):
+    model = HMMModel.from_dicts(trans_probs, emiss_probs, init_probs)
+    path, p = viterbi_encoded(model.encode(obs), model)
+    return model.state_names(path), p
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Parse a sequence into GC-rich and GC-poor regions using vectorized Viterbi.')
+    parser.add_argument('-f', action="store", dest="f",
+                        type=str, required=True)
+    parser.add_argument('-mu', action="store", dest="mu",
+                        type=float, required=True)
+    parser.add_argument('-out', action="store", dest="out",
+                        type=str, required=True)
+    parser.add_argument('-mem', action="store", dest="mem",
+                        type=float, required=False,
+                        help='memory budget in MB for checkpointed decoding')
+    parser.add_argument('-path', action="store", dest="path",
+                        type=str, required=False)
+
+    args = parser.parse_args()
+    fasta_file = args.f
+    mu = args.mu
+    intervals_file = args.out
+    memory_budget = None if args.mem is None else int(args.mem * 1024 * 1024)
+
+    obs_sequence = read_fasta(fasta_file)
+    model = gc_content_model(mu)
+    codes = model.encode(obs_sequence)
+    out = None if args.path is None else open_path(args.path, len(codes))
+    if memory_budget is None:
+        path, p = viterbi_encoded(codes, model, out=out)
+    else:
+        path, p = viterbi_checkpointed(codes, model, memory_budget=memory_budget, out=out)
+    starts, ends = path_intervals(path, model.states.index('h'))
+    write_intervals(intervals_file, starts, ends)
+    print("Viterbi probability in log scale: {:.2f}".format(p))
+
+
+if __name__ == "__main__":
+    main()
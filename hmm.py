@@ -0,0 +1,166 @@
+'''Shared hidden Markov model used by every decoder.
+
+HMMModel takes any number of hidden states and any single-character alphabet
+and compiles them once into contiguous arrays, so the decoders index arrays
+instead of walking nested dicts of log-probabilities on every step:
+
+    log_trans[i, j]   log P(state j at t+1 | state i at t)     (K x K)
+    log_emiss[i, c]   log P(symbol c | state i)                (K x M)
+    log_init[i]       log P(state i at t = 0)                  (K)
+
+The shortest-path decoders work with costs instead, so the negated arrays
+(cost_trans, cost_emiss, cost_init) are kept as well, together with the
+per-symbol tables of the full cost of entering a trellis node:
+
+    step_cost[c, i, j]  cost of the edge (i, t) -> (j, t+1) when obs[t+1] == c
+    init_cost[c, j]     cost of the source edge into (j, 0) when obs[0] == c
+
+States and symbols are referred to by their index in model.states and
+model.alphabet; observations are encoded into uint8 arrays with model.encode.
+Compiled models can be written with save() and read back with load(), and
+gc_content_model builds the two-state model the command line tools use.
+'''
+
+import numpy as np
+
+
+class HMMModel:
+    def __init__(self, states, alphabet, log_trans, log_emiss, log_init):
+        self.states = list(states)
+        self.alphabet = list(alphabet)
+        self.K = len(self.states)
+        self.M = len(self.alphabet)
+
+        if self.K > 127:
+            raise ValueError("at most 127 hidden states are supported (int8 backpointers)")
+        for symbol in self.alphabet:
+            if len(symbol) != 1 or ord(symbol) > 255:
+                raise ValueError("alphabet symbols must be single characters, got %r" % symbol)
+
+        self.log_trans = np.ascontiguousarray(log_trans, dtype=np.float64)
+        self.log_emiss = np.ascontiguousarray(log_emiss, dtype=np.float64)
+        self.log_init = np.ascontiguousarray(log_init, dtype=np.float64)
+        if self.log_trans.shape != (self.K, self.K):
+            raise ValueError("log_trans must be %d x %d" % (self.K, self.K))
+        if self.log_emiss.shape != (self.K, self.M):
+            raise ValueError("log_emiss must be %d x %d" % (self.K, self.M))
+        if self.log_init.shape != (self.K,):
+            raise ValueError("log_init must have length %d" % self.K)
+
+        # log_emiss with one contiguous row per symbol: log_emiss_rows[c][j]
+        self.log_emiss_rows = np.ascontiguousarray(self.log_emiss.T)
+
+        # negative log-probabilities; step_cost[c, i, j] is computed as
+        # -log_trans[i, j] - log_emiss[j, c], the same operations the
+        # searches used to do per edge, so the costs are bit-identical
+        self.cost_trans = -self.log_trans
+        self.cost_emiss = -self.log_emiss
+        self.cost_init = -self.log_init
+        self.step_cost = self.cost_trans[None, :, :] - self.log_emiss_rows[:, None, :]
+        self.init_cost = self.cost_init[None, :] - self.log_emiss_rows
+
+        self._lookup = np.full(256, 255, dtype=np.uint8)
+        for code, symbol in enumerate(self.alphabet):
+            self._lookup[ord(symbol)] = code
+
+    ''' Builds a model from the nested dictionaries of log-probabilities that
+    the decoders' main() functions construct.
+    Arguments:
+        trans_probs: transition log-probabilities (dictionary of dictionaries)
+        emiss_probs: emission log-probabilities (dictionary of dictionaries)
+        init_probs: initial log-probabilities for each hidden state (dictionary)
+    Returns:
+        model: HMMModel with states ordered as in init_probs and symbols
+            ordered as in the emission dictionary of the first state
+    '''
+
+    @classmethod
+    def from_dicts(cls, trans_probs, emiss_probs, init_probs):
+        states = list(init_probs)
+        alphabet = list(emiss_probs[states[0]])
+        log_trans = [[trans_probs[a][b] for b in states] for a in states]
+        log_emiss = [[emiss_probs[a][c] for c in alphabet] for a in states]
+        log_init = [init_probs[a] for a in states]
+        return cls(states, alphabet, log_trans, log_emiss, log_init)
+
+    ''' Builds a model from (non-log) probability matrices.
+    Arguments:
+        states: list of hidden state names
+        alphabet: list of single-character symbols
+        trans, emiss, init: probability arrays shaped K x K, K x M and K
+    Returns:
+        model: HMMModel holding the natural logarithms of the inputs
+    '''
+
+    @classmethod
+    def from_probabilities(cls, states, alphabet, trans, emiss, init):
+        with np.errstate(divide="ignore"):
+            return cls(states, alphabet, np.log(trans), np.log(emiss), np.log(init))
+
+    ''' Writes the model to a .npz file. '''
+
+    def save(self, filename):
+        np.savez(filename, states=np.array(self.states), alphabet=np.array(self.alphabet),
+                 log_trans=self.log_trans, log_emiss=self.log_emiss, log_init=self.log_init)
+
+    ''' Reads a model written by save. '''
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename, allow_pickle=False) as data:
+            return cls(data["states"].tolist(), data["alphabet"].tolist(),
+                       data["log_trans"], data["log_emiss"], data["log_init"])
+
+    ''' Encodes a sequence of symbols as a uint8 array of alphabet indices.
+    Arguments:
+        obs: observed sequence (string, list of symbols, bytes or uint8 array
+            of ASCII codes)
+    Returns:
+        codes: uint8 array with codes[t] = alphabet.index(obs[t])
+    '''
+
+    def encode(self, obs):
+        if isinstance(obs, (list, tuple)):
+            obs = "".join(obs)
+        if isinstance(obs, str):
+            obs = obs.encode("ascii")
+        if isinstance(obs, (bytes, bytearray, memoryview)):
+            raw = np.frombuffer(obs, dtype=np.uint8)
+        else:
+            raw = np.asarray(obs, dtype=np.uint8)
+        codes = self._lookup[raw]
+
+        bad = np.flatnonzero(codes == 255)
+        if len(bad):
+            raise ValueError("symbol %r at position %d is not in the alphabet %s"
+                             % (chr(raw[bad[0]]), bad[0], self.alphabet))
+        return codes
+
+    ''' Turns an array of state indices back into a list of state names. '''
+
+    def state_names(self, path):
+        names = np.array(self.states, dtype=object)
+        return names[np.asarray(path)].tolist()
+
+
+''' Builds the two-state GC-content model of the command line tools.
+Arguments:
+	mu: the probability of switching states
+Returns:
+	model: HMMModel with the GC-rich state 'h' and the GC-poor state 'l'
+        over the alphabet ACGT
+'''
+
+
+def gc_content_model(mu):
+    transition_probabilities = {
+        'h': {'h': np.log(1 - mu), 'l': np.log(mu)},
+        'l': {'h': np.log(mu), 'l': np.log(1 - mu)}
+    }
+    emission_probabilities = {
+        'h': {'A': np.log(0.13), 'C': np.log(0.37), 'G': np.log(0.37), 'T': np.log(0.13)},
+        'l': {'A': np.log(0.32), 'C': np.log(0.18), 'G': np.log(0.18), 'T': np.log(0.32)}
+    }
+    initial_probabilities = {'h': np.log(0.5), 'l': np.log(0.5)}
+    return HMMModel.from_dicts(transition_probabilities, emission_probabilities,
+                               initial_probabilities)
@@ -0,0 +1,30 @@
+'''Expansion of the file and directory arguments of the command line tools.
+
+A directory stands for the files in it with one of the extensions the tool
+reads (fasta.FASTA_EXTENSIONS for sequences, intervalstore's for interval
+files); other files in it are skipped. Files named directly are kept whatever
+their extension.
+'''
+
+import os
+
+
+''' Expands the command line inputs into a list of files.
+Arguments:
+	paths: list of files and directories
+	extensions: tuple of lower-case file extensions to take from directories
+Returns:
+	files: list of file names; the files of a directory are sorted by name
+'''
+
+
+def collect_inputs(paths, extensions):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for entry in sorted(os.listdir(path)):
+                if entry.lower().endswith(extensions):
+                    files.append(os.path.join(path, entry))
+        else:
+            files.append(path)
+    return files
@@ -0,0 +1,97 @@
+'''Interval extraction and writing for uint8 state paths.
+
+The decoders return paths as uint8 arrays of state indices (one byte per
+base), which can also live in memory-mapped .npy files (open_path). A
+GC-rich interval starts where the path enters the rich state and ends where
+it leaves it, so the intervals follow from the change points of
+(path == rich_state), found with one np.diff / np.flatnonzero per block;
+there is no per-base Python loop and no list of state names.
+
+Intervals come back as two int64 arrays, starts and ends, with the same
+1-based inclusive convention as find_intervals, and format_intervals turns
+them into the "a,b" lines of the interval files with array arithmetic, so
+the file is written with a single write call.
+'''
+
+import numpy as np
+
+
+''' Finds the intervals in which a path stays in one state.
+Arguments:
+	path: uint8 array (or memory-mapped .npy) of state indices
+	rich_state: index of the GC-rich state
+	block: positions compared at a time, so a memory-mapped path is read
+        in pieces
+Returns:
+	starts, ends: int64 arrays with 1 <= starts[n] <= ends[n] <= len(path),
+        the n-th interval of consecutive rich_state positions
+'''
+
+
+def path_intervals(path, rich_state=0, block=1 << 24):
+    N = len(path)
+    changes = []
+    inside = False
+    for a in range(0, N, block):
+        rich = np.asarray(path[a:a + block]) == rich_state
+        # a change point is a position whose state differs from the one before
+        changes.append(np.flatnonzero(np.diff(rich, prepend=inside)) + a)
+        inside = bool(rich[-1])
+    if inside:
+        changes.append(np.array([N]))
+    changes = np.concatenate(changes) if changes else np.zeros(0, dtype=np.int64)
+    changes = changes.astype(np.int64, copy=False)
+    # entering at 0-based position s is base s + 1; leaving at e means the
+    # last rich base is e - 1, which is base e
+    return changes[0::2] + 1, changes[1::2]
+
+
+''' Formats intervals as "a,b" lines.
+Arguments:
+	starts, ends: integer arrays of interval bounds
+Returns:
+	text: bytes with one "a,b\\n" line per interval
+'''
+
+
+def format_intervals(starts, ends):
+    columns = np.column_stack((starts, ends)).astype(np.int64)
+    if not len(columns):
+        return b""
+    width = max(1, len(str(int(columns.max()))))
+
+    # decimal digits of every number, most significant first
+    powers = 10 ** np.arange(width - 1, -1, -1, dtype=np.int64)
+    digits = (columns[:, :, None] // powers) % 10
+    # keep the digits from the first non-zero one (and always the last)
+    keep = (columns[:, :, None] >= powers) | (powers == 1)
+
+    n = len(columns)
+    text = np.empty((n, 2, width + 1), dtype=np.uint8)
+    text[:, :, :width] = digits + ord("0")
+    text[:, 0, width] = ord(",")
+    text[:, 1, width] = ord("\n")
+    mask = np.ones((n, 2, width + 1), dtype=bool)
+    mask[:, :, :width] = keep
+    return text[mask].tobytes()
+
+
+''' Writes intervals to a file, one "a,b" line per interval. '''
+
+
+def write_intervals(filename, starts, ends):
+    with open(filename, "wb") as f:
+        f.write(format_intervals(starts, ends))
+
+
+''' Creates a memory-mapped .npy file for a state path.
+Arguments:
+	filename: name of the .npy file
+	N: number of positions
+Returns:
+	path: writable uint8 np.memmap of length N
+'''
+
+
+def open_path(filename, N):
+    return np.lib.format.open_memmap(filename, mode="w+", dtype=np.uint8, shape=(N,))
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+
+'''Binary, memory-mappable store of GC-rich intervals with region queries.
+Arguments:
+    -store: directory of the store
+    -f: (optional) interval files and/or directories of them (as written by
+        the decoders and batch.py) to build the store from; each file is one
+        sequence named after the file
+    -q: (optional) regions to query, as name:start-end (1-based, inclusive)
+        or just name for the whole sequence
+    -coverage: (optional) print the number of GC-rich bases in each region
+        instead of the intervals
+    -bed: (optional) BED file to export the whole store to
+
+Outputs:
+    The overlapping intervals (or the coverage) of every query region on
+    standard output, in the a,b format of the interval files.
+
+The intervals of every sequence are kept sorted in two int64 arrays, starts
+and ends, concatenated over the sequences with an indptr array marking where
+each sequence begins, as in the CSR graphs of bidijkstra.py. The decoders'
+intervals never overlap, so both arrays are sorted and the intervals that
+overlap a region are one contiguous run found with two binary searches: the
+first interval ending at or after the region's start and the last one
+starting at or before its end. A third array holds the running total of
+interval lengths, so the coverage of a region is a difference of two
+entries, less what the first and last interval stick out of the region.
+Queries are O(log n) and, with the arrays memory-mapped, only touch the
+pages the binary searches visit, so nothing is loaded up front.
+
+Example Usage:
+    python batch.py -f genome.fa -mu 0.01 -out intervals
+    python intervalstore.py -store genome.gc -f intervals -bed genome-gc.bed
+    python intervalstore.py -store genome.gc -q chr1:1000000-2000000 -coverage
+'''
+
+import argparse
+import os
+
+import numpy as np
+
+from inputs import collect_inputs
+from intervals import format_intervals
+
+
+# extension of the interval files read from a directory (batch.py writes
+# <record>.txt)
+INTERVAL_EXTENSIONS = (".txt",)
+
+
+class IntervalStore:
+    ''' Sorted, non-overlapping intervals of several named sequences.
+    Attributes:
+        names: list of sequence names
+        indptr: intervals of sequence s are at indptr[s]:indptr[s + 1]
+        starts, ends: int64 arrays of 1-based inclusive interval bounds
+        covered: running total of interval lengths, covered[i] being the
+            number of bases in the intervals before i (length n + 1)
+    '''
+
+    _ARRAYS = ("indptr", "starts", "ends", "covered")
+
+    def __init__(self, names, indptr, starts, ends, covered):
+        self.names = list(names)
+        self.indptr = indptr
+        self.starts = starts
+        self.ends = ends
+        self.covered = covered
+        self._index = {name: s for s, name in enumerate(self.names)}
+
+    ''' Builds a store from the intervals of every sequence.
+    Arguments:
+        records: iterable of (name, starts, ends) tuples
+    Returns:
+        store: IntervalStore
+    '''
+
+    @classmethod
+    def build(cls, records):
+        names = []
+        seen = set()
+        starts = []
+        ends = []
+        for name, record_starts, record_ends in records:
+            record_starts = np.asarray(record_starts, dtype=np.int64)
+            record_ends = np.asarray(record_ends, dtype=np.int64)
+            if name in seen:
+                raise ValueError("sequence %r appears more than once" % name)
+            if len(record_starts) != len(record_ends):
+                raise ValueError("%s: %d starts but %d ends"
+                                 % (name, len(record_starts), len(record_ends)))
+            order = np.argsort(record_starts, kind="stable")
+            record_starts = record_starts[order]
+            record_ends = record_ends[order]
+            if np.any(record_ends < record_starts) or np.any(record_starts[1:] <= record_ends[:-1]):
+                raise ValueError("%s: intervals must be non-empty and must not overlap" % name)
+            names.append(name)
+            seen.add(name)
+            starts.append(record_starts)
+            ends.append(record_ends)
+
+        indptr = np.zeros(len(names) + 1, dtype=np.int64)
+        np.cumsum([len(s) for s in starts], out=indptr[1:])
+        starts = np.concatenate(starts) if starts else np.zeros(0, dtype=np.int64)
+        ends = np.concatenate(ends) if ends else np.zeros(0, dtype=np.int64)
+        covered = np.zeros(len(starts) + 1, dtype=np.int64)
+        np.cumsum(ends - starts + 1, out=covered[1:])
+        return cls(names, indptr, starts, ends, covered)
+
+    ''' Builds a store from interval text files ("a,b" per line).
+    Arguments:
+        files: iterable of (name, filename) tuples
+    Returns:
+        store: IntervalStore
+    '''
+
+    @classmethod
+    def from_interval_files(cls, files):
+        def read(name, filename):
+            with open(filename, "rb") as f:
+                values = np.array(f.read().replace(b",", b" ").split(), dtype=np.int64)
+            if len(values) % 2:
+                raise ValueError("%s: expected a,b pairs" % filename)
+            return name, values[0::2], values[1::2]
+
+        return cls.build(read(name, filename) for name, filename in files)
+
+    ''' Writes the store as .npy files into a directory. '''
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "names.npy"), np.array(self.names, dtype=str))
+        for name in self._ARRAYS:
+            np.save(os.path.join(directory, name + ".npy"), getattr(self, name))
+
+    ''' Opens a store written by save, memory-mapped by default. '''
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        mode = "r" if mmap else None
+        names = np.load(os.path.join(directory, "names.npy")).tolist()
+        # plain ndarray views of the maps: slicing an np.memmap is much slower
+        arrays = [np.load(os.path.join(directory, name + ".npy"), mmap_mode=mode).view(np.ndarray)
+                  for name in cls._ARRAYS]
+        return cls(names, *arrays)
+
+    def __len__(self):
+        return len(self.starts)
+
+    ''' Positions i..j-1 of the intervals of a sequence that overlap the
+    region start..end (1-based, inclusive). '''
+
+    def _run(self, name, start, end):
+        try:
+            s = self._index[name]
+        except KeyError:
+            raise KeyError("no sequence named %r in the store" % name) from None
+        lo, hi = self.indptr[s:s + 2].tolist()
+        if start is None:
+            return lo, hi
+        i = lo + int(np.searchsorted(self.ends[lo:hi], start, side="left"))
+        j = lo + int(np.searchsorted(self.starts[lo:hi], end, side="right"))
+        return i, max(i, j)
+
+    ''' Finds the intervals that overlap a region.
+    Arguments:
+        name: sequence name
+        start, end: 1-based inclusive region bounds (None for the whole
+            sequence)
+    Returns:
+        starts, ends: arrays of the overlapping intervals (views into the
+            store, not clipped to the region)
+    '''
+
+    def overlapping(self, name, start=None, end=None):
+        i, j = self._run(name, start, end)
+        return self.starts[i:j], self.ends[i:j]
+
+    ''' Counts the GC-rich bases in a region.
+    Arguments:
+        name: sequence name
+        start, end: 1-based inclusive region bounds (None for the whole
+            sequence)
+    Returns:
+        bases: number of bases of the region inside an interval
+    '''
+
+    def coverage(self, name, start=None, end=None):
+        i, j = self._run(name, start, end)
+        if i == j:
+            return 0
+        bases = int(self.covered[j] - self.covered[i])
+        if start is not None:
+            bases -= max(0, start - int(self.starts[i]))
+            bases -= max(0, int(self.ends[j - 1]) - end)
+        return bases
+
+    ''' Writes every interval as a BED line (0-based, half-open). '''
+
+    def to_bed(self, filename):
+        with open(filename, "wb") as f:
+            for s, name in enumerate(self.names):
+                lo, hi = self.indptr[s:s + 2].tolist()
+                if lo == hi:
+                    continue
+                lines = format_intervals(self.starts[lo:hi] - 1, self.ends[lo:hi])
+                # "a,b\n" -> "name\ta\tb\n"
+                prefix = name.encode() + b"\t"
+                f.write(prefix + lines[:-1].replace(b",", b"\t").replace(b"\n", b"\n" + prefix)
+                        + b"\n")
+
+
+''' Parses a region string.
+Arguments:
+	region: "name:start-end" (1-based, inclusive; commas in the numbers are
+        ignored) or "name" for the whole sequence
+Returns:
+	name, start, end: start and end are None for a whole sequence
+'''
+
+
+def parse_region(region):
+    name, colon, span = region.rpartition(":")
+    if not colon:
+        return region, None, None
+    first, dash, last = span.replace(",", "").partition("-")
+    if not dash or not first.isdigit() or not last.isdigit():
+        return region, None, None
+    start, end = int(first), int(last)
+    if start > end:
+        raise ValueError("region %r ends before it starts" % region)
+    return name, start, end
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Build and query an indexed store of GC-rich intervals.')
+    parser.add_argument('-store', action="store", dest="store",
+                        type=str, required=True)
+    parser.add_argument('-f', action="store", dest="f", nargs='+',
+                        type=str, required=False)
+    parser.add_argument('-q', action="store", dest="q", nargs='+',
+                        type=str, default=[])
+    parser.add_argument('-coverage', action="store_true", dest="coverage")
+    parser.add_argument('-bed', action="store", dest="bed",
+                        type=str, required=False)
+
+    args = parser.parse_args()
+    if args.f:
+        files = [(os.path.splitext(os.path.basename(filename))[0], filename)
+                 for filename in collect_inputs(args.f, INTERVAL_EXTENSIONS)]
+        IntervalStore.from_interval_files(files).save(args.store)
+    store = IntervalStore.load(args.store)
+
+    for region in args.q:
+        name, start, end = parse_region(region)
+        if args.coverage:
+            print("{}\t{}".format(region, store.coverage(name, start, end)))
+        else:
+            starts, ends = store.overlapping(name, start, end)
+            print("# {}: {} intervals".format(region, len(starts)))
+            print(format_intervals(starts, ends).decode(), end="")
+    if args.bed:
+        store.to_bed(args.bed)
+
+
+if __name__ == "__main__":
+    main()
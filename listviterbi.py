@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+'''k-best Viterbi decoding (parallel list Viterbi) for alternative segmentations.
+Arguments:
+    -f: file containing the sequence (fasta file)
+    -mu: the probability of switching states (ignored with -model)
+    -model: (optional) compiled model file written by HMMModel.save
+    -k: (optional) number of paths to keep, default 10
+    -out: file to output the interval sets to
+
+Outputs:
+    File with one block per distinct set of GC-rich intervals, best first: a
+    line "# rank log-probability" followed by one interval a_i,b_i per line
+    as in the single-path scripts.
+
+Every state keeps its k best partial paths instead of one. A step scores all
+K * k ways of extending the survivors into each state and keeps the k best
+with np.argpartition, which is linear in k; the survivors of a state are
+not kept in order, only the final k paths are sorted. The backpointers
+store, per position, state and survivor slot, the index i * k + r of the
+predecessor in the smallest integer type that holds K * k, so memory is
+N * K * k bytes (twice that once K * k exceeds 255) and time per base grows
+linearly with k. The best path is the Viterbi path (up to ties).
+
+Several state paths can give the same GC-rich intervals (when there are more
+than two states, or when only non-rich states differ), so the paths are
+collapsed into distinct interval sets, each with its best log-probability.
+
+Example Usage:
+    python listviterbi.py -f hmm-sequence.fasta -mu 0.01 -k 20 -out alternatives.txt
+'''
+
+import argparse
+import numpy as np
+
+from fasta import read_fasta
+from hmm import HMMModel, gc_content_model
+from intervals import format_intervals, path_intervals
+
+
+''' Outputs the k most likely state paths of an encoded observation.
+Arguments:
+	codes: uint8 array of encoded observations
+	model: compiled HMMModel
+	k: number of paths
+Returns:
+	paths: (k', N) uint8 array of state paths, most likely first; k' < k
+        only if the sequence admits fewer than k paths of non-zero
+        probability
+	log_probs: length k' array of their log-probabilities
+'''
+
+
+def list_viterbi(codes, model, k):
+    N = len(codes)
+    K = model.K
+    if N == 0:
+        raise ValueError("cannot decode an empty sequence")
+    if k < 1:
+        raise ValueError("k must be at least 1")
+    width = K * k
+    dtype = np.uint8 if width <= 1 << 8 else np.uint16 if width <= 1 << 16 else np.uint32
+    backpointer = np.zeros((N, k, K), dtype=dtype)
+
+    # dp[r, j]: score of survivor r of state j; missing survivors are -inf
+    dp = np.full((k, K), -np.inf)
+    dp[0] = model.log_init + model.log_emiss_rows[codes[0]]
+    columns = np.arange(K)[None, :]
+    for t in range(1, N):
+        # candidates[i * k + r, j] = dp[r, i] + log_trans[i, j]
+        candidates = (dp.T[:, :, None] + model.log_trans[:, None, :]).reshape(width, K)
+        if width > k:
+            best = np.argpartition(-candidates, k - 1, axis=0)[:k]
+        else:
+            best = np.broadcast_to(np.arange(width)[:, None], (width, K))
+        backpointer[t] = best
+        dp = candidates[best, columns] + model.log_emiss_rows[codes[t]]
+
+    # the k best (survivor, state) pairs at the end, best first
+    final = dp.reshape(-1)
+    order = np.argsort(-final, kind="stable")[:k]
+    order = order[np.isfinite(final[order])]
+    ranks, states = np.divmod(order, K)
+
+    paths = np.empty((len(order), N), dtype=np.uint8)
+    for t in range(N - 1, 0, -1):
+        paths[:, t] = states
+        previous = backpointer[t, ranks, states].astype(np.int64)
+        states, ranks = np.divmod(previous, k)
+    paths[:, 0] = states
+    return paths, final[order]
+
+
+''' Collapses state paths into their distinct GC-rich interval sets.
+Arguments:
+	paths: (k, N) array of state paths, most likely first
+	log_probs: their log-probabilities
+	rich_state: index of the GC-rich state
+Returns:
+	alternatives: list of (intervals, log-probability) tuples in the order
+        of the first path giving each interval set; intervals use the
+        1-based (i, j) convention of find_intervals
+'''
+
+
+def distinct_interval_sets(paths, log_probs, rich_state=0):
+    seen = set()
+    alternatives = []
+    for path, p in zip(paths, log_probs):
+        starts, ends = path_intervals(path, rich_state)
+        intervals = tuple(zip(starts.tolist(), ends.tolist()))
+        if intervals not in seen:
+            seen.add(intervals)
+            alternatives.append((list(intervals), float(p)))
+    return alternatives
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='List the k most likely GC-rich segmentations of a sequence.')
+    parser.add_argument('-f', action="store", dest="f",
+                        type=str, required=True)
+    parser.add_argument('-mu', action="store", dest="mu",
+                        type=float, required=False)
+    parser.add_argument('-model', action="store", dest="model",
+                        type=str, required=False)
+    parser.add_argument('-k', action="store", dest="k",
+                        type=int, default=10)
+    parser.add_argument('-out', action="store", dest="out",
+                        type=str, required=True)
+
+    args = parser.parse_args()
+    if args.model is None and args.mu is None:
+        parser.error("one of -mu or -model is required")
+    model = HMMModel.load(args.model) if args.model else gc_content_model(args.mu)
+
+    codes = model.encode(read_fasta(args.f))
+    paths, log_probs = list_viterbi(codes, model, args.k)
+    alternatives = distinct_interval_sets(paths, log_probs, model.states.index('h'))
+    with open(args.out, "wb") as f:
+        for rank, (intervals, p) in enumerate(alternatives, 1):
+            f.write(b"# %d %.6f\n" % (rank, p))
+            bounds = np.array(intervals, dtype=np.int64).reshape(-1, 2)
+            f.write(format_intervals(bounds[:, 0], bounds[:, 1]))
+    for rank, (intervals, p) in enumerate(alternatives, 1):
+        print("{}: {} intervals, probability in log scale: {:.2f}".format(
+            rank, len(intervals), p))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-import testing
+import benchmark
 import pandas as pd
 
 
@@ -6,111 +6,65 @@ import numpy as np
 import matplotlib.pyplot as plt
 
 
-def main():
-    # Generate all the data
-    testing.testRunTime()
+# Engines compared in the plots, with their labels and colours
+ENGINES = [
+    ('viterbi', 'Viterbi', 'r'),
+    ('bellman', 'Bellman Ford', 'g'),
+    ('dijkstra', 'Dijkstra', 'b'),
+    ('bidirectional', 'Bidirectional Dijkstra', 'c'),
+]
+SYNTHETIC = benchmark.DEFAULT_INPUTS[:5]
+REAL = benchmark.DEFAULT_INPUTS[5:]
 
-    # Printing the numerical values
-    d = {
-        'Viterbi': testing.viterbiTime,
-        'Bellman': testing.bellmanTime,
-        'Dijkstra': testing.dijkstraTime,
-        'Bidirection Dijkstra': testing.bidijkstraTime
-    }
-    df = pd.DataFrame(data=d)
-    d2 = {
-        'Viterbi': [10 ** x for x in testing.viterbiTime],
-        'Bellman': [10 ** x for x in testing.bellmanTime],
-        'Dijkstra': [10 ** x for x in testing.dijkstraTime],
-        'Bidirection Dijkstra': [10 ** x for x in testing.bidijkstraTime]
-    }
-    df2 = pd.DataFrame(data=d2)
-    d1 = {
-        'Viterbi': testing.viterbiMem,
-        'Bellman': testing.bellmanMem,
-        'Dijkstra': testing.dijkstraMem,
-        'Bidirection Dijkstra': testing.bidijkstraMem
-    }
-    df1 = pd.DataFrame(data=d1)
 
+# Median run time (ms) and peak memory (MB) of every engine on every input
+def collect(report, cases):
+    times = {}
+    memory = {}
+    for engine, label, _ in ENGINES:
+        runs = report['results'][engine]
+        times[label] = [runs[name][str(size)]['median_ms'] for name, _, size in cases]
+        memory[label] = [runs[name][str(size)]['traced_peak_mb'] for name, _, size in cases]
+    return times, memory
 
-    # Creating the bar charts
 
-    # Synthetic DNA Sequence RunTime
-    xaxis = [i for i in range(len(testing.viterbiTime))]
+# Grouped bar chart with one bar per engine and input
+def bar_chart(values, xlabel, ylabel, filename):
+    plt.clf()
     barWidth = 0.2
-    br1 = np.arange(len(testing.viterbiTime))
-    br2 = [x + barWidth for x in br1]
-    br3 = [x + barWidth for x in br2]
-    br4 = [x + barWidth for x in br3]
-    plt.bar(br1, testing.viterbiTime, color ='r', width = barWidth,
-            edgecolor ='grey', label ='Viterbi')
-    plt.bar(br2, testing.bellmanTime, color ='g', width = barWidth,
-            edgecolor ='grey', label ='Bellman Ford')
-    plt.bar(br3, testing.dijkstraTime, color ='b', width = barWidth,
-            edgecolor ='grey', label ='Dijkstra')
-    plt.bar(br4, testing.bidijkstraTime, color='c', width=barWidth,
-            edgecolor='grey', label='Bidirectional Dijkstra')
-    plt.xticks(xaxis)
-    plt.xlabel('DNA sequence', fontweight ='bold', fontsize = 15)
-    plt.ylabel('Time it takes to run in log10 scale (ms)', fontweight='bold', fontsize=15)
+    n = len(next(iter(values.values())))
+    for i, (_, label, colour) in enumerate(ENGINES):
+        plt.bar(np.arange(n) + i * barWidth, values[label], color=colour, width=barWidth,
+                edgecolor='grey', label=label)
+    plt.xticks(range(n))
+    plt.xlabel(xlabel, fontweight='bold', fontsize=15)
+    plt.ylabel(ylabel, fontweight='bold', fontsize=15)
     plt.legend()
-    plt.savefig('Run_Time.png')
+    plt.savefig(filename)
 
-    # Synthetic DNA Sequence Peak Memory Usage
-    plt.clf()
-    plt.bar(br1, testing.viterbiMem, color='r', width=barWidth,
-            edgecolor='grey', label='Viterbi')
-    plt.bar(br2, testing.bellmanMem, color='g', width=barWidth,
-            edgecolor='grey', label='Bellman Ford')
-    plt.bar(br3, testing.dijkstraMem, color='b', width=barWidth,
-            edgecolor='grey', label='Dijkstra')
-    plt.bar(br4, testing.bidijkstraMem, color='c', width=barWidth,
-            edgecolor='grey', label='Bidirectional Dijkstra')
-    plt.xticks(xaxis)
-    plt.xlabel('DNA sequence', fontweight='bold', fontsize=15)
-    plt.ylabel('Peak Memory Usage (MB)', fontweight='bold', fontsize=15)
-    plt.legend()
-    plt.savefig('Memory_Usage.png')
 
-    # Real DNA Sequence RunTime
-    xaxis = [i for i in range(len(testing.realVTime))]
-    barWidth = 0.2
-    br1 = np.arange(len(testing.realVTime))
-    br2 = [x + barWidth for x in br1]
-    br3 = [x + barWidth for x in br2]
-    br4 = [x + barWidth for x in br3]
-    plt.clf()
-    plt.bar(br1, testing.realVTime, color='r', width=barWidth,
-            edgecolor='grey', label = 'Viterbi')
-    plt.bar(br2, testing.realDTime, color='b', width=barWidth,
-            edgecolor='grey', label='Dijktra')
-    plt.bar(br3, testing.realBiDTime, color='c', width=barWidth,
-            edgecolor='grey', label='Bidirectional Dijktra')
-    plt.xticks(xaxis)
-    plt.xlabel('Real DNA sequence', fontweight='bold', fontsize=15)
-    plt.ylabel('Time it takes to run (ms)', fontweight='bold', fontsize=15)
-    plt.legend()
-    plt.savefig('Real_Run_Time.png')
+def main():
+    # Generate all the data
+    synthetic = benchmark.load_cases(SYNTHETIC)
+    real = benchmark.load_cases(REAL)
+    report = benchmark.run_benchmark(synthetic + real, [engine for engine, _, _ in ENGINES],
+                                     memory=True, log=print)
+    times, memory = collect(report, synthetic)
+    realTimes, realMemory = collect(report, real)
 
-    # Real DNA Sequence Peak Memory Usage
-    plt.clf()
-    plt.bar(br1, testing.realVMem, color='r', width=barWidth,
-            edgecolor='grey', label='Viterbi')
-    plt.bar(br2, testing.realDMem, color='b', width=barWidth,
-            edgecolor='grey', label='Dijktra')
-    plt.bar(br3, testing.realBiDMem, color='c', width=barWidth,
-            edgecolor='grey', label='Bidirectional Dijktra')
-    plt.xticks(xaxis)
-    plt.xlabel('Real DNA sequence', fontweight='bold', fontsize=15)
-    plt.ylabel('Peak Memory Usage (MB)', fontweight='bold', fontsize=15)
-    plt.legend()
-    plt.savefig('Real_Memory_Usage.png')
+    # Creating the bar charts
+    logTimes = {label: [np.log10(t) for t in values] for label, values in times.items()}
+    bar_chart(logTimes, 'DNA sequence', 'Time it takes to run in log10 scale (ms)', 'Run_Time.png')
+    bar_chart(memory, 'DNA sequence', 'Peak Memory Usage (MB)', 'Memory_Usage.png')
+    bar_chart(realTimes, 'Real DNA sequence', 'Time it takes to run (ms)', 'Real_Run_Time.png')
+    bar_chart(realMemory, 'Real DNA sequence', 'Peak Memory Usage (MB)', 'Real_Memory_Usage.png')
 
     # Printing out the numerical values
-    print(df)
-    print(df1)
-    print(df2)
+    print(pd.DataFrame(data=logTimes))
+    print(pd.DataFrame(data=memory))
+    print(pd.DataFrame(data=times))
+    print(pd.DataFrame(data=realTimes))
+    print(pd.DataFrame(data=realMemory))
 
 
 if __name__ == "__main__":
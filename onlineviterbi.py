@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+
+'''Streaming Viterbi decoding with survivor-path convergence.
+Arguments:
+    -f: file containing the sequence (fasta file)
+    -mu: the probability of switching states
+    -out: file to output intervals to (1 interval per line)
+
+Outputs:
+    File with list of intervals (a_i, b_i) such that bases a_i to b_i are
+    classified as GC-rich. Intervals are written as soon as they are settled,
+    before the rest of the sequence has been read.
+
+Bases are consumed from a generator instead of one joined string. After each
+block the K survivor paths are traced back from the newest position; once they
+all pass through the same state at position p, every state up to p is final
+(no later base can change it) and is emitted. Only the backpointers after the
+last merge point are kept, so memory stays bounded by the convergence lag
+rather than the sequence length, and the decoded path is exactly the one
+fastviterbi.viterbi_encoded returns for the whole sequence.
+
+Example Usage:
+    python onlineviterbi.py -f hmm-sequence.fasta -mu 0.01 -out viterbi-intervals.txt
+'''
+
+import argparse
+import os
+
+import numpy as np
+
+from fasta import iter_chunks
+from fastviterbi import advance
+from hmm import gc_content_model
+
+
+class OnlineViterbi:
+    ''' Incremental Viterbi decoder.
+    Arguments:
+        model: compiled HMMModel
+        block_size: bases buffered before the recursion is advanced and
+            convergence is checked
+        max_lag: if given, the oldest unsettled position is forced out of the
+            window (following the currently best state) whenever more than
+            max_lag positions are pending; this bounds memory on inputs that
+            never converge, but the output is then no longer exact
+    '''
+
+    def __init__(self, model, block_size=1 << 16, max_lag=None):
+        self.model = model
+        self.block_size = block_size
+        self.max_lag = max_lag
+        self.length = 0  # number of bases consumed
+        self.settled = 0  # number of states already emitted
+        self.log_prob = None  # set by finish()
+        self.finished = False
+        self._dp = None
+        self._window = np.zeros((0, model.K), dtype=np.int8)
+        self._pending = []
+        self._pending_size = 0
+
+    ''' Feeds more bases to the decoder.
+    Arguments:
+        chunk: string, bytes or uint8 array of observed symbols
+    Returns:
+        states: uint8 array of the states newly settled by this chunk (may be
+            empty); they continue directly after the previously returned ones
+    '''
+
+    def push(self, chunk):
+        if self.finished:
+            raise ValueError("the stream has already been finished")
+        self._pending.append(self.model.encode(chunk))
+        self._pending_size += len(self._pending[-1])
+        if self._pending_size < self.block_size:
+            return np.zeros(0, dtype=np.uint8)
+        return self._run_pending()
+
+    ''' Ends the stream and settles every remaining position. It can only be
+    called once (a second call raises ValueError, as does push afterwards).
+    Returns:
+        states: uint8 array of the remaining states, ending with the state of
+            the last base; self.log_prob then holds the Viterbi log-probability
+            (it stays None if the stream had no bases)
+    '''
+
+    def finish(self):
+        if self.finished:
+            raise ValueError("the stream has already been finished")
+        self.finished = True
+        states = [self._run_pending()]
+        if self._dp is not None:
+            final_state = int(np.argmax(self._dp))
+            states.append(self._settle(self.length - 1, final_state))
+            self.log_prob = float(self._dp.max())
+        return np.concatenate(states)
+
+    def _run_pending(self):
+        if not self._pending:
+            return np.zeros(0, dtype=np.uint8)
+        codes = np.concatenate(self._pending)
+        self._pending = []
+        self._pending_size = 0
+
+        block = np.zeros((len(codes), self.model.K), dtype=np.int8)
+        if self._dp is None:
+            self._dp = self.model.log_init + self.model.log_emiss_rows[codes[0]]
+            self._dp = advance(codes, 1, len(codes), self._dp, self.model, block[1:])
+        else:
+            self._dp = advance(codes, 0, len(codes), self._dp, self.model, block)
+        self._window = np.concatenate([self._window, block])
+        self.length += len(codes)
+
+        settled = [self._converged()]
+        if self.max_lag is not None and self.length - self.settled > self.max_lag:
+            final_state = int(np.argmax(self._dp))
+            position, state = self._trace(self.length - 1, final_state,
+                                          self.length - self.max_lag)
+            settled.append(self._settle(position, state))
+        return np.concatenate(settled)
+
+    ''' Traces all K survivors back from the newest position and settles
+    everything up to the position where they merge. '''
+
+    def _converged(self):
+        K = self.model.K
+        flat = memoryview(self._window.reshape(-1).view(np.uint8))
+        survivors = list(range(K))
+        for t in range(self.length - 1, self.settled, -1):
+            row = (t - self.settled) * K
+            survivors = [flat[row + s] for s in survivors]
+            if min(survivors) == max(survivors):
+                return self._settle(t - 1, survivors[0])
+        return np.zeros(0, dtype=np.uint8)
+
+    ''' Follows one survivor from (state, position) back to position stop. '''
+
+    def _trace(self, position, state, stop):
+        K = self.model.K
+        flat = memoryview(self._window.reshape(-1).view(np.uint8))
+        for t in range(position, stop, -1):
+            state = flat[(t - self.settled) * K + state]
+        return stop, state
+
+    ''' Emits the states from the last settled position up to position, given
+    the state at position, and drops their backpointers from the window. '''
+
+    def _settle(self, position, state):
+        K = self.model.K
+        flat = memoryview(self._window.reshape(-1).view(np.uint8))
+        states = np.empty(position + 1 - self.settled, dtype=np.uint8)
+        for t in range(position, self.settled, -1):
+            states[t - self.settled] = state
+            state = flat[(t - self.settled) * K + state]
+        states[0] = state
+
+        self._window = self._window[position + 1 - self.settled:].copy()
+        self.settled = position + 1
+        return states
+
+
+''' Decodes a stream of sequence chunks, yielding settled states as they
+become final.
+Arguments:
+	chunks: iterable of strings/bytes (single bases are fine)
+	model: compiled HMMModel
+	block_size, max_lag: see OnlineViterbi
+Returns:
+	generator of uint8 arrays of consecutive state indices
+'''
+
+
+def decode_stream(chunks, model, block_size=1 << 16, max_lag=None):
+    decoder = OnlineViterbi(model, block_size=block_size, max_lag=max_lag)
+    for chunk in chunks:
+        states = decoder.push(chunk)
+        if len(states):
+            yield states
+    states = decoder.finish()
+    if len(states):
+        yield states
+
+
+''' Turns a stream of state blocks into GC-rich intervals as they close,
+with the same 1-based (i, j) convention as find_intervals.
+Arguments:
+	state_blocks: iterable of uint8 arrays of consecutive state indices
+	rich_state: index of the GC-rich state
+Returns:
+	generator of (i, j) tuples
+'''
+
+
+def stream_intervals(state_blocks, rich_state=0):
+    offset = 0
+    beginning = None
+    for block in state_blocks:
+        if not len(block):
+            continue
+        rich = (np.asarray(block) == rich_state)
+
+        # the first base of the block continues or breaks the open region
+        if rich[0] and beginning is None:
+            beginning = offset + 1
+        elif not rich[0] and beginning is not None:
+            yield (beginning, offset)
+            beginning = None
+
+        for i in np.flatnonzero(rich[1:] != rich[:-1]) + 1:
+            if rich[i]:
+                beginning = offset + int(i) + 1
+            else:
+                yield (beginning, offset + int(i))
+                beginning = None
+        offset += len(block)
+
+    # if the sequence ends while in a G+C-rich region
+    if beginning is not None:
+        yield (beginning, offset)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Parse a sequence into GC-rich and GC-poor regions using streaming Viterbi.')
+    parser.add_argument('-f', action="store", dest="f",
+                        type=str, required=True)
+    parser.add_argument('-mu', action="store", dest="mu",
+                        type=float, required=True)
+    parser.add_argument('-out', action="store", dest="out",
+                        type=str, required=True)
+
+    args = parser.parse_args()
+    fasta_file = args.f
+    mu = args.mu
+    intervals_file = args.out
+
+    model = gc_content_model(mu)
+
+    decoder = OnlineViterbi(model)
+
+    def settled_states():
+        for _, chunk in iter_chunks(fasta_file):
+            yield decoder.push(chunk)
+        yield decoder.finish()
+
+    with open(intervals_file, "w") as f:
+        try:
+            for (start, end) in stream_intervals(settled_states(), model.states.index('h')):
+                f.write("%d,%d\n" % (start, end))
+        except BaseException:
+            # the intervals are written as they settle; do not leave a
+            # partial file
+            f.close()
+            os.remove(intervals_file)
+            raise
+    if decoder.length == 0:
+        print("No bases in {}; wrote no intervals".format(fasta_file))
+    else:
+        print("Viterbi probability in log scale: {:.2f}".format(decoder.log_prob))
+
+
+if __name__ == "__main__":
+    main()
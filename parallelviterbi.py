@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+
+'''Exact parallel Viterbi decoding of a single long sequence.
+Arguments:
+    -f: file containing the sequence (fasta file)
+    -mu: the probability of switching states
+    -out: file to output intervals to (1 interval per line)
+    -p: (optional) number of worker processes, defaults to every core
+
+Outputs:
+    File with list of intervals (a_i, b_i) such that bases a_i to b_i are
+    classified as GC-rich.
+
+Each base acts on the DP vector as a K x K max-plus (tropical) matrix, and
+max-plus products are associative, so the sequence is cut into one chunk per
+worker:
+    1. every worker reduces its chunk to a single K x K matrix, in one pass
+       over the chunk that carries all K rows (one per start state) at once;
+    2. a prefix scan over the chunk matrices gives the exact DP vector entering
+       each chunk;
+    3. every worker reruns the recursion of its chunk from that vector into a
+       shared backpointer table and maps each possible end state of the chunk
+       to the state just before it, so the chunk boundaries of the optimal
+       path follow from K integers per chunk;
+    4. every worker traces its chunk back into the shared path array.
+
+Floating point addition is not associative, so the log-probabilities are
+first rounded to multiples of 2^-b, with b chosen so that no sum along the
+sequence can lose bits. On that grid every addition is exact, and the path is
+identical, bit for bit, to the one fastviterbi.viterbi_encoded returns for the
+same (quantized) model, whatever the number of workers and chunks.
+
+This is a deviation from fastviterbi.viterbi_encoded on the original model:
+the rounding moves each parameter by at most 2^-(b+1) nats, so the path can
+differ from the serial one where two segmentations score within
+2 * N * 2^-b nats of each other (with b around 30 for a chromosome, a few
+millionths of a nat). Either path is then optimal to within that tolerance,
+which the parallel_viterbi stats and the command line report. The reported
+log-probability is re-accumulated along the path with the original model in
+the serial order of operations.
+
+Example Usage:
+    python parallelviterbi.py -f hmm-sequence.fasta -mu 0.01 -out viterbi-intervals.txt -p 8
+'''
+
+import argparse
+import math
+import os
+from multiprocessing import Pool, shared_memory
+
+import numpy as np
+
+from fasta import read_fasta
+from fastviterbi import advance, path_log_prob
+from hmm import HMMModel, gc_content_model
+from intervals import path_intervals, write_intervals
+
+
+''' Rounds the log-probabilities of a model onto a binary fixed-point grid on
+which every sum along a sequence of length N is exact in float64.
+Arguments:
+	model: compiled HMMModel
+	N: length of the sequences that will be decoded
+Returns:
+	quantized: HMMModel whose finite log-probabilities are multiples of 2^-b
+	b: the number of fractional bits that were kept
+'''
+
+
+def quantize_model(model, N):
+    def largest(values):
+        finite = np.abs(values[np.isfinite(values)])
+        return float(finite.max()) if len(finite) else 0.0
+
+    bound = largest(model.log_init) + N * (largest(model.log_trans) + largest(model.log_emiss))
+    bits = min(40, 52 - max(0, math.ceil(math.log2(bound + 1))))
+    if bits < 8:
+        raise ValueError("sequence of %d bases is too long to decode exactly" % N)
+
+    def snap(values):
+        return np.ldexp(np.round(np.ldexp(values, bits)), -bits)
+
+    quantized = HMMModel(model.states, model.alphabet, snap(model.log_trans),
+                         snap(model.log_emiss), snap(model.log_init))
+    return quantized, bits
+
+
+# state shared by the worker processes, set once by _init_worker
+_worker = {}
+
+
+def _init_worker(names, N, model):
+    blocks = [shared_memory.SharedMemory(name=name) for name in names]
+    _worker["blocks"] = blocks
+    _worker["codes"] = np.ndarray((N,), dtype=np.uint8, buffer=blocks[0].buf)
+    _worker["backpointer"] = np.ndarray((N, model.K), dtype=np.int8, buffer=blocks[1].buf)
+    _worker["path"] = np.ndarray((N,), dtype=np.uint8, buffer=blocks[2].buf)
+    _worker["model"] = model
+
+
+''' Reduces positions a..b-1 to the max-plus matrix M with M[i, j] the best
+score from state i at a-1 to state j at b-1. All K start states go through
+the chunk together: row i of M is the DP vector started from state i. '''
+
+
+def _chunk_matrix(chunk):
+    a, b = chunk
+    model = _worker["model"]
+    if model.K == 2:
+        return _two_state_matrix(_worker["codes"], a, b, model)
+
+    K = model.K
+    codes = _worker["codes"]
+    log_trans = model.log_trans
+    emiss_rows = model.log_emiss_rows
+    matrix = np.full((K, K), -np.inf)
+    np.fill_diagonal(matrix, 0.0)
+    scores = np.empty((K, K, K))
+    for t in range(a, b):
+        # scores[i, k, j]: from start state i through k at t-1 to j at t
+        np.add(matrix[:, :, None], log_trans, out=scores)
+        scores.max(axis=1, out=matrix)
+        matrix += emiss_rows[codes[t]]
+    return matrix
+
+
+def _two_state_matrix(codes, a, b, model):
+    (t00, t01), (t10, t11) = model.log_trans.tolist()
+    emiss = model.log_emiss_rows.tolist()
+    # rows of the matrix: (x0, x1) started from state 0, (y0, y1) from state 1
+    x0, x1, y0, y1 = 0.0, -math.inf, -math.inf, 0.0
+    for c in codes[a:b].tobytes():
+        e0, e1 = emiss[c]
+        p, q = x0 + t00, x1 + t10
+        n0 = (q if q > p else p) + e0
+        p, q = x0 + t01, x1 + t11
+        x1 = (q if q > p else p) + e1
+        x0 = n0
+        p, q = y0 + t00, y1 + t10
+        n0 = (q if q > p else p) + e0
+        p, q = y0 + t01, y1 + t11
+        y1 = (q if q > p else p) + e1
+        y0 = n0
+    return np.array([[x0, x1], [y0, y1]])
+
+
+''' Reruns positions a..b-1 from the exact incoming vector into the shared
+backpointer table and returns, for every state at b-1, the state at a-1. '''
+
+
+def _chunk_backpointers(task):
+    a, b, dp = task
+    model = _worker["model"]
+    K = model.K
+    advance(_worker["codes"], a, b, dp, model, _worker["backpointer"][a:b])
+
+    flat = memoryview(_worker["backpointer"].reshape(-1).view(np.uint8))
+    survivors = list(range(K))
+    for t in range(b - 1, a - 1, -1):
+        survivors = [flat[t * K + s] for s in survivors]
+        if min(survivors) == max(survivors):
+            state = survivors[0]
+            for t in range(t - 1, a - 1, -1):
+                state = flat[t * K + state]
+            return [state] * K
+    return survivors
+
+
+''' Traces positions b-1 down to a-1 into the shared path array. '''
+
+
+def _chunk_traceback(task):
+    a, b, state = task
+    K = _worker["model"].K
+    flat = memoryview(_worker["backpointer"].reshape(-1).view(np.uint8))
+    path = _worker["path"]
+    for t in range(b - 1, a - 1, -1):
+        path[t] = state
+        state = flat[t * K + state]
+    path[a - 1] = state
+    return a
+
+
+''' Outputs the Viterbi decoding of an encoded observation using a pool of
+worker processes.
+Arguments:
+	codes: uint8 array of encoded observations
+	model: compiled HMMModel
+	workers: number of processes (default: every core)
+	chunks: number of chunks (default: one per worker)
+	stats: optional dict, filled with the fractional bits kept by
+        quantize_model and the tolerance 2 * N * 2^-bits: the path is the
+        exact Viterbi path of the quantized model, and scores within the
+        tolerance of the best under the original model (it is the path of
+        fastviterbi.viterbi_encoded unless another scores that close)
+Returns:
+	path: uint8 array of most likely state indices at each position
+	p: log-probability of the returned hidden state sequence
+'''
+
+
+def parallel_viterbi(codes, model, workers=None, chunks=None, stats=None):
+    N = len(codes)
+    K = model.K
+    if N == 0:
+        raise ValueError("cannot decode an empty sequence")
+    workers = workers or os.cpu_count()
+    quantized, bits = quantize_model(model, N)
+    if stats is not None:
+        stats['bits'] = bits
+        stats['tolerance'] = math.ldexp(2 * N, -bits)
+
+    n_chunks = max(1, min(chunks or workers, N - 1))
+    bounds = np.linspace(1, N, n_chunks + 1).astype(np.int64)
+    spans = [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+    first = quantized.log_init + quantized.log_emiss_rows[codes[0]]
+
+    blocks = [shared_memory.SharedMemory(create=True, size=max(1, size))
+              for size in (N, N * K, N)]
+    try:
+        np.ndarray((N,), dtype=np.uint8, buffer=blocks[0].buf)[:] = codes
+        path = np.ndarray((N,), dtype=np.uint8, buffer=blocks[2].buf)
+
+        with Pool(processes=workers, initializer=_init_worker,
+                  initargs=([block.name for block in blocks], N, quantized)) as pool:
+            matrices = pool.map(_chunk_matrix, spans, chunksize=1)
+
+            # prefix scan in the max-plus semiring: v <- max_i v[i] + M[i, :]
+            incoming = [first]
+            for matrix in matrices:
+                incoming.append((incoming[-1][:, None] + matrix).max(axis=0))
+            last = incoming.pop()
+
+            tasks = [(a, b, dp) for (a, b), dp in zip(spans, incoming)]
+            state_maps = pool.map(_chunk_backpointers, tasks, chunksize=1)
+
+            # the end state of each chunk follows from the one after it
+            end_states = [0] * len(spans)
+            state = int(np.argmax(last))
+            for c in range(len(spans) - 1, -1, -1):
+                end_states[c] = state
+                state = state_maps[c][state]
+
+            tasks = [(a, b, s) for (a, b), s in zip(spans, end_states)]
+            pool.map(_chunk_traceback, tasks, chunksize=1)
+
+        if not spans:
+            path[0] = int(np.argmax(first))
+        result = path.copy()
+        del path
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    return result, path_log_prob(codes, result, model)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Parse a sequence into GC-rich and GC-poor regions using parallel Viterbi.')
+    parser.add_argument('-f', action="store", dest="f",
+                        type=str, required=True)
+    parser.add_argument('-mu', action="store", dest="mu",
+                        type=float, required=True)
+    parser.add_argument('-out', action="store", dest="out",
+                        type=str, required=True)
+    parser.add_argument('-p', action="store", dest="p",
+                        type=int, required=False)
+
+    args = parser.parse_args()
+    fasta_file = args.f
+    mu = args.mu
+    intervals_file = args.out
+
+    obs_sequence = read_fasta(fasta_file)
+    model = gc_content_model(mu)
+
+    stats = {}
+    path, p = parallel_viterbi(model.encode(obs_sequence), model, workers=args.p, stats=stats)
+    starts, ends = path_intervals(path, model.states.index('h'))
+    write_intervals(intervals_file, starts, ends)
+    print("Viterbi probability in log scale: {:.2f}".format(p))
+    print("Exact for the model rounded to 2^-{} nats; optimal to within {:.2g} nats".format(
+        stats['bits'], stats['tolerance']))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+'''Posterior (forward-backward) decoding with per-base state probabilities.
+Arguments:
+    -f: file containing the sequence (fasta file)
+    -mu: the probability of switching states (ignored with -model)
+    -model: (optional) compiled model file written by HMMModel.save
+    -out: file to output intervals to (1 interval per line)
+    -track: (optional) .npy file to write the per-base posterior probability
+        of the GC-rich state to
+    -dtype: (optional) float16 or float32 (default) for the track
+    -threshold: (optional) posterior probability of the GC-rich state above
+        which a base is called GC-rich, default 0.5
+    -mem: (optional) memory budget in MB; keeps only checkpoints of the
+        forward pass instead of the full forward and backward tables
+
+Outputs:
+    File with list of intervals (a_i, b_i) such that bases a_i to b_i have a
+    posterior probability of being GC-rich of at least the threshold, in the
+    same format as the Viterbi scripts.
+
+The forward and backward vectors are rescaled to sum to one at every
+position (baumwelch.forward_scaled and backward_scaled), so no logarithms
+are needed and nothing underflows. The sequence is processed in segments as
+in fastviterbi.viterbi_checkpointed: the forward pass keeps the vector at
+the start of every segment, and the backward pass recomputes the forward
+vectors of one segment at a time from its checkpoint, so only one segment of
+forward and backward vectors is ever held. Without a budget the whole
+sequence is one segment and nothing is recomputed.
+
+The posteriors are written straight into the output array, which can be a
+memory-mapped .npy file (open_track), so the track of a chromosome never has
+to fit in memory. float16 keeps about three significant digits, enough for a
+confidence track.
+
+Example Usage:
+    python posterior.py -f hmm-sequence.fasta -mu 0.01 -out posterior-intervals.txt -track h.npy
+'''
+
+import argparse
+import math
+import numpy as np
+
+from baumwelch import backward_scaled, forward_scaled
+from fasta import read_fasta
+from fastviterbi import checkpoint_interval
+from hmm import HMMModel, gc_content_model
+from intervals import path_intervals, write_intervals
+
+
+''' Computes the posterior state probabilities of every position.
+Arguments:
+	codes: uint8 array of encoded observations
+	model: compiled HMMModel
+	state: if given, index of the only state whose posterior is kept
+	out: optional array to write into (N x K, or N with state), e.g. a
+        memory-mapped track from open_track
+	dtype: dtype of the returned array when out is not given
+	checkpoint_every: positions per segment (default: the whole sequence)
+	memory_budget: if given instead, bytes available for the checkpoints and
+        one segment of forward and backward vectors; the input and the
+        output array are not counted
+Returns:
+	posteriors: out, or a new array, with posteriors[t, k] = P(state k at t
+        | obs) (posteriors[t] for the single state)
+	log_likelihood: log P(obs)
+'''
+
+
+def forward_backward(codes, model, state=None, out=None, dtype=np.float32,
+                     checkpoint_every=None, memory_budget=None):
+    N = len(codes)
+    K = model.K
+    if N == 0:
+        raise ValueError("cannot decode an empty sequence")
+    if out is None:
+        out = np.empty((N,) if state is not None else (N, K), dtype=dtype)
+    if checkpoint_every is None:
+        if memory_budget is None:
+            checkpoint_every = N
+        else:
+            checkpoint_every = checkpoint_interval(N, K, memory_budget, segment_bytes=24 * K)
+    C = max(1, min(int(checkpoint_every), N))
+
+    # checkpoint k holds the normalized forward vector at position k * C
+    n_checkpoints = (N - 1) // C + 1
+    checkpoints = np.empty((n_checkpoints, K))
+    alphas = np.empty((C + 1, K))
+    betas = np.empty((C + 1, K))
+
+    alpha = np.exp(model.log_init + model.log_emiss_rows[codes[0]])
+    total = alpha.sum()
+    if not total > 0:
+        raise ValueError("observation at position 0 is impossible under the model")
+    log_likelihood = math.log(total)
+    alpha = alpha / total
+    checkpoints[0] = alpha
+    for k in range(1, n_checkpoints):
+        alpha, log_scale = forward_scaled(codes, (k - 1) * C + 1, k * C + 1, alpha, model, alphas)
+        log_likelihood += log_scale
+        checkpoints[k] = alpha
+
+    # the last segment is left in alphas by the final forward step
+    last_start = (n_checkpoints - 1) * C
+    alphas[0] = alpha
+    _, log_scale = forward_scaled(codes, last_start + 1, N, alpha, model, alphas[1:])
+    log_likelihood += log_scale
+
+    beta = np.full(K, 1.0 / K)
+    for k in range(n_checkpoints - 1, -1, -1):
+        a = k * C
+        b = min(a + C, N - 1)
+        if k != n_checkpoints - 1:
+            alphas[0] = checkpoints[k]
+            forward_scaled(codes, a + 1, b + 1, checkpoints[k], model, alphas[1:])
+        backward_scaled(codes, a + 1, b + 1, beta, model, betas)
+        beta = betas[0].copy()
+
+        gamma = alphas[:b - a + 1] * betas[:b - a + 1]
+        gamma /= gamma.sum(axis=1, keepdims=True)
+        if state is not None:
+            gamma = gamma[:, state]
+        # position a belongs to the previous segment, except for a = 0
+        first = 0 if k == 0 else 1
+        out[a + first:b + 1] = gamma[first:]
+    return out, log_likelihood
+
+
+''' Creates a memory-mapped .npy file for a posterior track.
+Arguments:
+	filename: name of the .npy file
+	N: number of positions
+	dtype: float16 or float32
+	K: number of columns, or None for a single state
+Returns:
+	track: writable np.memmap of shape (N,) or (N, K)
+'''
+
+
+def open_track(filename, N, dtype=np.float32, K=None):
+    shape = (N,) if K is None else (N, K)
+    return np.lib.format.open_memmap(filename, mode="w+", dtype=dtype, shape=shape)
+
+
+''' Calls intervals from a posterior track, with the same 1-based (i, j)
+convention as find_intervals.
+Arguments:
+	track: per-base posterior probability of the GC-rich state (array or
+        memory-mapped track)
+	threshold: bases with a posterior of at least this are GC-rich
+	block: positions compared at a time, so a memory-mapped track is read
+        in pieces
+Returns:
+	starts, ends: int64 arrays of interval bounds (see path_intervals)
+'''
+
+
+def posterior_intervals(track, threshold=0.5, block=1 << 20):
+    # one byte per base for the calls, whatever the dtype of the track
+    calls = np.empty(len(track), dtype=np.uint8)
+    for a in range(0, len(track), block):
+        np.greater_equal(track[a:a + block], threshold, out=calls[a:a + block].view(bool))
+    return path_intervals(calls, rich_state=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Parse a sequence into GC-rich and GC-poor regions using posterior decoding.')
+    parser.add_argument('-f', action="store", dest="f",
+                        type=str, required=True)
+    parser.add_argument('-mu', action="store", dest="mu",
+                        type=float, required=False)
+    parser.add_argument('-model', action="store", dest="model",
+                        type=str, required=False)
+    parser.add_argument('-out', action="store", dest="out",
+                        type=str, required=True)
+    parser.add_argument('-track', action="store", dest="track",
+                        type=str, required=False)
+    parser.add_argument('-dtype', action="store", dest="dtype",
+                        choices=["float16", "float32"], default="float32")
+    parser.add_argument('-threshold', action="store", dest="threshold",
+                        type=float, default=0.5)
+    parser.add_argument('-mem', action="store", dest="mem",
+                        type=float, required=False)
+
+    args = parser.parse_args()
+    if args.model is None and args.mu is None:
+        parser.error("one of -mu or -model is required")
+    model = HMMModel.load(args.model) if args.model else gc_content_model(args.mu)
+    memory_budget = None if args.mem is None else int(args.mem * 1024 * 1024)
+
+    codes = model.encode(read_fasta(args.f))
+    out = None
+    if args.track:
+        out = open_track(args.track, len(codes), args.dtype)
+    track, log_likelihood = forward_backward(codes, model, state=model.states.index('h'),
+                                             out=out, dtype=args.dtype,
+                                             memory_budget=memory_budget)
+
+    starts, ends = posterior_intervals(track, args.threshold)
+    write_intervals(args.out, starts, ends)
+    if args.track:
+        track.flush()
+    print("Log-likelihood of the sequence: {:.2f}".format(log_likelihood))
+
+
+if __name__ == "__main__":
+    main()
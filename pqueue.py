@@ -0,0 +1,295 @@
+'''Priority queues for the trellis shortest-path searches.
+
+Every queue has the same small interface, so dijkstra and
+bidirectional_dijkstra can take any of them:
+    push(key, item)   insert item with priority key (float, >= 0)
+    pop()             remove and return the (key, item) pair with smallest key
+    peek()            return that pair without removing it
+    len(queue)        number of stored entries
+and counts its operations in the pushes and pops attributes.
+
+    heap      heapq list with lazy deletion: a node whose distance improves
+              is pushed again and stale copies are skipped when popped
+    indexed   binary heap with a position index and decrease-key, so every
+              node is stored at most once
+    radix     monotone radix heap over the bit patterns of the float keys;
+              for non-negative floats the IEEE 754 bits sort like the values,
+              so no rounding of the costs is needed
+    bucket    Dial-style bucket queue: keys are grouped into buckets of a
+              fixed width and the lowest bucket is kept as a small heap
+
+The radix and bucket queues are monotone: a pushed key must not be smaller
+than the last popped one, which holds for Dijkstra on non-negative weights.
+All queues pop keys in exactly non-decreasing order, so the searches return
+the same distances with any of them; only ties may be broken differently.
+
+heap is the default and the fastest. The other queues do their bookkeeping
+in Python while heapq runs in C, which costs more than their asymptotics
+save at the sizes decoded here. Measured on human_chrome.txt (mu 0.01, best
+of 5 runs):
+
+    queue      dijkstra_encoded   bidirectional_encoded   pops (dijkstra)
+    heap       0.98 s             0.82 s                  155753
+    indexed    0.98 s             1.03 s                  118372
+    radix      1.44 s             1.91 s                  155753
+    bucket     1.14 s             1.31 s                  155753
+
+indexed does save the stale pops (decrease-key instead of duplicates), and
+every queue reports its pushes and pops, so they remain useful to measure
+the searches; they are not a speedup.
+'''
+
+import heapq
+import math
+import struct
+
+
+class HeapQueue:
+    ''' heapq list with lazy deletion (the searches' original queue). '''
+
+    def __init__(self):
+        self._heap = []
+        self.pushes = 0
+        self.pops = 0
+
+    def push(self, key, item):
+        heapq.heappush(self._heap, (key, item))
+        self.pushes += 1
+
+    def pop(self):
+        self.pops += 1
+        return heapq.heappop(self._heap)
+
+    def peek(self):
+        return self._heap[0]
+
+    def __len__(self):
+        return len(self._heap)
+
+
+class IndexedHeap:
+    ''' Binary heap with decrease-key. Pushing an item that is already queued
+    lowers its key instead of adding a duplicate (a larger key is ignored). '''
+
+    def __init__(self):
+        self._keys = []
+        self._items = []
+        self._position = {}  # item -> index in the heap arrays
+        self.pushes = 0
+        self.pops = 0
+
+    def push(self, key, item):
+        i = self._position.get(item)
+        if i is None:
+            i = len(self._keys)
+            self._keys.append(key)
+            self._items.append(item)
+        elif key < self._keys[i]:
+            self._keys[i] = key
+        else:
+            return
+        self.pushes += 1
+        self._sift_up(i, key, item)
+
+    def pop(self):
+        keys = self._keys
+        items = self._items
+        key = keys[0]
+        item = items[0]
+        del self._position[item]
+        last_key = keys.pop()
+        last_item = items.pop()
+        if keys:
+            self._sift_down(0, last_key, last_item)
+        self.pops += 1
+        return key, item
+
+    def peek(self):
+        return self._keys[0], self._items[0]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _sift_up(self, i, key, item):
+        keys = self._keys
+        items = self._items
+        position = self._position
+        while i:
+            parent = (i - 1) >> 1
+            if keys[parent] <= key:
+                break
+            keys[i] = keys[parent]
+            items[i] = items[parent]
+            position[items[i]] = i
+            i = parent
+        keys[i] = key
+        items[i] = item
+        position[item] = i
+
+    def _sift_down(self, i, key, item):
+        keys = self._keys
+        items = self._items
+        position = self._position
+        n = len(keys)
+        while True:
+            child = 2 * i + 1
+            if child >= n:
+                break
+            if child + 1 < n and keys[child + 1] < keys[child]:
+                child += 1
+            if key <= keys[child]:
+                break
+            keys[i] = keys[child]
+            items[i] = items[child]
+            position[items[i]] = i
+            i = child
+        keys[i] = key
+        items[i] = item
+        position[item] = i
+
+
+_DOUBLE = struct.Struct("<d")
+_INT64 = struct.Struct("<q")
+
+
+def _float_bits(key):
+    # + 0.0 turns -0.0 into 0.0, whose bit pattern is the smallest one
+    return _INT64.unpack(_DOUBLE.pack(key + 0.0))[0]
+
+
+class RadixHeap:
+    ''' Monotone radix heap. An entry lives in the bucket given by the highest
+    bit in which its key differs from the last popped key; when the bottom
+    bucket runs dry the next non-empty one is split around its minimum. '''
+
+    def __init__(self):
+        self._buckets = [[] for _ in range(65)]
+        self._last = 0
+        self._size = 0
+        self.pushes = 0
+        self.pops = 0
+
+    def push(self, key, item):
+        bits = _float_bits(key)
+        if bits < self._last:
+            raise ValueError("radix heap keys must not decrease (%r)" % key)
+        self._buckets[(bits ^ self._last).bit_length()].append((bits, key, item))
+        self._size += 1
+        self.pushes += 1
+
+    def pop(self):
+        _, key, item = self._bottom().pop()
+        self._size -= 1
+        self.pops += 1
+        return key, item
+
+    def peek(self):
+        _, key, item = self._bottom()[-1]
+        return key, item
+
+    def _bottom(self):
+        if not self._size:
+            raise IndexError("pop from an empty queue")
+        buckets = self._buckets
+        if not buckets[0]:
+            i = 1
+            while not buckets[i]:
+                i += 1
+            entries = buckets[i]
+            buckets[i] = []
+            last = min(entries)[0]
+            self._last = last
+            for entry in entries:
+                buckets[(entry[0] ^ last).bit_length()].append(entry)
+        return buckets[0]
+
+    def __len__(self):
+        return self._size
+
+
+class BucketQueue:
+    ''' Dial-style bucket queue. Bucket b holds the keys in
+    [b * width, (b + 1) * width) as a heap, so keys come out exactly in order
+    while each heap stays small.
+    Infinite keys (nodes reached only through impossible edges) have no
+    bucket and wait in a heap of their own until nothing else is left.
+    Arguments:
+        width: key range covered by one bucket; about one edge weight is a
+            good choice (smaller widths mean more empty buckets to skip)
+    '''
+
+    def __init__(self, width=1.0):
+        self.width = width
+        self._buckets = {}
+        self._infinite = []
+        self._current = None  # lowest bucket that may hold entries
+        self._size = 0
+        self.pushes = 0
+        self.pops = 0
+
+    def push(self, key, item):
+        if key == math.inf:
+            heapq.heappush(self._infinite, (key, item))
+            self._size += 1
+            self.pushes += 1
+            return
+        b = int(key // self.width)
+        bucket = self._buckets.get(b)
+        if bucket is None:
+            bucket = self._buckets[b] = []
+        heapq.heappush(bucket, (key, item))
+        if self._current is None or b < self._current:
+            self._current = b
+        self._size += 1
+        self.pushes += 1
+
+    def pop(self):
+        bucket = self._lowest()
+        self._size -= 1
+        self.pops += 1
+        return heapq.heappop(bucket)
+
+    def peek(self):
+        return self._lowest()[0]
+
+    def _lowest(self):
+        if not self._size:
+            raise IndexError("pop from an empty queue")
+        if self._size == len(self._infinite):
+            return self._infinite
+        buckets = self._buckets
+        bucket = buckets.get(self._current)
+        while not bucket:
+            buckets.pop(self._current, None)
+            self._current += 1
+            bucket = buckets.get(self._current)
+        return bucket
+
+    def __len__(self):
+        return self._size
+
+
+QUEUES = {
+    'heap': HeapQueue,
+    'indexed': IndexedHeap,
+    'radix': RadixHeap,
+    'bucket': BucketQueue,
+}
+
+
+''' Creates an empty priority queue.
+Arguments:
+	kind: one of the names in QUEUES
+	**options: passed to the queue class (e.g. width for 'bucket')
+Returns:
+	queue: empty queue
+'''
+
+
+def make_queue(kind='heap', **options):
+    try:
+        cls = QUEUES[kind]
+    except KeyError:
+        raise ValueError("unknown priority queue %r (expected one of %s)"
+                         % (kind, ", ".join(sorted(QUEUES))))
+    return cls(**options)
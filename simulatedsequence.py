@@ -1,46 +1,272 @@
-import random
+#!/usr/bin/env python3
 
-currstate = None
-u = 0.005
+'''Simulates sequences from a hidden Markov model, with their hidden states.
+Arguments:
+    -n: (optional) length of every record to simulate, e.g. 1000 or 1e9;
+        default one record of 1000 bases
+    -mu: the probability of switching states (ignored with -model)
+    -model: (optional) compiled model file written by HMMModel.save
+    -seed: (optional) seed of the random generator; the same seed gives the
+        same output
+    -out: fasta file to write the records to
+    -states: (optional) .npy file to write the true hidden states to
+    -name: (optional) prefix of the record names, default simulatedsequence
+    -width: (optional) bases per fasta line, 0 for one line per record;
+        default 60
 
-#make hidden state sequence
+Outputs:
+    Fasta file with one record per length, named <name>1, <name>2, ...; with
+    -states, a uint8 .npy array of the state index of every base (the path
+    format of fastviterbi.py -path), the records one after another.
 
-#initialization
-firststate = random.choices(["h","l"], [0.5,0.5], k=1)
-currstate = firststate[0]
+The state path is drawn one run at a time rather than one base at a time:
+the time spent in state i is geometric with success probability
+1 - P(i -> i), and the state that follows is drawn from the other entries of
+row i of the transition matrix. Runs are drawn in batches; with two states
+the states simply alternate, otherwise one small Python loop per batch picks
+them. The emissions are drawn for a whole chunk of bases at once, one
+searchsorted per state over the cumulative emission probabilities. Chunks
+are streamed to the fasta file (and the memory-mapped state file) as they
+are made, so memory stays at a few chunks whatever the length.
 
-hiddensequence = ""
-#loop
-for i in range(1,1001):
-    hiddensequence += currstate
-    if currstate == "h":
-        newstate = random.choices(["h","l"], [1-u, u], k=1)
-        currstate = newstate[0]
-    
-    if currstate == "l":
-        newstate = random.choices(["l","h"], [1-u, u], k=1)
-        currstate = newstate[0]
+The runs and the emissions of every record come from their own generators,
+spawned from the seed, so the output of a seed does not depend on the chunk
+size, and record r is the same whatever the lengths of the other records.
 
-#now make DNA sequence based on hidden sequence
-dnasequence = ""
-for i in range (0, len(hiddensequence)):
-    if hiddensequence[i] == "h":
-        nucleotide = random.choices(["A","C","G","T"], [0.13,0.37,0.37,0.13], k=1)
-        dnasequence+= nucleotide[0]
+Example Usage:
+    python simulatedsequence.py -n 1000 1000 1000 -mu 0.005 -seed 1 -out simulated.fasta -states simulated-states.npy
+    python simulatedsequence.py -n 1e9 -mu 0.001 -seed 7 -out big.fasta
+'''
 
-    if hiddensequence[i] == "l":
-        nucleotide = random.choices(["A","C","G","T"], [0.32,0.18,0.18,0.32], k=1)
-        dnasequence+= nucleotide[0]
+import argparse
+import numpy as np
 
+from hmm import HMMModel, gc_content_model
+from intervals import open_path
 
-#put in file.
 
-header = ">simulatedsequence5"
+def _normalized(log_probs):
+    probs = np.exp(log_probs)
+    return probs / probs.sum(axis=-1, keepdims=True)
 
-with open('simulatedsequence5.fasta', 'w') as file:
-    # Write the header and sequence to the file
-    file.write(header + '\n')  # Write the header with a newline
-    file.write(dnasequence + '\n')  # Write the sequence with a newline
-        
 
+''' Draws the runs of a state path in batches.
+Arguments:
+	model: compiled HMMModel
+	N: length of the path (runs are capped at N bases)
+	rng: np.random.Generator
+	batch: runs per batch
+Returns:
+	generator of (states, lengths) arrays of consecutive runs, forever
+'''
 
+
+def _runs(model, N, rng, batch=1 << 12):
+    K = model.K
+    trans = _normalized(model.log_trans)
+    init_cum = np.cumsum(_normalized(model.log_init))
+    stay = np.diag(trans).copy()
+    jump = trans.copy()
+    np.fill_diagonal(jump, 0)
+    leaving = jump.sum(axis=1)
+    can_leave = leaving > 0
+    jump_cum = np.cumsum(jump / np.where(can_leave, leaving, 1)[:, None], axis=1)
+    with np.errstate(divide="ignore"):
+        log_stay = np.log(stay)
+
+    state = min(int(np.searchsorted(init_cum, rng.random(), side="right")), K - 1)
+    while True:
+        u_next = rng.random(batch)
+        # 1 - random() is in (0, 1], so its logarithm is finite
+        u_length = 1.0 - rng.random(batch)
+        if K == 2:
+            states = (state + np.arange(batch)) % 2
+            state = (state + batch) % 2
+        else:
+            # following[r][k]: the state after run r if run r is in state k
+            following = np.minimum((u_next[:, None, None] >= jump_cum[None]).sum(axis=2), K - 1)
+            following = following.tolist()
+            states = np.empty(batch, dtype=np.int64)
+            for r in range(batch):
+                states[r] = state
+                state = following[r][state]
+
+        # inverse transform of the geometric distribution on 1, 2, ...
+        with np.errstate(divide="ignore", invalid="ignore"):
+            lengths = np.floor(np.log(u_length) / log_stay[states]) + 1
+        lengths = np.where(can_leave[states], np.minimum(lengths, N), N).astype(np.int64)
+        yield states.astype(np.uint8), lengths
+
+
+''' Simulates a sequence in chunks.
+Arguments:
+	model: compiled HMMModel
+	N: number of bases
+	seed: int, np.random.SeedSequence or None for a random seed
+	chunk_size: bases per chunk
+Returns:
+	generator of (states, codes) uint8 arrays of chunk_size bases (fewer in
+        the last chunk): the hidden state indices and the encoded symbols
+'''
+
+
+def simulate_chunks(model, N, seed=None, chunk_size=1 << 22):
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    run_rng, emission_rng = [np.random.default_rng(s) for s in seed.spawn(2)]
+    emiss_cum = np.cumsum(_normalized(model.log_emiss), axis=1)
+    last_symbol = model.M - 1
+
+    runs = _runs(model, N, run_rng)
+    run_states, run_lengths = next(runs)
+    i = 0
+    left = run_lengths[0]
+    for a in range(0, N, chunk_size):
+        n = min(chunk_size, N - a)
+        pieces = []
+        need = n
+        while need:
+            if i == len(run_states):
+                run_states, run_lengths = next(runs)
+                i = 0
+                left = run_lengths[0]
+            lengths = run_lengths[i:].copy()
+            lengths[0] = left
+            ends = np.cumsum(lengths)
+            j = int(np.searchsorted(ends, need))
+            if j == len(lengths):
+                # the chunk needs more runs than are left in the batch
+                pieces.append((run_states[i:], lengths))
+                need -= int(ends[-1])
+                i = len(run_states)
+                continue
+            take = need - (int(ends[j - 1]) if j else 0)
+            lengths = lengths[:j + 1]
+            left = lengths[j] - take
+            lengths[j] = take
+            pieces.append((run_states[i:i + j + 1], lengths))
+            need = 0
+            i += j
+            if left == 0:
+                i += 1
+                if i < len(run_states):
+                    left = run_lengths[i]
+
+        states = np.concatenate([np.repeat(s, l) for s, l in pieces])
+        u = emission_rng.random(n)
+        codes = np.empty(n, dtype=np.uint8)
+        for k in range(model.K):
+            in_k = states == k
+            codes[in_k] = np.searchsorted(emiss_cum[k], u[in_k], side="right")
+        np.minimum(codes, last_symbol, out=codes)
+        yield states, codes
+
+
+''' Simulates a sequence held in memory.
+Arguments:
+	model: compiled HMMModel
+	N: number of bases
+	seed: int, np.random.SeedSequence or None for a random seed
+Returns:
+	states: uint8 array of the hidden state indices
+	codes: uint8 array of the encoded symbols (as from model.encode)
+'''
+
+
+def simulate(model, N, seed=None):
+    states = np.empty(N, dtype=np.uint8)
+    codes = np.empty(N, dtype=np.uint8)
+    a = 0
+    for chunk_states, chunk_codes in simulate_chunks(model, N, seed):
+        states[a:a + len(chunk_states)] = chunk_states
+        codes[a:a + len(chunk_codes)] = chunk_codes
+        a += len(chunk_codes)
+    return states, codes
+
+
+''' Writes simulated records to a fasta file.
+Arguments:
+	filename: name of the fasta file
+	model: compiled HMMModel
+	lengths: number of bases of every record
+	seed: int or None for a random seed
+	states_file: optional .npy file for the hidden states of all records,
+        one after another
+	name: prefix of the record names
+	width: bases per line, 0 for one line per record
+	chunk_size: bases simulated at a time
+'''
+
+
+def write_simulation(filename, model, lengths, seed=None, states_file=None,
+                     name="simulatedsequence", width=60, chunk_size=1 << 22):
+    symbols = np.frombuffer("".join(model.alphabet).encode("ascii"), dtype=np.uint8)
+    if width:
+        # every chunk but the last of a record is made of whole lines
+        chunk_size = max(width, chunk_size - chunk_size % width)
+    path = open_path(states_file, sum(lengths)) if states_file else None
+    seeds = np.random.SeedSequence(seed).spawn(len(lengths))
+
+    offset = 0
+    with open(filename, "wb") as f:
+        for r, N in enumerate(lengths):
+            f.write(b">%s%d\n" % (name.encode("ascii"), r + 1))
+            for states, codes in simulate_chunks(model, N, seeds[r], chunk_size):
+                text = symbols[codes]
+                if width:
+                    full = len(text) - len(text) % width
+                    lines = np.empty((full // width, width + 1), dtype=np.uint8)
+                    lines[:, :width] = text[:full].reshape(-1, width)
+                    lines[:, width] = ord("\n")
+                    f.write(lines.tobytes())
+                    if full < len(text):
+                        f.write(text[full:].tobytes() + b"\n")
+                else:
+                    f.write(text.tobytes())
+                if path is not None:
+                    path[offset:offset + len(states)] = states
+                offset += len(states)
+            if not width:
+                f.write(b"\n")
+    if path is not None:
+        path.flush()
+
+
+def _length(text):
+    value = float(text)
+    if value != int(value) or value < 0:
+        raise argparse.ArgumentTypeError("%r is not a length" % text)
+    return int(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Simulate sequences and their hidden states from a hidden Markov model.')
+    parser.add_argument('-n', action="store", dest="n", nargs='+',
+                        type=_length, default=[1000])
+    parser.add_argument('-mu', action="store", dest="mu",
+                        type=float, required=False)
+    parser.add_argument('-model', action="store", dest="model",
+                        type=str, required=False)
+    parser.add_argument('-seed', action="store", dest="seed",
+                        type=int, required=False)
+    parser.add_argument('-out', action="store", dest="out",
+                        type=str, required=True)
+    parser.add_argument('-states', action="store", dest="states",
+                        type=str, required=False)
+    parser.add_argument('-name', action="store", dest="name",
+                        type=str, default="simulatedsequence")
+    parser.add_argument('-width', action="store", dest="width",
+                        type=int, default=60)
+
+    args = parser.parse_args()
+    if args.model is None and args.mu is None:
+        parser.error("one of -mu or -model is required")
+    model = HMMModel.load(args.model) if args.model else gc_content_model(args.mu)
+
+    write_simulation(args.out, model, args.n, args.seed, args.states, args.name, args.width)
+    print("Wrote {} record(s), {} bases, to {}".format(len(args.n), sum(args.n), args.out))
+
+
+if __name__ == "__main__":
+    main()
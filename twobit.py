@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+
+'''Compact 2-bit packed sequence store.
+Arguments:
+    -f: fasta file to convert (multi-record is fine)
+    -out: packed file to write
+
+Packs A, C, G and T at four bases per byte (first base in the high bits,
+codes 0-3 in ACGT order, the same order as the decoders' alphabet). Runs of
+N (and any other non-ACGT symbol) and runs of soft-masked lower-case bases
+are kept as side tables of [start, end) intervals, so the original sequence
+can be restored exactly apart from IUPAC ambiguity codes, which come back as
+N.
+
+File layout, all integers little-endian:
+    8 bytes    magic b"CS2BIT01"
+    8 bytes    length of the JSON index
+    JSON index with, per record, its name, length and the byte offsets of
+               its packed bases, N runs and soft-mask runs
+    data       the blocks the index points to, each aligned to 8 bytes
+
+TwoBitFile memory-maps the file and hands out NumPy views of the packed bytes
+and run tables without reading them, so opening a genome is instant and any
+start:end region is unpacked directly from its own bytes.
+TwoBitRecord.encode unpacks straight into the codes of a model, without
+going through the text; the decoders read .2bit files that way through
+fasta.iter_encoded (and as text through fasta.iter_records).
+
+Example Usage:
+    python twobit.py -f human_chrome.txt -out human_chrome.2bit
+'''
+
+import argparse
+import json
+import mmap
+import struct
+
+import numpy as np
+
+from fasta import iter_records
+
+
+MAGIC = b"CS2BIT01"
+_BASES = np.frombuffer(b"ACGT", dtype=np.uint8)
+_SHIFTS = np.array([6, 4, 2, 0], dtype=np.uint8)
+
+
+def _runs(mask):
+    ''' [start, end) intervals of the True stretches of a boolean array. '''
+    edges = np.flatnonzero(np.diff(mask.astype(np.int8), prepend=0, append=0))
+    return edges[0::2].astype(np.int64), edges[1::2].astype(np.int64)
+
+
+''' Packs one sequence.
+Arguments:
+	sequence: bytes of the sequence, as read from a fasta file
+Returns:
+	packed: uint8 array with four bases per byte
+	n_runs: (starts, ends) of the non-ACGT runs
+	mask_runs: (starts, ends) of the lower-case runs
+'''
+
+
+def pack_sequence(sequence):
+    raw = np.frombuffer(sequence, dtype=np.uint8)
+    lower = (raw >= ord('a')) & (raw <= ord('z'))
+    upper = np.where(lower, raw - 32, raw).astype(np.uint8)
+
+    lookup = np.full(256, 255, dtype=np.uint8)
+    lookup[_BASES] = np.arange(4, dtype=np.uint8)
+    codes = lookup[upper]
+    unknown = codes == 255
+    codes[unknown] = 0
+
+    padded = np.zeros((len(codes) + 3) // 4 * 4, dtype=np.uint8)
+    padded[:len(codes)] = codes
+    packed = (padded.reshape(-1, 4) << _SHIFTS).sum(axis=1, dtype=np.uint8)
+    return packed, _runs(unknown), _runs(lower)
+
+
+''' Writes records into a packed file.
+Arguments:
+	filename: file to write
+	records: iterable of (name, sequence bytes) tuples
+'''
+
+
+def write_twobit(filename, records):
+    index = []
+    blocks = []
+    offset = 0
+
+    def add(array):
+        nonlocal offset
+        data = np.ascontiguousarray(array).tobytes()
+        blocks.append(data + b"\0" * (-len(data) % 8))
+        start = offset
+        offset += len(blocks[-1])
+        return start
+
+    for name, sequence in records:
+        packed, (n_starts, n_ends), (m_starts, m_ends) = pack_sequence(sequence)
+        index.append({
+            "name": name,
+            "length": len(sequence),
+            "packed": add(packed),
+            "n_runs": len(n_starts),
+            "n_starts": add(n_starts),
+            "n_ends": add(n_ends),
+            "mask_runs": len(m_starts),
+            "mask_starts": add(m_starts),
+            "mask_ends": add(m_ends),
+        })
+
+    header = json.dumps(index).encode("utf-8")
+    header += b" " * (-(len(header) + 16) % 8)
+    with open(filename, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        for data in blocks:
+            f.write(data)
+
+
+''' Converts a fasta file into a packed file. '''
+
+
+def fasta_to_twobit(fasta_file, filename):
+    write_twobit(filename, iter_records(fasta_file, upper=False))
+
+
+class TwoBitRecord:
+    ''' One memory-mapped sequence of a TwoBitFile. '''
+
+    def __init__(self, data, base, entry):
+        self.name = entry["name"]
+        self.length = entry["length"]
+
+        def view(key, dtype, count):
+            return np.frombuffer(data, dtype=dtype, count=count, offset=base + entry[key])
+
+        self.packed = view("packed", np.uint8, (self.length + 3) // 4)
+        self.n_starts = view("n_starts", np.int64, entry["n_runs"])
+        self.n_ends = view("n_ends", np.int64, entry["n_runs"])
+        self.mask_starts = view("mask_starts", np.int64, entry["mask_runs"])
+        self.mask_ends = view("mask_ends", np.int64, entry["mask_runs"])
+
+    def __len__(self):
+        return self.length
+
+    ''' Unpacks a region into ACGT codes 0-3 (N positions come back as 0;
+    see runs() to find them, or encode() for codes a decoder can take).
+    Arguments:
+        start, end: 0-based half-open region (defaults to the whole record)
+    Returns:
+        codes: uint8 array of length end - start
+    '''
+
+    def codes(self, start=0, end=None):
+        end = self.length if end is None else min(end, self.length)
+        start = max(0, start)
+        if end <= start:
+            return np.zeros(0, dtype=np.uint8)
+        first = start // 4
+        region = self.packed[first:(end + 3) // 4]
+        codes = (region[:, None] >> _SHIFTS) & 3
+        skip = start - 4 * first
+        return codes.reshape(-1)[skip:skip + end - start]
+
+    ''' Unpacks a region into the codes of a model's alphabet, as
+    model.encode would encode the upper-case text of the region.
+    Arguments:
+        model: compiled HMMModel
+        start, end: 0-based half-open region (defaults to the whole record)
+    Returns:
+        codes: uint8 array of length end - start
+    Raises ValueError, as model.encode does, if the region has a symbol
+    (an N run, or a base) that is not in the alphabet.
+    '''
+
+    def encode(self, model, start=0, end=None):
+        end = self.length if end is None else min(end, self.length)
+        start = max(0, start)
+        translate = np.array([model.alphabet.index(chr(base)) if chr(base) in model.alphabet
+                              else 255 for base in _BASES], dtype=np.uint8)
+        raw = self.codes(start, end)
+        codes = translate[raw]
+
+        n_starts, _ = n_runs = self.runs("n", start, end)
+        if len(n_starts):
+            if 'N' not in model.alphabet:
+                raise ValueError("symbol 'N' at position %d is not in the alphabet %s"
+                                 % (start + n_starts[0], model.alphabet))
+            for a, b in zip(*n_runs):
+                codes[a:b] = model.alphabet.index('N')
+        bad = np.flatnonzero(codes == 255)
+        if len(bad):
+            raise ValueError("symbol %r at position %d is not in the alphabet %s"
+                             % (chr(_BASES[raw[bad[0]]]), start + bad[0], model.alphabet))
+        return codes
+
+    ''' Clips a run table to a region, in region coordinates.
+    Arguments:
+        kind: "n" for the non-ACGT runs or "mask" for soft-masked runs
+        start, end: 0-based half-open region
+    Returns:
+        starts, ends: int64 arrays of the overlapping runs
+    '''
+
+    def runs(self, kind, start=0, end=None):
+        end = self.length if end is None else min(end, self.length)
+        starts = self.n_starts if kind == "n" else self.mask_starts
+        ends = self.n_ends if kind == "n" else self.mask_ends
+        lo = np.searchsorted(ends, start, side="right")
+        hi = np.searchsorted(starts, end, side="left")
+        return (np.clip(starts[lo:hi], start, end) - start,
+                np.clip(ends[lo:hi], start, end) - start)
+
+    ''' Restores a region as text.
+    Arguments:
+        start, end: 0-based half-open region
+        mask: keep soft-masked bases in lower case
+    Returns:
+        sequence: bytes of length end - start
+    '''
+
+    def sequence(self, start=0, end=None, mask=True):
+        end = self.length if end is None else min(end, self.length)
+        text = _BASES[self.codes(start, end)]
+        for a, b in zip(*self.runs("n", start, end)):
+            text[a:b] = ord('N')
+        if mask:
+            for a, b in zip(*self.runs("mask", start, end)):
+                text[a:b] += 32
+        return text.tobytes()
+
+
+class TwoBitFile:
+    ''' Memory-mapped packed file; records are looked up by name. '''
+
+    def __init__(self, filename):
+        with open(filename, "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._data[:8] != MAGIC:
+            raise ValueError("%s is not a packed sequence file" % filename)
+        (size,) = struct.unpack("<Q", self._data[8:16])
+        index = json.loads(self._data[16:16 + size].decode("utf-8"))
+        base = 16 + size
+        self.records = {entry["name"]: TwoBitRecord(self._data, base, entry)
+                        for entry in index}
+        self.names = [entry["name"] for entry in index]
+
+    def __getitem__(self, name):
+        return self.records[name]
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Pack a fasta file at 2 bits per base.')
+    parser.add_argument('-f', action="store", dest="f",
+                        type=str, required=True)
+    parser.add_argument('-out', action="store", dest="out",
+                        type=str, required=True)
+
+    args = parser.parse_args()
+    fasta_to_twobit(args.f, args.out)
+    store = TwoBitFile(args.out)
+    for name in store:
+        print("{}: {} bases".format(name, len(store[name])))
+
+
+if __name__ == "__main__":
+    main()
@@ -17,21 +17,9 @@ Example Usage:
 import argparse
 import numpy as np
 
-
-'''Reads the fasta file and outputs the sequence to analyze.
-Arguments:
-	filename: name of the fasta file
-Returns:
-	s: string with relevant sequence
-'''
-
-
-def read_fasta(filename):
-    with open(filename, "r") as f:
-        s = ""
-        for l in f.readlines()[1:]:
-            s += l.strip()
-    return s
+from fasta import read_fasta
+from hmm import HMMModel, gc_content_model
+from intervals import path_intervals, write_intervals
 
 
 ''' Outputs the Viterbi decoding of a given observation.
@@ -48,26 +36,51 @@ Returns:
 
 
 def viterbi(obs, trans_probs, emiss_probs, init_probs):
+    # compile the dictionaries once; states and symbols become array indices
+    model = HMMModel.from_dicts(trans_probs, emiss_probs, init_probs)
+    path, p = viterbi_encoded(model.encode(obs), model)
+    return model.state_names(path), p
+
+
+''' Outputs the Viterbi decoding of an encoded observation.
+Arguments:
+	codes: uint8 array of encoded observations
+	model: compiled HMMModel
+Returns:
+	path: uint8 array of most likely state indices at each position
+	p: log-probability of the returned hidden state sequence
+'''
+
+
+def viterbi_encoded(codes, model):
+    obs = codes.tolist()
     N = len(obs)  # length of the observed sequence
-    states = ['h', 'l']  # hidden states
+    if N == 0:
+        raise ValueError("cannot decode an empty sequence")
+    states = range(model.K)  # hidden states
+    log_init = model.log_init.tolist()
+    log_trans = model.log_trans.tolist()
+    emiss_rows = model.log_emiss_rows.tolist()
 
     # First, we initialize DP tables for log-probabilities and backtracking pointers
-    dp = {state: [-np.inf] * len(obs) for state in states}
-    backpointer = {state: [None] * len(obs) for state in states}
+    dp = [[-np.inf] * N for state in states]
+    backpointer = [[None] * N for state in states]
 
     # Next, we initialize base cases (t = 0)
     for state in states:
-        dp[state][0] = init_probs[state] + emiss_probs[state][obs[0]]
+        dp[state][0] = log_init[state] + emiss_rows[obs[0]][state]
 
     # Then, we fill the table by iterating through the sequence
-    for t in range(1, len(obs)):
+    for t in range(1, N):
+        emiss = emiss_rows[obs[t]]
         for current_state in states:
             max_prob = -np.inf
-            best_prev_state = None
+            # state 0 stands in when every transition scores -inf
+            best_prev_state = 0
 
             # check the probabilities of transitioning
             for prev_state in states:
-                prob = dp[prev_state][t-1] + trans_probs[prev_state][current_state] + emiss_probs[current_state][obs[t]]
+                prob = dp[prev_state][t-1] + log_trans[prev_state][current_state] + emiss[current_state]
                 if prob > max_prob:
                     max_prob = prob
                     best_prev_state = prev_state
@@ -77,18 +90,18 @@ def viterbi(obs, trans_probs, emiss_probs, init_probs):
             backpointer[current_state][t] = best_prev_state
 
     # finally, backtrack to get the most likely hidden state sequence
-    final_state = max(states, key=lambda state: dp[state][len(obs)-1])
+    final_state = max(states, key=lambda state: dp[state][N-1])
     most_likely_sequence = [final_state]
 
-    for t in range(len(obs)-1, 0, -1):
+    for t in range(N-1, 0, -1):
         final_state = backpointer[final_state][t]
         most_likely_sequence.append(final_state)
 
     most_likely_sequence.reverse()
 
     # return the most likely sequence and the final log-probability
-    final_log_prob = max(dp['h'][-1], dp['l'][-1])
-    return most_likely_sequence, final_log_prob
+    final_log_prob = max(dp[state][-1] for state in states)
+    return np.array(most_likely_sequence, dtype=np.uint8), final_log_prob
 
 
 ''' Returns a list of non-overlapping intervals describing the GC rich regions.
@@ -101,26 +114,12 @@ Returns:
 
 
 def find_intervals(sequence):
-    intervals = []
-    in_gc_rich_region = False
-    beginning = None
-    N = len(sequence)
-
-    for i, state in enumerate(sequence):
-        if state == 'h':  # rich state
-            if not in_gc_rich_region:
-                beginning = i + 1  # start of the region (1-based index)
-                in_gc_rich_region = True
-        else:  # poor state
-            if in_gc_rich_region:
-                intervals.append((beginning, i))  # end  current region
-                in_gc_rich_region = False
-
-    # if the sequence ends while in a G+C-rich region
-    if in_gc_rich_region:
-        intervals.append((beginning, N))
-
-    return intervals
+    # mark the rich positions once, then take the change points with
+    # path_intervals instead of walking the states one at a time
+    rich = np.fromiter((state == 'h' for state in sequence), dtype=np.uint8,
+                       count=len(sequence))
+    starts, ends = path_intervals(rich, rich_state=1)
+    return list(zip(starts.tolist(), ends.tolist()))
 
 
 def main():
@@ -139,22 +138,10 @@ def main():
     intervals_file = args.out
 
     obs_sequence = read_fasta(fasta_file)
-    transition_probabilities = {
-        'h': {'h': np.log(1 - mu), 'l': np.log(mu)},
-        'l': {'h': np.log(mu), 'l': np.log(1 - mu)}
-    }
-    emission_probabilities = {
-        'h': {'A': np.log(0.13), 'C': np.log(0.37), 'G': np.log(0.37), 'T': np.log(0.13)},
-        'l': {'A': np.log(0.32), 'C': np.log(0.18), 'G': np.log(0.18), 'T': np.log(0.32)}
-    }
-    initial_probabilities = {'h': np.log(0.5), 'l': np.log(0.5)}
-    sequence, p = viterbi(obs_sequence, transition_probabilities,
-                          emission_probabilities, initial_probabilities)
-    intervals = find_intervals(sequence)
-    with open(intervals_file, "w") as f:
-        f.write("\n".join([("%d,%d" % (start, end))
-                for (start, end) in intervals]))
-        f.write("\n")
+    model = gc_content_model(mu)
+    path, p = viterbi_encoded(model.encode(obs_sequence), model)
+    starts, ends = path_intervals(path, model.states.index('h'))
+    write_intervals(intervals_file, starts, ends)
     print("Viterbi probability in log scale: {:.2f}".format(p))
 
 